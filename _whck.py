@@ -9,47 +9,53 @@ from starwhacker._board import board
 
 import time
 
-print('Now whacking!')
+# Everything runs under the main guard, so worker processes (see makeGalaxy) can import this script without running it again
 
-print('Adding stars to sky')
+def main():
 
-start=time.time()
+	print('Now whacking!')
 
-s=sky().addStarsFromJson('stars.14.json').addConstellationsFromJSON('constellations.lines.json').makeGrid(10).makeGalaxy('GAIA_pixMod.png', 2)
+	print('Adding stars to sky')
 
-s.vitalStatistics()
-stop=time.time()
-print('{0:0.4f} seconds elapsed'.format(stop-start))
+	start=time.time()
 
-print('Filtering the sky, and interpolating lines')
+	s=sky().addStarsFromJson('stars.6.json').addConstellationsFromJSON('constellations.lines.json').makeGrid(10).makeGalaxy('TychoSkymapII.t4_04096x02048.jpg', 2)
 
-start=time.time()
-s.filterAndInterpolate('scorpio', 1.0)
-s.vitalStatistics()
-stop=time.time()
-print('{0:0.4f} seconds elapsed'.format(stop-start))
+	s.vitalStatistics()
+	stop=time.time()
+	print('{0:0.4f} seconds elapsed'.format(stop-start))
 
-print('Stereo-projecting')
+	print('Filtering the sky, and interpolating lines')
 
-start=time.time()
-s.stereoProject()
-s.vitalStatistics()
-stop=time.time()
-print('{0:0.4f} seconds elapsed'.format(stop-start))
+	start=time.time()
+	s.filterAndInterpolate('scorpio', 1.0)
+	s.vitalStatistics()
+	stop=time.time()
+	print('{0:0.4f} seconds elapsed'.format(stop-start))
 
-print('Normalising')
+	print('Stereo-projecting')
 
-start=time.time()
-s.normalise()
-s.vitalStatistics()
-stop=time.time()
-print('{0:0.4f} seconds elapsed'.format(stop-start))
+	start=time.time()
+	s.stereoProject()
+	s.vitalStatistics()
+	stop=time.time()
+	print('{0:0.4f} seconds elapsed'.format(stop-start))
 
-d=drawing(s,200,targetConstellation='Sco') # Major Dimension of 200mm, target constellation is scorpio
-d.render()
+	print('Normalising')
 
-b=board(s,200,targetConstellation='Sco') # Major dimension of 200mm, target constellation is scorpio
-b.render()
+	start=time.time()
+	s.normalise()
+	s.vitalStatistics()
+	stop=time.time()
+	print('{0:0.4f} seconds elapsed'.format(stop-start))
 
-print('Whacked!')
+	d=drawing(s,200,targetConstellation='Sco') # Major Dimension of 200mm, target constellation is scorpio
+	d.render()
 
+	b=board(s,200,targetConstellation='Sco') # Major dimension of 200mm, target constellation is scorpio
+	b.render()
+
+	print('Whacked!')
+
+if __name__ == '__main__':
+	main()
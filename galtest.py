@@ -7,5 +7,6 @@ import datetime
 
 from starwhacker._galactic import *
 
-g=galaxy('GAIA_pixMod.png', 4)
+if __name__ == '__main__':
+	g=galaxy('TychoSkymapII.t4_04096x02048.jpg', 4)
 
@@ -0,0 +1,68 @@
+# memtest.py
+
+# Reports how much memory a star catalogue takes when held as dict-based objects (as before), as slotted objects, and as a starTable.
+# Usage: python memtest.py [catalogue], e.g. python memtest.py stars.6.json (the default, which is bundled in data/)
+
+import os
+import sys
+import tracemalloc
+
+from starwhacker._stars import star, starTable
+from starwhacker._catalog import readStarColumns
+
+class dictStar():
+	'''The star as it used to be: a plain class with a per-instance __dict__, for comparison'''
+
+	def __init__(self, ID, name, rightAscension, declination, magnitude, blueVioletIndex, designation, constellation):
+
+		self.RA=rightAscension
+		self.dec=declination
+		self.ID=ID
+		self.name=name
+		self.mag=magnitude
+		self.BV=blueVioletIndex
+		self.desig=designation
+		self.con=constellation
+
+def measure(build):
+	'''
+	Returns [result, bytes allocated and still held] for build()
+	'''
+
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	result = build()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+
+	return [result, sum(stat.size_diff for stat in after.compare_to(before, 'filename'))]
+
+def main():
+
+	catalogue = sys.argv[1] if len(sys.argv)>1 else 'stars.6.json'
+
+	print('Reading {}'.format(catalogue))
+
+	columns = readStarColumns(os.path.join(os.path.dirname(os.path.abspath(__file__)),'data',catalogue))
+	count = len(columns['RA'])
+
+	def getRows():
+		'''
+		Returns fresh Python values for every row, so each measurement includes the strings and floats its objects hold
+		'''
+
+		return zip(*[columns[key].tolist() for key in ('ID', 'name', 'RA', 'dec', 'mag', 'BV', 'desig', 'con')])
+
+	[dictStars, dictBytes] = measure(lambda: [dictStar(*row) for row in getRows()])
+	del dictStars
+	[slotStars, slotBytes] = measure(lambda: [star(*row) for row in getRows()])
+	del slotStars
+	[table, tableBytes] = measure(lambda: starTable(*[list(column) for column in zip(*getRows())]))
+
+	print('\n{} stars\n'.format(count))
+	print('Dict-based objects\t{0:10.2f} MB\t{1:6.0f} bytes/star'.format(dictBytes/1e6, dictBytes/count))
+	print('Slotted objects\t\t{0:10.2f} MB\t{1:6.0f} bytes/star\t({2:0.0%} of before)'.format(slotBytes/1e6, slotBytes/count, slotBytes/dictBytes))
+	print('starTable columns\t{0:10.2f} MB\t{1:6.0f} bytes/star\t({2:0.0%} of before)'.format(tableBytes/1e6, tableBytes/count, tableBytes/dictBytes))
+
+if __name__ == '__main__':
+	main()
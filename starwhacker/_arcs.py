@@ -0,0 +1,118 @@
+# _arcs.py
+
+# Finds the runs of a polyline's vertices which lie on one circle or one straight line, so each run can be drawn as a single arc or line.
+# Circles on the sky stay circles under the stereographic projection, so great and small circle paths come out as exact arcs.
+
+# imports
+
+import numpy as np
+
+def getCircle(x1, y1, x2, y2, x3, y3):
+	'''
+	Returns [centreX, centreY, radius] of the circle through three points, or None if they are (all but) in a line.
+	'''
+
+	d = 2*(x1*(y2-y3) + x2*(y3-y1) + x3*(y1-y2))
+	scale = max(abs(x1-x3), abs(y1-y3), abs(x1-x2), abs(y1-y2))**2
+
+	if abs(d) <= 1e-12*scale:
+		return None
+
+	[s1, s2, s3] = [x1*x1 + y1*y1, x2*x2 + y2*y2, x3*x3 + y3*y3]
+	centreX = (s1*(y2-y3) + s2*(y3-y1) + s3*(y1-y2))/d
+	centreY = (s1*(x3-x2) + s2*(x1-x3) + s3*(x2-x1))/d
+
+	return [centreX, centreY, np.hypot(x1-centreX, y1-centreY)]
+
+def fitRun(xs, ys, tolerance):
+	'''
+	Tests whether the points (xs, ys) all lie, in order, on one arc or line through the first and last of them, to within tolerance.
+
+	Returns [centreX, centreY, angle] for an arc, where angle is the sweep from the first point to the last in degrees,
+	[nan, nan, 0.0] for a straight line, or None if they don't fit either.
+	'''
+
+	if len(xs) == 2:
+		return [np.nan, np.nan, 0.0]
+
+	middle = len(xs)//2
+	circle = getCircle(xs[0], ys[0], xs[middle], ys[middle], xs[-1], ys[-1])
+
+	if circle is None:
+
+		# A line: every point must be close to the chord, and progress along it
+
+		[dx, dy] = [xs[-1]-xs[0], ys[-1]-ys[0]]
+		length = np.hypot(dx, dy)
+		if length == 0:
+			return None
+
+		along = ((xs-xs[0])*dx + (ys-ys[0])*dy)/length
+		across = ((xs-xs[0])*dy - (ys-ys[0])*dx)/length
+
+		if np.all(np.abs(across) <= tolerance) and np.all(np.diff(along) > 0):
+			return [np.nan, np.nan, 0.0]
+		return None
+
+	[centreX, centreY, radius] = circle
+
+	if np.any(np.abs(np.hypot(xs-centreX, ys-centreY) - radius) > tolerance):
+		return None
+
+	# The points must go round the circle one way, less than a full turn
+
+	turns = np.diff(np.unwrap(np.arctan2(ys-centreY, xs-centreX)))
+	angle = np.degrees(turns.sum())
+
+	if not (np.all(turns > 0) or np.all(turns < 0)) or abs(angle) >= 360:
+		return None
+
+	return [centreX, centreY, angle]
+
+def fitArcs(xs, ys, offsets, tolerance):
+	'''
+	Splits every member of a ragged buffer (see multiPolyline), with vertices (xs, ys), into runs that each fit one arc or line (see fitRun).
+	From each vertex in turn the rest of the member is tried whole, and failing that a long run is found by bisecting on its length.
+
+	Whether a run fits isn't strictly monotone in its length (the circle tried passes through its first, middle and last vertices,
+	so it moves as the run grows), so bisection may settle on a shorter run than the longest that fits, and a few more runs than needed.
+	Every run kept has been checked by fitRun though, so every vertex lies within tolerance of its run's arc or line either way.
+
+	Returns [starts, ends, centreXs, centreYs, angles], one entry per run: the indices of its first and last vertices,
+	and its arc's centre and sweep in degrees, with nan centres for straight runs.
+	'''
+
+	runs = []
+
+	for first, last in zip(offsets[:-1].tolist(), (offsets[1:]-1).tolist()):
+
+		start = first
+		while start < last:
+
+			# Try the rest of the member, then home in on a long run that fits. Only runs which have been checked are kept
+
+			fit = fitRun(xs[start:last+1], ys[start:last+1], tolerance)
+			if fit is not None:
+				runs.append([start, last] + fit)
+				break
+
+			[fitting, failing] = [start+1, last]
+			fit = fitRun(xs[start:start+2], ys[start:start+2], tolerance)
+
+			while failing - fitting > 1:
+				trial = (fitting + failing)//2
+				trialFit = fitRun(xs[start:trial+1], ys[start:trial+1], tolerance)
+				if trialFit is None:
+					failing = trial
+				else:
+					[fitting, fit] = [trial, trialFit]
+
+			runs.append([start, fitting] + fit)
+			start = fitting
+
+	if not runs:
+		return [np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0), np.zeros(0)]
+
+	[starts, ends, centreXs, centreYs, angles] = zip(*runs)
+
+	return [np.array(starts), np.array(ends), np.array(centreXs), np.array(centreYs), np.array(angles)]
@@ -6,17 +6,71 @@
 
 import os
 import datetime
+import numpy as np
 
-from starwhacker._tools import makeRandomString, makeInterpolator, getStarSize
-from starwhacker._kicadtemplates import templates 
+from starwhacker._tools import makeRandomString, makeInterpolator, toNanometres, formatNanometres
+from starwhacker._arcs import fitArcs
+from starwhacker._drills import planDrills
+from starwhacker._starlayout import getStarLayout
+from starwhacker._kicadtemplates import templates, formatters
+
+# The size of the buffer boards are written through, in bytes
+
+writeBufferSize = 1 << 20
+
+def getDistinctRuns(x1s, y1s, x2s, y2s, centreXs=None, centreYs=None):
+	'''
+	Returns a boolean array picking out the runs (lines from (x1s, y1s) to (x2s, y2s), or arcs about (centreXs, centreYs)) worth drawing:
+	the first of any that are the same either way round, and none which start and end at the same point.
+
+	Meant for integer coordinates, where equal really means equal.
+	'''
+
+	# Put each run's lesser end first, so a run and its reverse look the same
+
+	flip = (x1s > x2s) | ((x1s == x2s) & (y1s > y2s))
+	runs = [np.where(flip, x2s, x1s), np.where(flip, y2s, y1s), np.where(flip, x1s, x2s), np.where(flip, y1s, y2s)]
+	if centreXs is not None:
+		runs += [centreXs, centreYs]
+
+	keep = np.zeros(len(x1s), dtype=bool)
+	keep[np.unique(np.column_stack(runs), axis=0, return_index=True)[1]] = True
+
+	return keep & ((x1s != x2s) | (y1s != y2s))
 
 class board():
+	'''
+	A class which writes a sky to a KiCad board file of majorDim mm.
+
+	With arcs, every run of a line's vertices lying on one circle (or one straight line) to within arcTolerance mm is written
+	as a single arc (or line), rather than a chain of segments. Great and small circles stay circles under the stereographic projection,
+	so constellation lines, grids and boundaries refined along them shrink to a primitive or two each.
+	Arcs are written as graphic arcs, since this board version has no arc tracks.
+
+	With fixedPoint, every coordinate and size is put onto whole nanometres first (as KiCad holds them) and written with six decimals,
+	and lines which come out repeated or of zero length are left out.
 
-	def __init__(self, fromSky, majorDim, targetConstellation='XXX'):
+	Star pads and drills are laid out as for the fabrication files (see getStarLayout), sized in integers in every mode.
+
+	With planDrills, through hole stars are written a drill size at a time, each in a short tour (see planDrills), so the drill files pcbnew
+	makes from the board follow it. Surface stars follow in catalogue order.
+
+	With a clearance (in mm), star pads which overlap or come closer than it are found and resolved before they're written,
+	by clearancePolicy: 'drop', 'merge' or 'shrink' (see resolveClearance).
+	'''
+
+	def __init__(self, fromSky, majorDim, targetConstellation='XXX', arcs=False, arcTolerance=0.001, fixedPoint=False, planDrills=False,
+		clearance=None, clearancePolicy='drop'):
 
 		self.sky = fromSky
 		self.majorDim = majorDim
 		self.targetConstellation=targetConstellation
+		self.arcs=arcs
+		self.arcTolerance=arcTolerance
+		self.fixedPoint=fixedPoint
+		self.planDrills=planDrills
+		self.clearance=clearance
+		self.clearancePolicy=clearancePolicy
 		self.diagOffset=20
 		self.scaleX = makeInterpolator([-1,1],[0+self.diagOffset,self.majorDim+self.diagOffset])
 		self.scaleY = makeInterpolator([-1,1],[self.majorDim+self.diagOffset, 0+self.diagOffset])
@@ -29,19 +83,20 @@ class board():
 
 		filename=os.path.join(self.storagePath, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S.kicad_pcb"))
 
-		with open(filename, 'w') as file:
+		# Everything is written through one large buffer, a generator of strings at a time
+
+		with open(filename, 'w', buffering=writeBufferSize) as file:
 
 			# Write the file header
 			self.doHeader(file, self.sky.name)
 
 			# Write the Boundary
-			self.doBoundary(file, self.sky.objects['boundary'].vertices)
+			self.doBoundary(file, self.sky.objects['boundary'].coords)
 
 			# Open a module containing the galactic background
 			self.doOpenModule(file, 'GALACTIC', 'F.Cu', 0, 0, 'ftprnt_GALACTIC', 'ftprnt_GALACTIC')
 
-			for pol in self.sky.objects['galaxy'].collection:
-				self.doPolygon(file, pol)
+			self.doPolygons(file, self.sky.objects['galaxy'])
 
 			# Close the module
 			self.doCloseModule(file)
@@ -50,15 +105,7 @@ class board():
 			self.doOpenModule(file, 'STARS', 'F.Cu', 0, 0, 'ftprnt_STARS', 'ftprnt_STARS')
 
 			# Insert the stars
-			# Get a list of the magnitudes of the relevant stars
-			starmags=[point.mag for point in self.sky.objects['stars']]
-			ringmin=.8 # diameter in mm
-			ringmax=4
-			starScale = makeInterpolator([max(starmags),min(starmags)], [ringmin, ringmax])
-
-			for index, point in enumerate(self.sky.objects['stars']):
-				[size, drill] = getStarSize(point, starScale)
-				self.doStar(file, index, self.scaleX(point.RA), self.scaleY(point.dec), size, drill, point.name)
+			self.doStars(file, self.sky.objects['stars'])
 
 			# Close the module
 			self.doCloseModule(file)
@@ -67,7 +114,7 @@ class board():
 			self.doOpenModule(file, 'RADEC', 'F.Cu', 0, 0, 'ftprnt_RADEC', 'ftprnt_RADEC')
 
 			# Insert the radec grids as silkscreen lines
-			self.doGrid(file, self.sky.objects['grid'].collection)
+			self.doGrid(file, self.sky.objects['grid'])
 
 			# Close the module
 			self.doCloseModule(file)
@@ -87,19 +134,109 @@ class board():
 		
 		return None
 
+	def scaleCoords(self, coords):
+		'''
+		Returns normalised coords (an Nx2 array) scaled to the board as [xs, ys]: millimetres, or integer nanometres if the board is fixedPoint.
+		'''
+
+		xs = self.scaleX(coords[:,0])
+		ys = self.scaleY(coords[:,1])
+
+		if self.fixedPoint:
+			return [toNanometres(xs), toNanometres(ys)]
+
+		return [xs, ys]
+
+	def getStrings(self, values):
+		'''
+		Returns an array of board values (see scaleCoords) ready to format: as they are, or as fixed-point strings if the board is fixedPoint.
+		'''
+
+		if self.fixedPoint:
+			return np.array(formatNanometres(values), dtype=object)
+
+		return values
+
+	def iterSegments(self, formatter, coords, offsets=None, *extras):
+		'''
+		Yields formatter(x1, y1, x2, y2, *extras) for every segment of a line of normalised coords (an Nx2 array),
+		or of every member of a ragged buffer if offsets are given (see multiPolyline).
+
+		The coords are scaled to the board once, as whole arrays. On a fixedPoint board each vertex is also formatted once,
+		and repeated or zero-length segments are left out.
+		'''
+
+		[xs, ys] = self.scaleCoords(coords)
+
+		# A segment starts at every vertex but the last of each member
+
+		starts = np.arange(len(coords)-1)
+		if offsets is not None:
+			members = np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+			starts = starts[members[:-1]==members[1:]]
+
+		ends = starts+1
+
+		if self.fixedPoint:
+			keep = getDistinctRuns(xs[starts], ys[starts], xs[ends], ys[ends])
+			[starts, ends] = [starts[keep], ends[keep]]
+
+		[xs, ys] = [self.getStrings(xs), self.getStrings(ys)]
+
+		for x1, y1, x2, y2 in zip(xs[starts].tolist(), ys[starts].tolist(), xs[ends].tolist(), ys[ends].tolist()):
+			yield formatter(x1, y1, x2, y2, *extras)
+
+	def iterLines(self, lineFormatter, arcFormatter, coords, offsets=None, *extras):
+		'''
+		Yields the lines of coords (and offsets) as iterSegments does, or if the board has arcs, as the fewest runs that fit an arc or a line each (see fitArcs):
+		lineFormatter(x1, y1, x2, y2, *extras) for a line, arcFormatter(centreX, centreY, x1, y1, angle, *extras) for an arc.
+		'''
+
+		if not self.arcs:
+			yield from self.iterSegments(lineFormatter, coords, offsets, *extras)
+			return
+
+		if offsets is None:
+			offsets = np.array([0, len(coords)])
+
+		xs = self.scaleX(coords[:,0])
+		ys = self.scaleY(coords[:,1])
+
+		# Fit in board millimetres, so the tolerance and the sweeps are those of the board itself
+
+		[starts, ends, centreXs, centreYs, angles] = fitArcs(xs, ys, offsets, self.arcTolerance)
+
+		[x1s, y1s, x2s, y2s] = [xs[starts], ys[starts], xs[ends], ys[ends]]
+		straight = np.isnan(centreXs)
+
+		if self.fixedPoint:
+
+			# Quantise the runs, with lines' centres at a value no arc can have, and keep the distinct ones
+
+			[x1s, y1s, x2s, y2s] = [toNanometres(values) for values in (x1s, y1s, x2s, y2s)]
+			[centreXs, centreYs] = [np.where(straight, np.iinfo(np.int64).min, toNanometres(np.nan_to_num(values))) for values in (centreXs, centreYs)]
+
+			keep = getDistinctRuns(x1s, y1s, x2s, y2s, centreXs, centreYs)
+			[x1s, y1s, x2s, y2s, centreXs, centreYs, straight] = [values[keep] for values in (x1s, y1s, x2s, y2s, centreXs, centreYs, straight)]
+			angles = np.array(list(map('{:.6f}'.format, angles[keep].tolist())), dtype=object)
+
+			[x1s, y1s, x2s, y2s, centreXs, centreYs] = [self.getStrings(values) for values in (x1s, y1s, x2s, y2s, centreXs, centreYs)]
+
+		for x1, y1, x2, y2, centreX, centreY, angle, isStraight in zip(x1s.tolist(), y1s.tolist(), x2s.tolist(), y2s.tolist(),
+			centreXs.tolist(), centreYs.tolist(), angles.tolist(), straight.tolist()):
+
+			if isStraight:
+				yield lineFormatter(x1, y1, x2, y2, *extras)
+			else:
+				yield arcFormatter(centreX, centreY, x1, y1, angle, *extras)
+
 	def doHeader(self, file, boardName):
 		file.write(templates['header'].format(boardName,datetime.datetime.now().strftime("%Y-%m-%d")))
 		return None
 
 	def doBoundary(self, file, boundary):
-		for index, vertex in enumerate(boundary):
-			if index < len(boundary)-1:
-				x1 = self.scaleX(vertex.RA)
-				y1 = self.scaleY(vertex.dec)
-				end = boundary[index+1]
-				x2 = self.scaleX(end.RA)
-				y2 = self.scaleY(end.dec)
-				file.write(templates['edge'].format(x1,y1,x2,y2))
+		# boundary is an Nx2 array of [x, y] rows
+		file.writelines(self.iterLines(formatters['edge'], formatters['edge_arc'], boundary))
 
 		return None
 
@@ -121,38 +258,73 @@ class board():
 
 		return None
 
-	def doStar(self, file, padNum, posX, posY, size, drill, name):
-		if drill!=0:
-			file.write(templates['TH_star'].format(padNum, posX, posY, size, size, drill))
+	def doStars(self, file, stars):
+
+		# Laid out in mm, with sizes in integer tenths of a mm, as every output lays its stars out (see getStarLayout)
+
+		[posXs, posYs, sizes, drills, names] = getStarLayout(stars, self.scaleX, self.scaleY, self.clearance, self.clearancePolicy)
+
+		if self.fixedPoint:
+			[posXs, posYs, sizes, drills] = [toNanometres(posXs), toNanometres(posYs), sizes*100000, drills*100000]
 		else:
-			file.write(templates['SMD_star'].format(padNum, posX, posY, size, size))
-		# if the star has a name
-		if len(name):
-			self.doSilkScreenText(file, name, posX+2.5, posY, 2, back=True)
-			file.write(templates['silk_circle_back'].format(posX, posY, (posY + size/2 + 0.5)))
+			[sizes, drills] = [sizes/10, drills/10]
+
+		if self.fixedPoint:
+			[textXs, circleEnds] = [posXs + 2500000, posYs + sizes//2 + 500000]
+		else:
+			[textXs, circleEnds] = [posXs + 2.5, posYs + sizes/2 + 0.5]
+
+		if self.planDrills:
+
+			# Plan in millimetres, whatever the board's units
+
+			holes = np.flatnonzero(drills!=0)
+			unit = 1000000 if self.fixedPoint else 1
+			[order, before, after] = planDrills(posXs[holes]/unit, posYs[holes]/unit, drills[holes])
+			order = np.concatenate((holes[order], np.flatnonzero(drills==0)))
+
+			[posXs, posYs, sizes, drills, textXs, circleEnds, names] = [values[order] for values in (posXs, posYs, sizes, drills, textXs, circleEnds, names)]
+
+			print('Drill travel: {:.0f}mm in catalogue order, {:.0f}mm planned'.format(before, after))
+
+		hasDrills = (drills!=0).tolist()
+		[posXs, posYs, sizes, drills, textXs, circleEnds] = [self.getStrings(values).tolist() for values in (posXs, posYs, sizes, drills, textXs, circleEnds)]
+
+		file.writelines(self.iterStars(posXs, posYs, sizes, drills, hasDrills, names.tolist(), textXs, circleEnds))
 
 		return None
 
-	def doGrid(self, file, grid):
+	def iterStars(self, posXs, posYs, sizes, drills, hasDrills, names, textXs, circleEnds):
+		'''
+		Yields the pads, and for named stars the silkscreen, of every star, from lists of values ready to format (see doStars).
+		'''
+
+		for padNum, [posX, posY, size, drill, hasDrill, name, textX, circleEnd] in enumerate(zip(posXs, posYs, sizes, drills, hasDrills, names, textXs, circleEnds)):
+			if hasDrill:
+				yield formatters['TH_star'](padNum, posX, posY, size, size, drill)
+			else:
+				yield formatters['SMD_star'](padNum, posX, posY, size, size)
+			# if the star has a name
+			if len(name):
+				yield self.getSilkScreenText(name, textX, posY, 2, back=True)
+				yield formatters['silk_circle_back'](posX, posY, circleEnd)
 
-		for section in grid:
-			for index, vertex in enumerate(section.vertices):
-				if index < len(section.vertices)-1:
-					x1 = self.scaleX(vertex.RA)
-					y1 = self.scaleY(vertex.dec)
-					end = section.vertices[index+1]
-					x2 = self.scaleX(end.RA)
-					y2 = self.scaleY(end.dec)
-					file.write(templates['silk_line'].format(x1,y1,x2,y2))
+	def doGrid(self, file, grid):
+		# grid is a multiPolyline, written as one ragged buffer
+		file.writelines(self.iterLines(formatters['silk_line'], formatters['silk_arc'], grid.coords, grid.offsets))
 
 		return None
 
-	def doSilkScreenText(self, file, text, posX, posY, size, back=False):
+	def getSilkScreenText(self, text, posX, posY, size, back=False):
 
 		if not back:
-			file.write(templates['silk_text'].format(text, posX, posY, size, size))
+			return formatters['silk_text'](text, posX, posY, size, size)
 		else:
-			file.write(templates['silk_text_back'].format(text, posX, posY, size, size))
+			return formatters['silk_text_back'](text, posX, posY, size, size)
+
+	def doSilkScreenText(self, file, text, posX, posY, size, back=False):
+
+		file.write(self.getSilkScreenText(text, posX, posY, size, back))
 
 		return None
 
@@ -173,16 +345,7 @@ class board():
 			w=1
 			fntsize=36
 
-		for section in con.collection:
-			for index, vertex in enumerate(section.vertices):
-				if index < len(section.vertices)-1:
-					x1 = self.scaleX(vertex.RA)
-					y1 = self.scaleY(vertex.dec)
-					end = section.vertices[index+1]
-					x2 = self.scaleX(end.RA)
-					y2 = self.scaleY(end.dec)
-					
-					file.write(templates['constellation_line'].format(x1,y1,x2,y2, w))
+		file.writelines(self.iterLines(formatters['constellation_line'], formatters['constellation_arc'], con.coords, con.offsets, w))
 
 		# Print the name in the middle
 		cen = con.getCentre()
@@ -192,27 +355,34 @@ class board():
 
 		return None
 
-	def doPolygon(self, file, pol):
-
-		# We need to create a series of (xy something else) separated by spaces to insert in the template
-		xylist=[]
-		for pos in pol.vertices:
-			xylist.append('(xy {} {})'.format(self.scaleX(pos.RA), self.scaleY(pos.dec)))
-		xystring=' '.join(xylist)
-		file.write(templates['polygon'].format(xystring))
-		
-		return None
-
-
-
-
-
-
+	def iterPolygons(self, coords, offsets):
+		'''
+		Yields a filled polygon for every member of a ragged buffer of normalised coords (see multiPolyline), scaled to the board once.
 
+		On a fixedPoint board, vertices landing on the one before are left out, and so are polygons left with fewer than three.
+		'''
 
+		[xs, ys] = self.scaleCoords(coords)
 
+		if self.fixedPoint:
+			members = np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+			keep = np.ones(len(coords), dtype=bool)
+			keep[1:] = (xs[1:]!=xs[:-1]) | (ys[1:]!=ys[:-1]) | (members[1:]!=members[:-1])
 
+			lengths = np.bincount(members[keep], minlength=len(offsets)-1)
+			keep &= (lengths>=3)[members]
+			[xs, ys, lengths] = [xs[keep], ys[keep], lengths[lengths>=3]]
+			offsets = np.concatenate(([0], np.cumsum(lengths, dtype=int)))
 
+		xs = self.getStrings(xs).tolist()
+		ys = self.getStrings(ys).tolist()
+		xy = formatters['xy']
 
+		for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+			yield formatters['polygon'](' '.join(map(xy, xs[start:stop], ys[start:stop])))
 
+	def doPolygons(self, file, polygons):
+		# polygons is a multiPolyline, each member of which is one polygon
+		file.writelines(self.iterPolygons(polygons.coords, polygons.offsets))
 
+		return None
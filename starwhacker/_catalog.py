@@ -0,0 +1,224 @@
+# _catalog.py
+
+# Reads star catalogues from their GeoJSON source, and keeps a compiled binary copy of each one so that later runs can memory-map it instead of parsing.
+
+# imports
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from starwhacker._tools import makeRandomString, writeAtomically
+from starwhacker._geojson import iterFeatures
+
+# The columns of a compiled catalogue, in the order they are passed to starTable
+
+starColumns = ('ID', 'name', 'RA', 'dec', 'mag', 'BV', 'desig', 'con')
+
+# Compiled catalogues live in data/_cache/<catalogue name>/, one .npy file per column plus a source.json describing what they were built from
+
+cacheRoot = os.path.join(os.path.dirname(__file__),'../data','_cache')
+
+def makeStarPredicate(mags=None, box=None):
+	'''
+	Returns a predicate for iterFeatures which rejects star features early, before they are turned into catalogue rows.
+
+	mags is a list [minMag, maxMag] which the star's mag must fall within.
+	box is [[minRA, maxRA],[minDec, maxDec]] in the same (flipped) RA convention as the loaded stars.
+
+	Features without usable coordinates or magnitudes are let through so readStarColumns treats them as it always has.
+	'''
+
+	def predicate(body):
+
+		if mags is not None:
+			try:
+				if not mags[0]<=float(body['properties']['mag'])<=mags[1]:
+					return False
+			except (KeyError, TypeError, ValueError):
+				pass
+
+		if box is not None:
+			try:
+				RA = -float(body['geometry']['coordinates'][0]) # Because the coords in this file are backwards lol
+				dec = float(body['geometry']['coordinates'][1])
+			except (KeyError, IndexError, TypeError, ValueError):
+				return True
+			if not (box[0][0]<=RA<=box[0][1] and box[1][0]<=dec<=box[1][1]):
+				return False
+
+		return True
+
+	return predicate
+
+def readStarColumns(jsonPath, predicate=None):
+	'''
+	Streams a GeoJSON star catalogue and returns a dictionary of its columns (see starColumns) as arrays.
+
+	predicate is an optional early-reject function passed on to iterFeatures (see makeStarPredicate).
+	'''
+
+	# Gather the catalogue column by column
+
+	columns = {key:[] for key in starColumns}
+
+	for body in iterFeatures(jsonPath, predicate):
+
+		try:
+			thisID = str(body['id'])
+		except:
+			thisID = makeRandomString(6)
+
+		try:
+			thisRA = -float(body['geometry']['coordinates'][0]) # Because the coords in this file are backwards lol
+			thisDec = float(body['geometry']['coordinates'][1])
+		except:
+			continue # Abandon if there's nothing here - it's really useless
+
+		try:
+			thisMag = float(body['properties']['mag'])
+		except:
+			thisMag = 0.0
+
+		try:
+			thisBV = float(body['properties']['bv'])
+		except:
+			thisBV = 0.0
+
+		try:
+			thisName = str(body['properties']['name'])
+		except:
+			thisName = ''
+
+		try:
+			thisDesig = str(body['properties']['desig'])
+		except:
+			thisDesig = ''
+
+		try:
+			thisCon = str(body['properties']['con'])
+		except:
+			thisCon = 'NONE'
+
+		columns['ID'].append(thisID)
+		columns['name'].append(thisName)
+		columns['RA'].append(thisRA)
+		columns['dec'].append(thisDec)
+		columns['mag'].append(thisMag)
+		columns['BV'].append(thisBV)
+		columns['desig'].append(thisDesig)
+		columns['con'].append(thisCon)
+
+	# Numeric columns become float64, text columns become fixed-width unicode, so every column can be saved and memory-mapped as-is
+
+	for key in ('RA', 'dec', 'mag', 'BV'):
+		columns[key] = np.asarray(columns[key], dtype=float)
+	for key in ('ID', 'name', 'desig', 'con'):
+		columns[key] = np.asarray(columns[key], dtype=str)
+
+	return columns
+
+def getSourceSignature(jsonPath, withHash=False):
+	'''
+	Returns a dictionary describing the source file (size and modification time, and optionally its sha1) for cache invalidation.
+	'''
+
+	info = os.stat(jsonPath)
+	signature = {'size':info.st_size, 'mtime':info.st_mtime_ns}
+
+	if withHash:
+		sha = hashlib.sha1()
+		with open(jsonPath, 'rb') as source:
+			for block in iter(lambda: source.read(1<<20), b''):
+				sha.update(block)
+		signature['sha1'] = sha.hexdigest()
+
+	return signature
+
+def getCachePath(jsonPath):
+	'''
+	Returns the directory holding the compiled copy of a catalogue.
+	'''
+
+	return os.path.join(cacheRoot, os.path.splitext(os.path.basename(jsonPath))[0])
+
+def isCacheValid(jsonPath, cachePath):
+	'''
+	Returns true if the compiled catalogue in cachePath was built from the current contents of jsonPath.
+
+	A matching size and mtime is trusted straight away. If only the mtime has changed (e.g. a fresh checkout) the source is hashed and compared instead.
+	'''
+
+	try:
+		with open(os.path.join(cachePath, 'source.json')) as metafile:
+			meta = json.load(metafile)
+	except (OSError, ValueError):
+		return False
+
+	if not all(os.path.isfile(os.path.join(cachePath, key+'.npy')) for key in starColumns):
+		return False
+
+	current = getSourceSignature(jsonPath)
+
+	if current['size'] != meta.get('size'):
+		return False
+
+	if current['mtime'] == meta.get('mtime'):
+		return True
+
+	current = getSourceSignature(jsonPath, withHash=True)
+	if current['sha1'] != meta.get('sha1'):
+		return False
+
+	# Same contents, new mtime - remember the new mtime so the next run can skip the hash
+
+	try:
+		with open(os.path.join(cachePath, 'source.json'), 'w') as metafile:
+			json.dump(current, metafile)
+	except OSError:
+		pass
+
+	return True
+
+def writeCache(jsonPath, cachePath, columns):
+	'''
+	Writes the compiled catalogue to cachePath, one .npy file per column, all put in place at once (see writeAtomically).
+	'''
+
+	def write(tempPath):
+		for key in starColumns:
+			np.save(os.path.join(tempPath, key+'.npy'), columns[key])
+		with open(os.path.join(tempPath, 'source.json'), 'w') as metafile:
+			json.dump(getSourceSignature(jsonPath, withHash=True), metafile)
+
+	# If it can't be written, the catalogue can still be used from memory
+
+	writeAtomically(cachePath, write, directory=True)
+
+	return None
+
+def loadStarColumns(jsonPath, cache=True, predicate=None):
+	'''
+	Returns a dictionary of the columns of the star catalogue at jsonPath.
+
+	With cache=True the catalogue is compiled to data/_cache the first time it is read, and memory-mapped from there on later calls,
+	so load time barely depends on the catalogue size and the pages are shared between concurrent processes.
+	The maps are copy-on-write: the columns can be changed in memory (e.g. through a starView), but the cache on disk never is.
+
+	A predicate (see makeStarPredicate) means only part of the catalogue is wanted, so the source is streamed directly and the cache is left alone.
+	'''
+
+	if not cache or predicate is not None:
+		return readStarColumns(jsonPath, predicate)
+
+	cachePath = getCachePath(jsonPath)
+
+	if not isCacheValid(jsonPath, cachePath):
+		writeCache(jsonPath, cachePath, readStarColumns(jsonPath))
+
+	try:
+		return {key:np.load(os.path.join(cachePath, key+'.npy'), mmap_mode='c') for key in starColumns}
+	except (OSError, ValueError):
+		return readStarColumns(jsonPath)
@@ -0,0 +1,189 @@
+# _clearance.py
+
+# Finds star pads which overlap, or sit closer together than a clearance, and resolves them by a policy before the board is written.
+
+# imports
+
+import math
+import numpy as np
+
+from starwhacker._spatial import pointGrid
+
+# The ways conflicting pads can be resolved, see resolveClearance
+
+policies = ('drop', 'merge', 'shrink')
+
+def findConflicts(xs, ys, sizes, clearance):
+	'''
+	Returns [firsts, seconds], every pair of pads (centred on xs, ys with diameters sizes) which overlap or are closer than clearance edge to edge.
+
+	The pads are binned in a pointGrid with cells as wide as the largest pad plus the clearance, so each is only compared with the cells around its own.
+	'''
+
+	if len(xs) < 2:
+		return [np.zeros(0, dtype=int), np.zeros(0, dtype=int)]
+
+	reach = float(np.max(sizes)) + clearance
+	[firsts, seconds, distances] = pointGrid(xs, ys, reach).getPairs(reach)
+
+	close = distances < (sizes[firsts]+sizes[seconds])/2 + clearance - 1e-9
+
+	return [firsts[close], seconds[close]]
+
+def getRanks(mags):
+	'''
+	Returns each star's place in order of brightness, brightest (smallest magnitude) first, ties going to the earlier star.
+	'''
+
+	ranks = np.empty(len(mags), dtype=int)
+	ranks[np.argsort(mags, kind='stable')] = np.arange(len(mags))
+
+	return ranks
+
+def getBrighterAndFainter(firsts, seconds, ranks):
+	'''
+	Returns [brighter, fainter], the stars of each pair, with the pairs sorted by their fainter star, brightest first.
+
+	Going through pairs in this order, every pair a star is the fainter of comes before any it is the brighter of,
+	so its fate is settled before it can affect anything fainter.
+	'''
+
+	brighter = np.where(ranks[firsts] < ranks[seconds], firsts, seconds)
+	fainter = firsts + seconds - brighter
+	order = np.argsort(ranks[fainter], kind='stable')
+
+	return [brighter[order], fainter[order]]
+
+def dropFainter(firsts, seconds, ranks, kept):
+	'''
+	Drops (unsets in kept) the fainter star of each pair, unless its brighter partner has been dropped already. Returns kept.
+	'''
+
+	for brighter, fainter in zip(*[stars.tolist() for stars in getBrighterAndFainter(firsts, seconds, ranks)]):
+		if kept[brighter]:
+			kept[fainter] = False
+
+	return kept
+
+def getClusters(count, firsts, seconds):
+	'''
+	Returns a label for each of count stars, the same for stars joined by a chain of pairs, numbered from 0 in order of each cluster's lowest star.
+	'''
+
+	labels = np.arange(count)
+
+	while True:
+		joined = labels.copy()
+		np.minimum.at(joined, firsts, labels[seconds])
+		np.minimum.at(joined, seconds, labels[firsts])
+		joined = joined[joined]
+		if np.array_equal(joined, labels):
+			break
+		labels = joined
+
+	return np.unique(labels, return_inverse=True)[1].ravel()
+
+def resolveClearance(xs, ys, sizes, mags, clearance=0.2, policy='drop', sizeOf=None, minSize=0.8, step=0.1, rounds=8):
+	'''
+	Resolves every pair of star pads (centres xs, ys and diameters sizes, all in mm) closer than clearance, by policy:
+	- 'drop' drops the fainter star of each pair, brightest first, so no star is dropped for a star which is itself dropped.
+	- 'merge' joins each cluster of conflicting stars into one pad on their brightness weighted centre, standing for the brightest of them,
+	  sized by sizeOf (a function of magnitudes) for their combined magnitude, but no larger than the largest pad. Merged pads which
+	  then conflict are merged again, up to rounds times.
+	- 'shrink' shrinks the fainter and then the brighter pad of each pair, in whole steps of step mm, down to minSize.
+	Conflicts which 'merge' or 'shrink' can't resolve are dropped.
+
+	Returns [rows, xs, ys, sizes, report]: the stars kept (as indices into the arrays given), in order, with their new positions and sizes,
+	and a report of how many conflicts were found and how many stars were dropped, merged away and shrunk.
+	'''
+
+	if policy not in policies:
+		raise ValueError('Unknown clearance policy {}, expected one of: {}'.format(policy, ', '.join(policies)))
+
+	[xs, ys, sizes, mags] = [np.asarray(values, dtype=float) for values in (xs, ys, sizes, mags)]
+	count = len(xs)
+	rows = np.arange(count)
+
+	[firsts, seconds] = findConflicts(xs, ys, sizes, clearance)
+	report = {'conflicts': len(firsts), 'dropped': 0, 'merged': 0, 'shrunk': 0}
+
+	if policy == 'merge':
+
+		largest = float(np.max(sizes)) if len(sizes) else 0.0
+
+		for _ in range(rounds):
+
+			if not len(firsts):
+				break
+
+			# Each cluster becomes its brightest star, moved to the cluster's centre of brightness
+
+			labels = getClusters(len(rows), firsts, seconds)
+			ranks = getRanks(mags)
+			brightest = np.full(labels.max()+1, len(rows))
+			np.minimum.at(brightest, labels, ranks)
+			representatives = np.argsort(ranks)[brightest]
+
+			fluxes = 10**(-0.4*mags)
+			totals = np.bincount(labels, fluxes)
+			members = np.bincount(labels)
+			merged = members > 1
+
+			report['merged'] += int((members-1).sum())
+
+			newMags = np.where(merged, -2.5*np.log10(totals), mags[representatives])
+			newXs = np.where(merged, np.bincount(labels, fluxes*xs)/totals, xs[representatives])
+			newYs = np.where(merged, np.bincount(labels, fluxes*ys)/totals, ys[representatives])
+			newSizes = sizes[representatives]
+			if sizeOf is not None:
+				newSizes = np.where(merged, np.clip(sizeOf(newMags), minSize, largest), newSizes)
+
+			# Keep the stars in the order given
+
+			order = np.argsort(rows[representatives], kind='stable')
+			[rows, xs, ys, sizes, mags] = [values[order] for values in (rows[representatives], newXs, newYs, newSizes, newMags)]
+
+			[firsts, seconds] = findConflicts(xs, ys, sizes, clearance)
+
+	elif policy == 'shrink':
+
+		sizes = sizes.copy()
+		kept = np.ones(len(rows), dtype=bool)
+		shrunk = np.zeros(len(rows), dtype=bool)
+
+		for brighter, fainter in zip(*[stars.tolist() for stars in getBrighterAndFainter(firsts, seconds, getRanks(mags))]):
+
+			if not (kept[brighter] and kept[fainter]):
+				continue
+
+			# The pair may have been resolved already, by shrinking either of them for another pair
+
+			allowed = 2*(math.hypot(xs[brighter]-xs[fainter], ys[brighter]-ys[fainter]) - clearance)
+			if sizes[brighter] + sizes[fainter] <= allowed + 1e-9:
+				continue
+
+			# Shrink the fainter as far as it needs, then the brighter, or drop the fainter if even that isn't enough
+
+			fainterSize = min(sizes[fainter], max(minSize, round(math.floor((allowed - sizes[brighter])/step + 1e-9)*step, 6)))
+			brighterSize = min(sizes[brighter], max(minSize, round(math.floor((allowed - fainterSize)/step + 1e-9)*step, 6)))
+
+			if fainterSize + brighterSize > allowed + 1e-9:
+				kept[fainter] = False
+				continue
+
+			for [star, size] in ((fainter, fainterSize), (brighter, brighterSize)):
+				if size < sizes[star]:
+					[sizes[star], shrunk[star]] = [size, True]
+
+		report['shrunk'] = int((shrunk & kept).sum())
+		[rows, xs, ys, sizes, mags] = [values[kept] for values in (rows, xs, ys, sizes, mags)]
+		[firsts, seconds] = [np.zeros(0, dtype=int), np.zeros(0, dtype=int)]
+
+	# Drop the fainter star of every conflict left
+
+	kept = dropFainter(firsts, seconds, getRanks(mags), np.ones(len(rows), dtype=bool))
+
+	[rows, xs, ys, sizes] = [values[kept] for values in (rows, xs, ys, sizes)]
+	report['dropped'] = count - len(rows) - report['merged']
+
+	return [rows, xs, ys, sizes, report]
@@ -0,0 +1,297 @@
+# _contours.py
+
+# Traces iso-contours of a sampled brightness field (marching squares) and turns them into a handful of filled polygons, all with array operations.
+
+# imports
+
+import math
+import numpy as np
+
+from starwhacker._coordinates import polyline
+
+def makeSegmentTable():
+	'''
+	Returns the marching squares lookup, {(case, centreAbove): [(fromEdge, toEdge), ...]}.
+
+	A cell's corners are numbered anticlockwise from the bottom left (bit k of case is set if corner k is above the level),
+	and edge k runs from corner k to corner k+1: bottom, right, top, left. Each segment keeps the region above the level on its left.
+
+	The two saddle cases are resolved by whether the centre of the cell (the mean of its corners) is above the level.
+	'''
+
+	table = {}
+
+	for case in range(16):
+
+		above = [(case>>k)&1 for k in range(4)]
+
+		# Going anticlockwise round the cell, edges where we go from above to below, and from below to above
+
+		exits = [k for k in range(4) if above[k] and not above[(k+1)%4]]
+		entries = [k for k in range(4) if not above[k] and above[(k+1)%4]]
+
+		for centreAbove in (False, True):
+
+			pairs = []
+			for leaving in exits:
+				following = sorted(entries, key=lambda entry: (entry-leaving)%4)
+				pairs.append((leaving, following[0] if centreAbove or len(exits)==1 else following[-1]))
+
+			table[case, centreAbove] = pairs
+
+	return table
+
+segmentTable = makeSegmentTable()
+
+def ringOf(offsets):
+	'''
+	Returns, for every vertex of a ragged buffer (see multiPolyline), the index of the ring it belongs to.
+	'''
+
+	return np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+
+def getRingAreas(coords, offsets):
+	'''
+	Returns the signed area of every closed ring in a ragged buffer: positive for anticlockwise rings, negative for clockwise.
+	'''
+
+	rings = ringOf(offsets)
+	sameRing = rings[:-1]==rings[1:]
+	crosses = coords[:-1,0]*coords[1:,1] - coords[1:,0]*coords[:-1,1]
+
+	return np.bincount(rings[:-1][sameRing], crosses[sameRing], minlength=len(offsets)-1)/2
+
+def reverseRings(coords, offsets):
+	'''
+	Returns the coords of a ragged buffer with every ring running the other way round.
+	'''
+
+	rings = ringOf(offsets)
+
+	return coords[offsets[rings] + offsets[rings+1] - 1 - np.arange(len(coords))]
+
+def marchingSquares(xs, ys, field, level):
+	'''
+	Traces the contours of field (a 2D array, rows along ys and columns along xs, both ascending) at level, as closed rings.
+
+	The region above level is always on the left, so rings run anticlockwise around bright regions and clockwise around dark holes.
+	The field is bordered with values below level, so rings touching the edge are closed along it.
+
+	Returns [coords, offsets], a ragged buffer (see multiPolyline) with the first vertex of every ring repeated at its end.
+	'''
+
+	# Border the field, giving the border the same coordinates as the edge so closing runs lie exactly along it
+
+	floor = min(float(np.min(field)), level) - 1
+	field = np.pad(np.asarray(field, dtype=float), 1, constant_values=floor)
+	xs = np.concatenate(([xs[0]], xs, [xs[-1]]))
+	ys = np.concatenate(([ys[0]], ys, [ys[-1]]))
+
+	[rows, columns] = field.shape
+	horizontalCount = rows*(columns-1)
+
+	# Classify every cell by which of its corners are above the level
+
+	above = field > level
+	cases = above[:-1,:-1]*1 + above[:-1,1:]*2 + above[1:,1:]*4 + above[1:,:-1]*8
+	centresAbove = (field[:-1,:-1] + field[:-1,1:] + field[1:,1:] + field[1:,:-1])/4 > level
+
+	# The edges of every cell as ids: horizontal edges first, then vertical ones
+
+	[J, I] = np.indices(cases.shape)
+	cellEdges = [J*(columns-1) + I, horizontalCount + J*columns + I+1, (J+1)*(columns-1) + I, horizontalCount + J*columns + I]
+
+	# Emit the segments of every cell, one case at a time
+
+	fromEdges = [np.zeros(0, dtype=int)]
+	toEdges = [np.zeros(0, dtype=int)]
+
+	for (case, centreAbove), pairs in segmentTable.items():
+
+		if not pairs:
+			continue
+
+		cells = cases==case
+		if len(pairs) > 1:
+			cells &= centresAbove==centreAbove
+		elif centreAbove:
+			continue # Only the saddles depend on the centre
+
+		for (fromEdge, toEdge) in pairs:
+			fromEdges.append(cellEdges[fromEdge][cells])
+			toEdges.append(cellEdges[toEdge][cells])
+
+	fromEdges = np.concatenate(fromEdges)
+	toEdges = np.concatenate(toEdges)
+
+	count = len(fromEdges)
+	if not count:
+		return [np.zeros((0,2)), np.zeros(1, dtype=int)]
+
+	# Each crossed edge starts exactly one segment, so following toEdge leads to the next segment round the ring
+
+	startingAt = np.full(horizontalCount + (rows-1)*columns, -1)
+	startingAt[fromEdges] = np.arange(count)
+	following = startingAt[toEdges]
+
+	# Label each ring by its lowest segment, by pointer jumping
+
+	labels = np.arange(count)
+	jumps = following.copy()
+	for _ in range(math.ceil(math.log2(count))+1):
+		labels = np.minimum(labels, labels[jumps])
+		jumps = jumps[jumps]
+
+	# Cut each ring just before its label, and rank every segment by its distance to the cut, again by pointer jumping
+
+	successors = following.copy()
+	tails = following==labels
+	successors[tails] = np.flatnonzero(tails)
+	distances = (~tails).astype(int)
+	for _ in range(math.ceil(math.log2(count))+1):
+		distances = distances + distances[successors]
+		successors = successors[successors]
+
+	order = np.lexsort((-distances, labels))
+
+	# Each segment contributes the point where its starting edge crosses the level
+
+	edges = fromEdges[order]
+	horizontal = edges < horizontalCount
+	[edgeRows, edgeColumns] = np.where(horizontal, np.divmod(edges, columns-1), np.divmod(edges-horizontalCount, columns))
+	[nextRows, nextColumns] = [edgeRows + ~horizontal, edgeColumns + horizontal]
+
+	startValues = field[edgeRows, edgeColumns]
+	t = (level - startValues)/(field[nextRows, nextColumns] - startValues)
+
+	points = np.column_stack((xs[edgeColumns] + t*(xs[nextColumns]-xs[edgeColumns]), ys[edgeRows] + t*(ys[nextRows]-ys[edgeRows])))
+
+	# Close every ring by repeating its first point
+
+	offsets = np.concatenate(([0], np.cumsum(np.bincount(labels)[np.unique(labels)])))
+	coords = np.insert(points, offsets[1:], points[offsets[:-1]], axis=0)
+
+	return [coords, offsets + np.arange(len(offsets))]
+
+def bridgeHoles(outer, holes):
+	'''
+	Joins holes (a list of closed rings) into outer (a closed ring) with zero-width bridges, so the whole thing can be drawn as one polygon.
+
+	Each hole is bridged from its rightmost vertex to the nearest vertex of the outline so far that lies to the right of it,
+	taking holes from the right, so no bridge crosses its own hole.
+	'''
+
+	merged = outer[:-1]
+
+	for hole in sorted(holes, key=lambda hole: -hole[:,0].max()):
+
+		hole = hole[:-1]
+		start = int(np.argmax(hole[:,0]))
+
+		distances = np.hypot(merged[:,0]-hole[start,0], merged[:,1]-hole[start,1])
+		distances[merged[:,0] < hole[start,0]] = np.inf
+		if np.isinf(distances).all():
+			distances = np.hypot(merged[:,0]-hole[start,0], merged[:,1]-hole[start,1])
+		join = int(np.argmin(distances))
+
+		merged = np.concatenate((merged[:join+1], hole[start:], hole[:start+1], merged[join:]))
+
+	return np.concatenate((merged, merged[:1]))
+
+def makeBandPolygons(xs, ys, field, levels, minArea=0.0):
+	'''
+	Returns filled polygons covering alternate bands of field between the (sorted) levels: above the first and below the second,
+	above the third and below the fourth, and so on, so a single colour keeps a banded look.
+
+	Holes are bridged into their surrounding polygon (see bridgeHoles). Rings enclosing less than minArea are dropped.
+
+	Returns [coords, offsets], a ragged buffer (see multiPolyline) of closed rings.
+	'''
+
+	allCoords = []
+	allLengths = []
+
+	for number, level in enumerate(sorted(levels)):
+
+		[coords, offsets] = marchingSquares(xs, ys, field, level)
+
+		# Every other level bounds the bands from above, so it runs the other way round
+
+		if number%2:
+			coords = reverseRings(coords, offsets)
+
+		allCoords.append(coords)
+		allLengths.append(np.diff(offsets))
+
+	coords = np.concatenate(allCoords)
+	offsets = np.concatenate(([0], np.cumsum(np.concatenate(allLengths), dtype=int)))
+
+	# With the bands on the left, anticlockwise rings are outlines and clockwise rings are holes, each belonging to the smallest outline around it
+
+	areas = getRingAreas(coords, offsets)
+	outers = np.flatnonzero(areas > minArea)
+	holes = np.flatnonzero(areas < -minArea)
+
+	inside = getRingsContaining(coords, offsets, outers, coords[offsets[holes]])
+	owners = outers[np.argmin(np.where(inside, areas[outers], np.inf), axis=1)] if len(outers) else np.zeros(0, dtype=int)
+	owners[~inside.any(axis=1)] = -1
+
+	return joinPolygons(coords, offsets, outers, holes, owners)
+
+def makeEvenOddPolygons(coords, offsets, minArea=0.0):
+	'''
+	Returns filled polygons covering everything inside an odd number of the closed rings in a ragged buffer, whichever way round they run.
+
+	Rings nested an even number of deep are outlines, the rest are holes in the ring immediately around them, bridged in (see bridgeHoles).
+	Rings enclosing less than minArea are dropped.
+
+	Returns [coords, offsets], a ragged buffer (see multiPolyline) of closed rings.
+	'''
+
+	rings = np.flatnonzero(np.abs(getRingAreas(coords, offsets)) > minArea)
+
+	# How deeply each ring is nested, from which of the others contain its first vertex
+
+	inside = getRingsContaining(coords, offsets, rings, coords[offsets[rings]])
+	np.fill_diagonal(inside, False)
+	depths = inside.sum(axis=1)
+
+	# A hole's owner is the most deeply nested ring around it
+
+	owners = rings[np.argmax(np.where(inside, depths, -1), axis=1)] if len(rings) else np.zeros(0, dtype=int)
+
+	return joinPolygons(coords, offsets, rings[depths%2==0], rings[depths%2==1], owners[depths%2==1])
+
+def getRingsContaining(coords, offsets, rings, points):
+	'''
+	Returns a boolean array (points x rings), true where each of points (an Nx2 array) lies within each of the rings of a ragged buffer.
+
+	Only the points within a ring's extents are tested against it.
+	'''
+
+	inside = np.zeros((len(points), len(rings)), dtype=bool)
+
+	for column, ring in enumerate(rings):
+
+		outline = polyline(coords[offsets[ring]:offsets[ring+1]])
+		[[minX, maxX], [minY, maxY]] = outline.getExtents()
+		candidates = np.flatnonzero((minX<=points[:,0]) & (points[:,0]<=maxX) & (minY<=points[:,1]) & (points[:,1]<=maxY))
+
+		inside[candidates, column] = outline.containsPoints(points[candidates,0], points[candidates,1])
+
+	return inside
+
+def joinPolygons(coords, offsets, outers, holes, owners):
+	'''
+	Bridges each of holes into the ring owners names for it (see bridgeHoles), and returns the outers as [coords, offsets].
+
+	Holes without an owner (-1) are dropped.
+	'''
+
+	polygons = []
+	for outer in outers:
+		polygons.append(bridgeHoles(coords[offsets[outer]:offsets[outer+1]], [coords[offsets[hole]:offsets[hole+1]] for hole in holes[owners==outer]]))
+
+	lengths = [len(polygon) for polygon in polygons]
+
+	return [np.concatenate(polygons) if polygons else np.zeros((0,2)), np.concatenate(([0], np.cumsum(lengths, dtype=int)))]
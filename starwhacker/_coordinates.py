@@ -1,18 +1,538 @@
 # coordinates.py
 
 from starwhacker._tools import makeInterpolator
+from starwhacker._projection import stereographic
+from starwhacker._spatial import gatherRanges, boxTree
 
 import math
+import numpy as np
 
 
 ##--------------------------------------------------------------------------------------------------------------------------------##
 
 
+# Geometric helpers working on whole arrays of coordinates at once
+
+def segmentsTouch(ax, ay, bx, by, cx, cy, dx, dy):
+	'''
+	Returns a boolean array, true where segment a-b intersects or touches segment c-d. All arguments broadcast against each other.
+	'''
+
+	def orient(px, py, qx, qy, rx, ry):
+		return np.sign((qx-px)*(ry-py) - (qy-py)*(rx-px))
+
+	def onSegment(px, py, qx, qy, rx, ry):
+		# r is known to be collinear with p-q; check it lies within p-q's box
+		return (np.minimum(px,qx)<=rx) & (rx<=np.maximum(px,qx)) & (np.minimum(py,qy)<=ry) & (ry<=np.maximum(py,qy))
+
+	o1 = orient(ax, ay, bx, by, cx, cy)
+	o2 = orient(ax, ay, bx, by, dx, dy)
+	o3 = orient(cx, cy, dx, dy, ax, ay)
+	o4 = orient(cx, cy, dx, dy, bx, by)
+
+	proper = (o1*o2<0) & (o3*o4<0)
+
+	touching = ((o1==0) & onSegment(ax, ay, bx, by, cx, cy)) | ((o2==0) & onSegment(ax, ay, bx, by, dx, dy)) \
+		| ((o3==0) & onSegment(cx, cy, dx, dy, ax, ay)) | ((o4==0) & onSegment(cx, cy, dx, dy, bx, by))
+
+	return proper | touching
+
+def toCoordArray(vertexList):
+	'''
+	Returns an Nx2 float array of [RA, dec] rows, from a list of positions, a list of [RA, dec] pairs, or an existing array.
+	'''
+
+	if isinstance(vertexList, np.ndarray):
+		return vertexList.astype(float, copy=False).reshape(-1,2)
+
+	vertexList = list(vertexList)
+
+	if vertexList and hasattr(vertexList[0], 'RA'):
+		return np.array([[vertex.RA, vertex.dec] for vertex in vertexList], dtype=float)
+
+	return np.array(vertexList, dtype=float).reshape(-1,2)
+
+def interpolateRagged(coords, offsets, nodesPerUnit):
+	'''
+	Interpolates naive straight lines between the consecutive vertices of every line in a ragged buffer (see multiPolyline), all at once.
+
+	Each segment gets round(nodesPerUnit * length) - 2 new vertices evenly spaced along it (none if that is not positive),
+	and the original vertices stay where they are. Returns the new [coords, offsets].
+	'''
+
+	if not len(coords):
+		return [coords, offsets]
+
+	# A segment starts at every vertex except the last of each line
+
+	isSegmentStart = np.ones(len(coords), dtype=bool)
+	isSegmentStart[offsets[1:]-1] = False
+	segmentStarts = np.flatnonzero(isSegmentStart)
+
+	starts = coords[segmentStarts]
+	deltas = coords[segmentStarts+1] - starts
+
+	# Work out how many points to place in each segment, keeping the end nodes as they are (in order to maintain sharp corners if required)
+
+	numPoints = np.rint(nodesPerUnit * np.sqrt(deltas[:,0]**2 + deltas[:,1]**2))
+	extra = np.where(numPoints>2, numPoints-2, 0).astype(int)
+
+	# Make room after each segment's start vertex for its new points
+
+	counts = np.ones(len(coords), dtype=int)
+	counts[segmentStarts] += extra
+	newIndex = np.cumsum(counts) - counts
+
+	newCoords = np.empty((counts.sum(), 2))
+	newCoords[newIndex] = coords
+
+	# Fill in the new points at fractions n/(numPoints-1), n = 1 .. numPoints-2, of each segment
+
+	segmentOfPoint = np.repeat(np.arange(len(segmentStarts)), extra)
+	n = np.arange(len(segmentOfPoint)) - np.repeat(np.cumsum(extra)-extra, extra) + 1
+	fracs = n / (numPoints[segmentOfPoint]-1)
+
+	newCoords[newIndex[segmentStarts][segmentOfPoint] + n] = starts[segmentOfPoint] + fracs[:,None]*deltas[segmentOfPoint]
+
+	return [newCoords, np.concatenate(([0], np.cumsum(counts)))[offsets]]
+
+def cutRagged(coords, offsets, inside):
+	'''
+	Cuts every line in a ragged buffer (see multiPolyline) into the runs of consecutive vertices for which inside (a boolean array) is true.
+
+	Runs of a single vertex are dropped, since they cannot form a line. Returns the new [coords, offsets].
+	'''
+
+	inside = np.asarray(inside, dtype=bool)
+
+	# A run starts at an inside vertex which either starts its line or follows an outside vertex
+
+	isLineStart = np.zeros(len(coords), dtype=bool)
+	isLineStart[offsets[:-1][np.diff(offsets)>0]] = True
+	follows = np.concatenate(([False], inside[:-1]))
+
+	runStarts = inside & (isLineStart | ~follows)
+	runOfVertex = np.cumsum(runStarts) - 1
+	runLengths = np.bincount(runOfVertex[inside], minlength=int(runStarts.sum()))
+
+	keepRun = runLengths>1
+	keep = inside & keepRun[np.maximum(runOfVertex, 0)] if len(runLengths) else inside
+
+	return [coords[keep], np.concatenate(([0], np.cumsum(runLengths[keepRun])))]
+
+
+def clipRagged(coords, offsets, boundary):
+	'''
+	Clips every line in a ragged buffer (see multiPolyline) exactly against the boundary (a closed polyline), all at once.
+
+	Each segment is split wherever it crosses a boundary edge, the pieces whose midpoints fall inside are kept, and consecutive
+	kept pieces are joined back into lines. So the lines run right up to the boundary, with the crossing points as new end vertices.
+	Returns the new [coords, offsets].
+	'''
+
+	empty = [np.zeros((0,2)), np.zeros(1, dtype=int)]
+
+	if not len(coords) or not boundary.isClosed():
+		return empty
+
+	# Every segment in the buffer (all vertices except the last of each line start one), and which line it belongs to
+
+	isSegmentStart = np.ones(len(coords), dtype=bool)
+	isSegmentStart[offsets[1:]-1] = False
+	segmentStarts = np.flatnonzero(isSegmentStart)
+
+	if not len(segmentStarts):
+		return empty
+
+	lineOfSegment = np.searchsorted(offsets, segmentStarts, side='right') - 1
+
+	starts = coords[segmentStarts]
+	deltas = coords[segmentStarts+1] - starts
+
+	# Where does each segment cross each boundary edge? (segments x edges)
+	# Solve start + t*delta = edgeStart + u*edgeDelta for t (along the segment) and u (along the edge)
+
+	edgeStarts = boundary.coords[:-1]
+	edgeDeltas = boundary.coords[1:] - edgeStarts
+
+	offsetX = edgeStarts[None,:,0] - starts[:,None,0]
+	offsetY = edgeStarts[None,:,1] - starts[:,None,1]
+	denominators = deltas[:,None,0]*edgeDeltas[None,:,1] - deltas[:,None,1]*edgeDeltas[None,:,0]
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		t = (offsetX*edgeDeltas[None,:,1] - offsetY*edgeDeltas[None,:,0]) / denominators
+		u = (offsetX*deltas[:,None,1] - offsetY*deltas[:,None,0]) / denominators
+
+	crossing = (denominators!=0) & (t>0) & (t<1) & (u>=0) & (u<=1)
+	[crossingSegments, crossingEdges] = np.nonzero(crossing)
+
+	# Break every segment at 0, 1 and each of its crossings, in order along the line
+
+	breakSegments = np.concatenate((np.arange(len(segmentStarts)), np.arange(len(segmentStarts)), crossingSegments))
+	breakTs = np.concatenate((np.zeros(len(segmentStarts)), np.ones(len(segmentStarts)), t[crossingSegments, crossingEdges]))
+	order = np.lexsort((breakTs, breakSegments))
+	breakSegments = breakSegments[order]
+	breakTs = breakTs[order]
+
+	# Consecutive breaks on the same segment bound a piece. Skip zero-length pieces (e.g. crossing exactly at a boundary vertex)
+
+	pieceOf = np.flatnonzero((breakSegments[:-1]==breakSegments[1:]) & (breakTs[1:]>breakTs[:-1]))
+	pieceSegments = breakSegments[pieceOf]
+	pieceStarts = starts[pieceSegments] + breakTs[pieceOf,None]*deltas[pieceSegments]
+	pieceEnds = starts[pieceSegments] + breakTs[pieceOf+1,None]*deltas[pieceSegments]
+
+	# Keep the pieces whose midpoints are inside
+
+	middles = (pieceStarts+pieceEnds)/2
+	inside = boundary.containsPoints(middles[:,0], middles[:,1])
+
+	# Kept pieces that follow each other within the same line join up into one output line
+
+	pieceLines = lineOfSegment[pieceSegments]
+	follows = np.concatenate(([False], inside[:-1] & (pieceLines[1:]==pieceLines[:-1])))
+	runStarts = inside & ~follows
+
+	# Each run contributes its first piece's start, then every piece's end
+
+	keptStarts = pieceStarts[runStarts]
+	keptEnds = pieceEnds[inside]
+	runOfPiece = (np.cumsum(runStarts)-1)[inside]
+	runLengths = np.bincount(runOfPiece, minlength=len(keptStarts)) + 1
+
+	newOffsets = np.concatenate(([0], np.cumsum(runLengths)))
+	newCoords = np.empty((newOffsets[-1], 2))
+	newCoords[newOffsets[:-1]] = keptStarts
+	isEnd = np.ones(newOffsets[-1], dtype=bool)
+	isEnd[newOffsets[:-1]] = False
+	newCoords[isEnd] = keptEnds
+
+	return [newCoords, newOffsets]
+
+def clipRingsToHalfPlane(coords, offsets, start, end):
+	'''
+	Clips every ring of a ragged buffer (see multiPolyline) to the left of the line through start and end, all at once (one Sutherland-Hodgman step).
+
+	The rings are open: each closes from its last vertex back to its first. Every edge leaving the half-plane is cut where it leaves,
+	and every edge coming back where it comes back in. Returns the new [coords, offsets].
+	'''
+
+	if not len(coords):
+		return [coords, offsets]
+
+	# How far each vertex is to the left of the line (scaled by its length), and which vertex comes before each round its ring
+
+	[dx, dy] = [end[0]-start[0], end[1]-start[1]]
+	sides = dx*(coords[:,1]-start[1]) - dy*(coords[:,0]-start[0])
+	inside = sides >= 0
+
+	rings = np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+	previous = np.arange(len(coords)) - 1
+	previous[offsets[:-1][np.diff(offsets)>0]] = offsets[1:][np.diff(offsets)>0] - 1
+
+	# Each vertex gives the point its incoming edge crosses the line at, if it does, and then itself, if it's inside
+
+	crossing = inside != inside[previous]
+	counts = crossing*1 + inside
+	firsts = np.cumsum(counts) - counts
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		t = sides[previous] / (sides[previous] - sides)
+
+	newCoords = np.empty((counts.sum(), 2))
+	newCoords[firsts[crossing]] = coords[previous[crossing]] + t[crossing,None]*(coords[crossing]-coords[previous[crossing]])
+	newCoords[(firsts+crossing)[inside]] = coords[inside]
+
+	return [newCoords, np.concatenate(([0], np.cumsum(np.bincount(rings, counts, minlength=len(offsets)-1).astype(int))))]
+
+def clipPolygonsRagged(coords, offsets, boundary):
+	'''
+	Clips every polygon (closed ring) in a ragged buffer (see multiPolyline) against the boundary (a closed polyline), all at once.
+
+	Unlike clipRagged, which cuts lines, the parts of a polygon's outline outside the boundary are replaced by the boundary itself,
+	so what is left covers exactly the part of the polygon's area inside it. Polygons with holes bridged in (see _contours.bridgeHoles)
+	keep their holes, and a polygon which leaves and re-enters the boundary stays one polygon, joined by zero-width runs along it.
+
+	Each polygon is clipped against every edge of the boundary in turn (Sutherland-Hodgman), so a boundary which isn't convex is clipped
+	against one convex piece of it at a time (see polyline.getConvexPieces), giving a polygon per piece.
+	Polygons left with fewer than three vertices are dropped. Returns the new [coords, offsets], with every ring closed.
+	'''
+
+	empty = [np.zeros((0,2)), np.zeros(1, dtype=int)]
+
+	if not len(coords) or not boundary.isClosed():
+		return empty
+
+	# Work on open rings, dropping the closing vertex of those which repeat their first
+
+	lengths = np.diff(offsets)
+	closed = np.zeros(len(lengths), dtype=bool)
+	closed[lengths>1] = np.all(coords[offsets[:-1][lengths>1]]==coords[offsets[1:][lengths>1]-1], axis=1)
+
+	keep = np.ones(len(coords), dtype=bool)
+	keep[offsets[1:][closed]-1] = False
+	openCoords = coords[keep]
+	openOffsets = np.concatenate(([0], np.cumsum(lengths-closed)))
+
+	allCoords = []
+	allLengths = []
+
+	for piece in boundary.getConvexPieces():
+
+		[pieceCoords, pieceOffsets] = [openCoords, openOffsets]
+		for start, end in zip(piece, np.roll(piece, -1, axis=0)):
+			[pieceCoords, pieceOffsets] = clipRingsToHalfPlane(pieceCoords, pieceOffsets, start, end)
+
+		allCoords.append(pieceCoords)
+		allLengths.append(np.diff(pieceOffsets))
+
+	coords = np.concatenate(allCoords)
+	lengths = np.concatenate(allLengths)
+	offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+	# Drop what has collapsed, and close the rest again
+
+	kept = lengths>=3
+	starts = offsets[:-1][kept]
+	coords = coords[gatherRanges(np.arange(len(coords)), starts, offsets[1:][kept])]
+	offsets = np.concatenate(([0], np.cumsum(lengths[kept])))
+
+	return [np.insert(coords, offsets[1:], coords[offsets[:-1]], axis=0), offsets + np.arange(len(offsets))]
+
+
+def toUnitVectors(coords):
+	'''
+	Returns the [RA, dec] rows of coords (degrees) as rows of unit vectors [x, y, z] on the sphere.
+	'''
+
+	RA = np.radians(coords[:,0])
+	dec = np.radians(coords[:,1])
+
+	return np.column_stack((np.cos(dec)*np.cos(RA), np.cos(dec)*np.sin(RA), np.sin(dec)))
+
+def getCap(coords, margin=1.0):
+	'''
+	Returns [centre, radius]: a unit vector and an angle in radians, the spherical cap around the [RA, dec] rows of coords (degrees),
+	widened by margin degrees.
+	'''
+
+	vectors = toUnitVectors(coords)
+	centre = vectors.sum(axis=0)
+	centre /= np.linalg.norm(centre)
+
+	return [centre, float(np.arccos(np.clip(vectors@centre, -1, 1)).max()) + np.radians(margin)]
+
+def getArcDistances(coords, offsets, centre):
+	'''
+	Returns, for every segment of a ragged buffer (see multiPolyline) of [RA, dec] rows, the angle in radians from centre (a unit vector)
+	to the nearest point of the segment's great circle arc.
+
+	The nearest point is the foot of the perpendicular from centre onto the arc's great circle if that lies on the arc, otherwise one of its ends.
+	'''
+
+	isSegmentStart = np.ones(len(coords), dtype=bool)
+	isSegmentStart[offsets[1:]-1] = False
+	segmentStarts = np.flatnonzero(isSegmentStart)
+
+	starts = toUnitVectors(coords[segmentStarts])
+	ends = toUnitVectors(coords[segmentStarts+1])
+
+	toEnds = np.arccos(np.clip(np.maximum(starts@centre, ends@centre), -1, 1))
+
+	normals = np.cross(starts, ends)
+	lengths = np.linalg.norm(normals, axis=1)
+	normals = normals / np.where(lengths>0, lengths, 1)[:,None]
+
+	# The foot lies on the arc when it is on the inner side of both ends
+
+	foot = centre[None,:] - (normals@centre)[:,None]*normals
+	onArc = (lengths>0) & (np.einsum('ij,ij->i', np.cross(starts, foot), normals) >= 0) & (np.einsum('ij,ij->i', np.cross(foot, ends), normals) >= 0)
+
+	return np.where(onArc, np.arcsin(np.clip(np.abs(normals@centre), 0, 1)), toEnds)
+
+def refineRagged(coords, offsets, project, tolerance, greatCircle=True, maxDepth=16):
+	'''
+	Adaptively subdivides every segment of every line in a ragged buffer (see multiPolyline), all at once, only where it is needed.
+
+	project is a function taking arrays of RAs and decs and returning [xs, ys] in output units (e.g. millimetres on the board).
+	A segment is split at its midpoint whenever that midpoint, once projected, lies further than tolerance from the projected chord,
+	and the halves are checked again, up to maxDepth times.
+
+	With greatCircle=True segments follow great circles (the shortest path on the sky), otherwise straight lines in RA/dec.
+	Original vertices stay where they are. Returns the new [coords, offsets].
+	'''
+
+	if not len(coords):
+		return [coords, offsets]
+
+	# A segment starts at every vertex except the last of each line
+
+	isSegmentStart = np.ones(len(coords), dtype=bool)
+	isSegmentStart[offsets[1:]-1] = False
+	segmentStarts = np.flatnonzero(isSegmentStart)
+
+	# Work on pieces of segments: which segment, the fractions along it where the piece starts and ends, and its end points
+
+	pieceSegments = np.arange(len(segmentStarts))
+	pieceTs = np.column_stack((np.zeros(len(segmentStarts)), np.ones(len(segmentStarts))))
+	pieceFroms = coords[segmentStarts]
+	pieceTos = coords[segmentStarts+1]
+
+	newSegments = [np.zeros(0, dtype=int)]
+	newTs = [np.zeros(0)]
+	newPoints = [np.zeros((0,2))]
+
+	for depth in range(maxDepth):
+
+		if not len(pieceSegments):
+			break
+
+		# Find each piece's midpoint, on the great circle or in RA/dec
+
+		if greatCircle:
+			middle = toUnitVectors(pieceFroms) + toUnitVectors(pieceTos)
+			middleRAs = np.degrees(np.arctan2(middle[:,1], middle[:,0]))
+			middleDecs = np.degrees(np.arctan2(middle[:,2], np.hypot(middle[:,0], middle[:,1])))
+			# Keep RA continuous with the piece, rather than wrapped to -180..180
+			middleRAs = pieceFroms[:,0] + (middleRAs - pieceFroms[:,0] + 180) % 360 - 180
+			middles = np.column_stack((middleRAs, middleDecs))
+		else:
+			middles = (pieceFroms + pieceTos)/2
+
+		# Project the ends and the middle, and measure how far the middle is from the chord between the ends
+
+		[fromXs, fromYs] = project(pieceFroms[:,0], pieceFroms[:,1])
+		[toXs, toYs] = project(pieceTos[:,0], pieceTos[:,1])
+		[middleXs, middleYs] = project(middles[:,0], middles[:,1])
+
+		chordXs = toXs-fromXs
+		chordYs = toYs-fromYs
+		chordLengths = np.hypot(chordXs, chordYs)
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			deviations = np.abs(chordXs*(middleYs-fromYs) - chordYs*(middleXs-fromXs)) / chordLengths
+		deviations = np.where(chordLengths>0, deviations, np.hypot(middleXs-fromXs, middleYs-fromYs))
+
+		split = deviations > tolerance
+
+		# Record the midpoints of split pieces as new vertices, and carry both halves on to the next round
+
+		middleTs = pieceTs[split].mean(axis=1)
+
+		newSegments.append(pieceSegments[split])
+		newTs.append(middleTs)
+		newPoints.append(middles[split])
+
+		pieceSegments = np.concatenate((pieceSegments[split], pieceSegments[split]))
+		pieceTs = np.concatenate((np.column_stack((pieceTs[split,0], middleTs)), np.column_stack((middleTs, pieceTs[split,1]))))
+		pieceFroms, pieceTos = np.concatenate((pieceFroms[split], middles[split])), np.concatenate((middles[split], pieceTos[split]))
+
+	newSegments = np.concatenate(newSegments)
+	newTs = np.concatenate(newTs)
+	newPoints = np.concatenate(newPoints)
+
+	# Put the new vertices in order along each segment, and insert them after the segment's start vertex
+
+	order = np.lexsort((newTs, newSegments))
+	newSegments = newSegments[order]
+	newPoints = newPoints[order]
+
+	added = np.bincount(newSegments, minlength=len(segmentStarts))
+	counts = np.ones(len(coords), dtype=int)
+	counts[segmentStarts] += added
+	newIndex = np.cumsum(counts) - counts
+
+	refinedCoords = np.empty((counts.sum(), 2))
+	refinedCoords[newIndex] = coords
+
+	firstOfSegment = np.cumsum(added) - added
+	rankInSegment = np.arange(len(newSegments)) - firstOfSegment[newSegments]
+	refinedCoords[newIndex[segmentStarts][newSegments] + 1 + rankInSegment] = newPoints
+
+	return [refinedCoords, np.concatenate(([0], np.cumsum(counts)))[offsets]]
+
+
+def simplifyRagged(coords, offsets, tolerance):
+	'''
+	Douglas-Peucker simplification of every line in a ragged buffer (see multiPolyline), all at once.
+
+	Every line is worked on in spans between kept vertices. Each round, every span still open finds its interior vertex furthest from
+	its chord, keeps it and splits there if it is further than tolerance, so all the lines are simplified together a level at a time.
+
+	The ends of each line are always kept. Closed lines (first vertex equal to last) always keep at least two more vertices
+	so they stay polygons. Returns the new [coords, offsets].
+	'''
+
+	if not len(coords):
+		return [coords, offsets]
+
+	keep = np.zeros(len(coords), dtype=bool)
+	lengths = np.diff(offsets)
+	keep[offsets[:-1][lengths>0]] = True
+	keep[offsets[1:][lengths>0]-1] = True
+
+	# Spans are [start, end] index pairs, starting with every line that has interior vertices
+
+	spanStarts = offsets[:-1][lengths>2]
+	spanEnds = offsets[1:][lengths>2]-1
+
+	# Closed lines are split twice regardless of tolerance: once at the vertex furthest from the start, then once more in each half
+
+	forced = np.all(coords[spanStarts]==coords[spanEnds], axis=1)
+	forcedRounds = 2
+
+	while len(spanStarts):
+
+		# Every interior vertex of every span, and the span it belongs to
+
+		interiorCounts = spanEnds-spanStarts-1
+		spanOfInterior = np.repeat(np.arange(len(spanStarts)), interiorCounts)
+		interior = gatherRanges(np.arange(len(coords)), spanStarts+1, spanEnds)
+
+		# Distance of each from its span's chord, or from its start if the chord has no length (a closed line)
+
+		froms = coords[spanStarts][spanOfInterior]
+		chords = (coords[spanEnds]-coords[spanStarts])[spanOfInterior]
+		relatives = coords[interior]-froms
+		chordLengths = np.hypot(chords[:,0], chords[:,1])
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			distances = np.abs(chords[:,0]*relatives[:,1] - chords[:,1]*relatives[:,0]) / chordLengths
+		distances = np.where(chordLengths>0, distances, np.hypot(relatives[:,0], relatives[:,1]))
+
+		# The furthest interior vertex of each span comes first once sorted by span, then by distance descending
+
+		order = np.lexsort((-distances, spanOfInterior))
+		firsts = order[np.cumsum(interiorCounts)-interiorCounts]
+		furthest = interior[firsts]
+
+		split = (distances[firsts] > tolerance) | (forced & (forcedRounds>0))
+		keep[furthest[split]] = True
+
+		# Split spans become two, and only those with interior vertices carry on
+
+		spanStarts, spanEnds = np.concatenate((spanStarts[split], furthest[split])), np.concatenate((furthest[split], spanEnds[split]))
+		forced = np.concatenate((forced[split], forced[split]))
+		forcedRounds -= 1
+
+		unfinished = spanEnds-spanStarts > 1
+		spanStarts = spanStarts[unfinished]
+		spanEnds = spanEnds[unfinished]
+		forced = forced[unfinished]
+
+	return [coords[keep], np.concatenate(([0], np.cumsum(keep)))[offsets]]
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
 # Defines the 'position' class which contains RA- and Dec- style coordinates, and a variety of functions to modify them.
 
 class position():
 	'''A class which contains coordinates={'Right Ascension':00.000,'Declination':00.000}, and several functions to modify these.'''
 
+	# Slots rather than a per-instance __dict__, since there can be millions of these
+
+	__slots__ = ('RA', 'dec')
+
 	def __init__(self, rightAscension, declination):
 
 		self.RA=rightAscension
@@ -49,29 +569,19 @@ class position():
 
 		return [self.RA, self.dec]
 
-	def isInsidePolyline(self, boundary):
+	def getCoordsAsArrays(self):
 		'''
-		Returns true if it falls within the boundary (a polyline) provided
+		Returns the coordinates of the position as a pair of one-element arrays [RAs, decs], for batched projection
 		'''
 
-		if boundary.isClosed():
-
-			nvert = len(boundary.vertices)
-			polyXs=[point.RA for point in boundary.vertices]
-			polyYs=[point.dec for point in boundary.vertices]
-
-			c=False
-			j=nvert-1
+		return [np.array([self.RA], dtype=float), np.array([self.dec], dtype=float)]
 
-			for i in range(nvert):
-				if ((polyYs[i]>self.dec) != (polyYs[j]>self.dec)) and (self.RA < ((polyXs[j]-polyXs[i]) * (self.dec-polyYs[i]) / (polyYs[j]-polyYs[i]) + polyXs[i]) ):
-					c = not c
-				j=i
-
-			if c:
-				return True
+	def isInsidePolyline(self, boundary):
+		'''
+		Returns true if it falls within the boundary (a polyline) provided
+		'''
 
-		return False
+		return bool(boundary.containsPoints([self.RA], [self.dec])[0])
 
 	# Self-modification functions
 
@@ -95,20 +605,19 @@ class position():
 		Stereo transforms from a RA Dec coordinate to a cartesian coordinate following a projection. 
 		'''
 
-		# TODO this is known to throw a /0 error for projecting from 0,0 for some reason
+		[projectedXs, projectedYs] = stereographic(*self.getCoordsAsArrays(), lonLatCentroid, R)
 
-		lon = math.radians(self.RA)
-		lat = math.radians(self.dec)
-		lonC = math.radians(lonLatCentroid.RA)
-		latC = math.radians(lonLatCentroid.dec)
+		self.setCoordsFromArrays(projectedXs, projectedYs)
 
-		k = 2*R / (1 + math.sin(latC)*math.sin(lat) + math.cos(latC)*math.cos(lat)*math.cos(lon-lonC))
+		return None
 
-		projectedX = k * math.cos(lat) * math.sin(lon-lonC)
-		projectedY = k * (math.cos(latC) * math.sin(lat) - math.sin(latC) * math.cos(lat) * math.cos(lon-lonC))
+	def setCoordsFromArrays(self, RAs, decs):
+		'''
+		Sets the coordinates of the position from a pair of one-element arrays, as returned by a batched projection
+		'''
 
-		self.RA=projectedX
-		self.dec=projectedY
+		self.RA=float(RAs[0])
+		self.dec=float(decs[0])
 
 		return None
 
@@ -117,118 +626,284 @@ class position():
 
 
 # Defines the polyline class which is collection of positions forming a line, along with a variety of functions to modify them.
-		
+# The positions are held as one Nx2 array of [RA, dec] rows rather than as position objects.
+
 class polyline():
-	'''A class which defines a line as a sequence of points, [position_1, position_2, ...], and several functions to modify these.'''
+	'''A class which defines a line as a sequence of points, held as an Nx2 array of [RA, dec] rows in self.coords, and several functions to modify these.'''
+
+	__slots__ = ('_coords', '_extents')
 
 	def __init__(self, vertexList):
 
-		self.vertices = vertexList
+		# vertexList may be a list of positions, a list of [RA, dec] pairs, or an Nx2 array
+
+		self.coords = toCoordArray(vertexList)
 
 	# Simple utility functions
 
+	@property
+	def coords(self):
+		'''
+		The vertices as an Nx2 array of [RA, dec] rows. Assigning new coords drops the cached extents.
+		'''
+
+		return self._coords
+
+	@coords.setter
+	def coords(self, coords):
+
+		self._coords = coords
+		self._extents = None
+
+	@property
+	def vertices(self):
+		'''
+		The vertices as a list of position objects. These are copies, so to change the line assign a new list (or change self.coords).
+		'''
+
+		return [position(RA, dec) for RA, dec in self.coords.tolist()]
+
+	@vertices.setter
+	def vertices(self, vertexList):
+
+		self.coords = toCoordArray(vertexList)
+
 	def isClosed(self):
 		'''
 		Checks whether or not the polyline forms a simple closed figure (first vertex is identical to last vertex), and there are at least 3 vertices.
 		'''
 
-		return len(self.vertices)>=3 and self.vertices[0].isIdentical(self.vertices[-1])
+		return len(self.coords)>=3 and bool((self.coords[0]==self.coords[-1]).all())
 
 	def isPopulated(self):
 		'''
-		Check whether there are any members in the self.vertices list.
+		Check whether there are any vertices.
 		'''
 
-		return len(self.vertices)
+		return len(self.coords)
 
 	def getCopy(self):
 		'''
 		Returns a copy of itself
 		'''
 
-		return line(self.vertices)
+		return polyline(self.coords.copy())
 
 	def getExtents(self):
 		'''
 		Returns its x and y extents as [[minX, maxX],[minY, maxY]] (maps to RA and Dec effectively)
+
+		The extents are worked out once and kept until the coords change.
+		'''
+
+		if self._extents is None:
+			[minRA, minDec] = self.coords.min(axis=0).tolist()
+			[maxRA, maxDec] = self.coords.max(axis=0).tolist()
+			self._extents = [[minRA, maxRA], [minDec, maxDec]]
+
+		return [list(self._extents[0]), list(self._extents[1])]
+
+	def getCoordsAsArrays(self):
+		'''
+		Returns the coordinates of its vertices as a pair of arrays [RAs, decs]
 		'''
 
-		RAs = [vertex.RA for vertex in self.vertices]
-		decs = [vertex.dec for vertex in self.vertices]
+		return [self.coords[:,0], self.coords[:,1]]
 
-		return [[min(RAs), max(RAs)], [min(decs), max(decs)]]
+	def containsPoints(self, RAs, decs):
+		'''
+		Returns a boolean array, true for each point (RAs[n], decs[n]) which falls within this polyline.
 
+		Uses the same even-odd ray casting rule as a single position would, but walks the polyline's edges once for all N points together.
+		Always false if the polyline is not closed.
+		'''
 
+		RAs = np.asarray(RAs, dtype=float)
+		decs = np.asarray(decs, dtype=float)
 
-	# Self-modification functions
+		inside = np.zeros(RAs.shape, dtype=bool)
 
-	def scaleAndCentre(self, scalefunc, centre):
+		if not self.isClosed():
+			return inside
+
+		[polyXs, polyYs] = self.getCoordsAsArrays()
+
+		# Edges with no vertical extent never cross a ray, so their division by zero is masked off anyway
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			j=len(polyXs)-1
+			for i in range(len(polyXs)):
+				crosses = (polyYs[i]>decs) != (polyYs[j]>decs)
+				crosses &= RAs < ((polyXs[j]-polyXs[i]) * (decs-polyYs[i]) / (polyYs[j]-polyYs[i]) + polyXs[i])
+				inside ^= crosses
+				j=i
+
+		return inside
+
+	def containsBoxes(self, boxes):
 		'''
-		Scales and centres the coordinates of its vertices, given a scale function 'scalefunc' and the old centroid 'centre'.
+		Returns a boolean array, true for each box [minRA, maxRA, minDec, maxDec] (a row of boxes) which lies wholly within this polyline.
 
-		scalefunc is a linear interpolator function made with makeInterpolator.
+		A box is wholly inside if its four corners are inside, none of our vertices fall inside or on it, and none of our edges touch its edges.
+		Anything touching the boundary counts as not wholly inside, so callers can fall back to testing points one by one.
+		'''
 
-		centre is a position object.
+		return self.classifyBoxes(boxes)[0]
+
+	def missesBoxes(self, boxes):
 		'''
+		Returns a boolean array, true for each box [minRA, maxRA, minDec, maxDec] (a row of boxes) which lies wholly outside this polyline.
 
-		for vertex in self.vertices:
+		The mirror of containsBoxes: all four corners outside, and nothing of ours inside or touching it.
+		'''
 
-			vertex.scaleAndCentre(scalefunc,centre)
+		return self.classifyBoxes(boxes)[1]
 
-		return None
+	def classifyBoxes(self, boxes):
+		'''
+		Returns [within, clear], two boolean arrays with an entry for each box [minRA, maxRA, minDec, maxDec] (a row of boxes):
+		true where the box lies wholly within this polyline (see containsBoxes), and true where it lies wholly outside (see missesBoxes).
 
-	def interpolate(self, nodesPerUnit):
+		Nothing is within a polyline which is not closed, so then every box is clear.
 		'''
-		Interpolates naive straight lines between existing vertices and splits them into new vertices.
 
-		Aims to keep roughly nodesPerUnit nodes per unit of distance.
+		boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
 
-		Keeps start and end nodes of each line as they are so corners remain in the same place.
+		within = np.zeros(len(boxes), dtype=bool)
+		clear = np.ones(len(boxes), dtype=bool)
+
+		if not self.isClosed() or not len(boxes):
+			return [within, clear]
+
+		# Boxes clear of our extents are outside without any further tests
+
+		[[polyMinRA, polyMaxRA], [polyMinDec, polyMaxDec]] = self.getExtents()
+		[minRA, maxRA, minDec, maxDec] = boxes.T
+		near = np.flatnonzero(~((maxRA<polyMinRA) | (minRA>polyMaxRA) | (maxDec<polyMinDec) | (minDec>polyMaxDec)))
+
+		# Count how many corners of the rest are inside, and whether anything of ours touches them
+
+		[minRA, maxRA, minDec, maxDec] = boxes[near].T
+		corners = self.containsPoints(minRA, minDec)*1 + self.containsPoints(maxRA, minDec) + self.containsPoints(maxRA, maxDec) + self.containsPoints(minRA, maxDec)
+		touches = self.touchesBoxes(boxes[near])
+
+		within[near] = (corners==4) & ~touches
+		clear[near] = (corners==0) & ~touches
+
+		return [within, clear]
+
+	def touchesBoxes(self, boxes):
 		'''
+		Returns a boolean array, true for each box [minRA, maxRA, minDec, maxDec] (a row of boxes) which any of our vertices fall inside or on,
+		or any of our edges touch.
+		'''
+
+		[minRA, maxRA, minDec, maxDec] = np.asarray(boxes, dtype=float).reshape(-1, 4).T
+
+		# Any of our vertices inside or on the box (vertices x boxes)
 
-		# Goes around the polyline in order enumerating pairs of points, interpolating, and recording the new vertices
+		[polyXs, polyYs] = self.getCoordsAsArrays()
+		X = polyXs[:,None]
+		Y = polyYs[:,None]
+		touches = ((minRA<=X) & (X<=maxRA) & (minDec<=Y) & (Y<=maxDec)).any(axis=0)
 
-		interpolatedVertices=[]
+		# Any of our edges touching any of the box's four edges (edges x boxes, per box side)
 
-		for index, vertex in enumerate(self.vertices):
+		ax, ay, bx, by = polyXs[:-1,None], polyYs[:-1,None], polyXs[1:,None], polyYs[1:,None]
+		for (cx, cy, dx, dy) in ((minRA, minDec, maxRA, minDec), (maxRA, minDec, maxRA, maxDec), (maxRA, maxDec, minRA, maxDec), (minRA, maxDec, minRA, minDec)):
+			touches |= segmentsTouch(ax, ay, bx, by, cx, cy, dx, dy).any(axis=0)
 
-			if index==len(self.vertices)-1: 
-				# Add in the final point
-				interpolatedVertices.append(vertex)
-				break
+		return touches
 
-			# Get the next position in the line.
+	def getConvexPieces(self):
+		'''
+		Returns the area this closed polyline encloses as a list of convex pieces, each an Nx2 array of its vertices running anticlockwise, not closed.
+
+		A convex polyline is one piece, anything else is cut into triangles by clipping off ears, one at a time.
+		'''
 
-			other = self.vertices[index+1]
+		ring = self.coords[:-1]
 
-			# Build interpolation functions between the two points.
+		# Run anticlockwise, so every piece's inside is to the left of its edges
 
-			xInterp = makeInterpolator([0,1],[vertex.RA,other.RA])
-			yInterp = makeInterpolator([0,1],[vertex.dec,other.dec])
+		if np.sum(ring[:,0]*np.roll(ring[:,1], -1) - np.roll(ring[:,0], -1)*ring[:,1]) < 0:
+			ring = ring[::-1]
 
-			# Work out how many points to place in between, keeping the end nodes as they are (in order to maintain sharp corners if required)
+		def getTurns(points):
+			[edgeXs, edgeYs] = (np.roll(points, -1, axis=0) - points).T
+			return edgeXs*np.roll(edgeYs, -1) - edgeYs*np.roll(edgeXs, -1)
 
-			distance = vertex.getDiagonalDistance(other)
-			numPoints = round(nodesPerUnit * distance)
+		if np.all(getTurns(ring) >= 0):
+			return [ring]
 
-			# We include the start point as a vertex
+		pieces = []
+		remaining = list(range(len(ring)))
 
-			interpolatedVertices.append(vertex)
+		while len(remaining) > 3:
+			points = ring[remaining]
+			turns = np.roll(getTurns(points), 1) # turns[k] is the turn made at points[k]
+			for k in np.flatnonzero(turns > 0).tolist():
 
-			if numPoints > 2:
+				# An ear is a left turn whose triangle has none of the other vertices in or on it
 
-				# Get fractions of 1 representing even divisions of numPoints-1 parts .|.|.|.|.|.|.|. etc, but no 0/numpoints or numpoints/numpoints
+				triangle = points[[k-1, k, (k+1)%len(points)]]
+				others = np.delete(points, [k-1, k, (k+1)%len(points)], axis=0)
+				sides = [(b[0]-a[0])*(others[:,1]-a[1]) - (b[1]-a[1])*(others[:,0]-a[0]) for a, b in zip(triangle, np.roll(triangle, -1, axis=0))]
+				if not np.any((sides[0]>=0) & (sides[1]>=0) & (sides[2]>=0)):
+					pieces.append(triangle)
+					del remaining[k]
+					break
+			else:
+				# Nothing left but slivers, which enclose nothing
+				return pieces
 
-				fracs = [float(n/(numPoints-1)) for n in range(1,numPoints-1)]
+		return pieces + [ring[remaining]]
 
-				for place in fracs:
+	# Self-modification functions
+
+	def scaleAndCentre(self, scalefunc, centre):
+		'''
+		Scales and centres the coordinates of its vertices, given a scale function 'scalefunc' and the old centroid 'centre'.
 
-					newVertex=position(xInterp(place), yInterp(place))
-					interpolatedVertices.append(newVertex)
+		scalefunc is a linear interpolator function made with makeInterpolator.
 
-		# Update the vertex list to the newly interpolated version
+		centre is a position object.
+		'''
 
-		self.vertices=interpolatedVertices
+		self.coords = scalefunc(self.coords - [centre.RA, centre.dec])
+
+		return None
+
+	def interpolate(self, nodesPerUnit):
+		'''
+		Interpolates naive straight lines between existing vertices and splits them into new vertices.
+
+		Aims to keep roughly nodesPerUnit nodes per unit of distance.
+
+		Keeps start and end nodes of each line as they are so corners remain in the same place.
+		'''
+
+		[self.coords, offsets] = interpolateRagged(self.coords, np.array([0, len(self.coords)]), nodesPerUnit)
+
+		return None
+
+	def refine(self, project, tolerance, greatCircle=True):
+		'''
+		Adaptively adds vertices only where the line would visibly kink once projected (see refineRagged).
+
+		project maps arrays of RAs and decs to output units, and tolerance is the largest allowed chord deviation in those units.
+		'''
+
+		[self.coords, offsets] = refineRagged(self.coords, np.array([0, len(self.coords)]), project, tolerance, greatCircle)
+
+		return None
+
+	def simplify(self, tolerance):
+		'''
+		Removes vertices which lie within tolerance of the line without them (see simplifyRagged), keeping the ends where they are.
+		'''
+
+		[self.coords, offsets] = simplifyRagged(self.coords, np.array([0, len(self.coords)]), tolerance)
 
 		return None
 
@@ -237,9 +912,18 @@ class polyline():
 		Stereo transforms from a RA Dec coordinate to a cartesian coordinate following a projection. 
 		'''
 
-		for point in self.vertices:
+		[projectedXs, projectedYs] = stereographic(*self.getCoordsAsArrays(), lonLatCentroid, R)
 
-			point.stereoProject(lonLatCentroid, R)
+		self.setCoordsFromArrays(projectedXs, projectedYs)
+
+		return None
+
+	def setCoordsFromArrays(self, RAs, decs):
+		'''
+		Sets the coordinates of its vertices from a pair of arrays [RAs, decs], one entry per vertex, e.g. after a batched projection
+		'''
+
+		self.coords = np.column_stack((RAs, decs)).astype(float, copy=False)
 
 		return None
 
@@ -248,7 +932,7 @@ class polyline():
 		Prunes positions in its vertices to include only those that fall within the boundary.
 		'''
 
-		self.vertices = list(filter(lambda x: x.isInsidePolyline(boundary),self.vertices))
+		self.coords = self.coords[boundary.containsPoints(*self.getCoordsAsArrays())]
 
 		return None
 
@@ -257,38 +941,37 @@ class polyline():
 		Returns a list of polylines that are distinct sections of the previous whole polyline, after checking against a boundary.
 		'''
 
-		# Check which of our vertices fall within the boundary
-		validVertices = list(map(lambda x: x.isInsidePolyline(boundary),self.vertices))
-		# Replace valid instances with the str of the index of that vertex, otherwise '.', concated as a string
-		for index, value in enumerate(validVertices): validVertices[index]=str(index) if value else '.'
-		# ['32','33','.','45','46']
-		# Join the string with whitespace and then split the string on '.'
-		validVertices=' '.join(validVertices).split('.')
-		# ['32 33 . 45 46']
-		# ['32 33 ',' 45 46']
-		for index, seq in enumerate(validVertices):
-			temp=seq.split(' ')
-			# [['32','33', ''],['', 45','46']]
-			temp=list(filter(lambda x : x!='', temp))
-			validVertices[index]=temp
-			# [['32','33'],['45','46']]
-		# Go through the resulting list and use it to populate a list of valid components
-		components=[]
-		for sublist in validVertices:
-			if len(sublist)>1:
-				sub=[]
-				for i in sublist:
-					sub.append(self.vertices[int(i)])
-				components.append(polyline(sub))
-			continue
-
-		return components
+		# Check which of our vertices fall within the boundary, all at once
+
+		return self.getCutComponents(boundary.containsPoints(*self.getCoordsAsArrays()))
+
+	def getClippedComponents(self, boundary):
+		'''
+		Returns a list of polylines that are the sections of this polyline inside the boundary, clipped exactly where they cross it.
+		'''
+
+		[coords, offsets] = clipRagged(self.coords, np.array([0, len(self.coords)]), boundary)
+
+		return [polyline(coords[start:stop]) for start, stop in zip(offsets[:-1], offsets[1:])]
+
+	def getCutComponents(self, inside):
+		'''
+		Returns a list of polylines made of the runs of consecutive vertices for which inside (a boolean array) is true.
+
+		Runs of a single vertex are dropped, since they cannot form a line.
+		'''
+
+		[coords, offsets] = cutRagged(self.coords, np.array([0, len(self.coords)]), inside)
+
+		return [polyline(coords[start:stop]) for start, stop in zip(offsets[:-1], offsets[1:])]
 
 
 ##--------------------------------------------------------------------------------------------------------------------------------##
 
 
 # Defines the multiPolyline class which is a collection of independent polyLines, suitable for a RADEC grid or a constellation.
+# All the vertices live in one coordinate buffer, with an offsets array marking where each polyline starts and stops (a ragged layout),
+# so every operation on the collection is a single array operation.
 
 class multiPolyline():
 	''' A class which defines a collection of independent polylines and several functions to modify them. ''' 
@@ -296,39 +979,127 @@ class multiPolyline():
 
 	def __init__(self, polyLineList):
 
+		# self.coords holds every vertex as [RA, dec] rows; polyline n is self.coords[self.offsets[n]:self.offsets[n+1]]
+
 		self.collection = polyLineList
 
 	# Simple utility functions
 
+	@property
+	def coords(self):
+		'''
+		Every vertex of every member as [RA, dec] rows. Assigning new coords drops the cached member boxes and their boxTree.
+		'''
+
+		return self._coords
+
+	@coords.setter
+	def coords(self, coords):
+
+		self._coords = coords
+		self.memberBoxes = None
+		self.memberTree = None
+
+	@property
+	def collection(self):
+		'''
+		The member polylines as a list. Each one's coords are a view into the shared buffer.
+		'''
+
+		return [polyline(self.coords[start:stop]) for start, stop in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+	@collection.setter
+	def collection(self, polyLineList):
+
+		polyLineList = list(polyLineList)
+		lengths = [len(line.coords) for line in polyLineList]
+
+		self.setBuffer(np.concatenate([line.coords for line in polyLineList]) if polyLineList else np.zeros((0,2)),
+			np.concatenate(([0], np.cumsum(lengths, dtype=int))))
+
 	def getCopy(self):
 		'''
 		Returns a copy of itself
 		'''
-		return multiPolyLine(self.collection)
+
+		newCopy = multiPolyline([])
+		newCopy.setBuffer(self.coords.copy(), self.offsets.copy())
+
+		return newCopy
 
 	def isPopulated(self):
 		'''
-		Check whether there are any members in the self.collection list.
+		Check whether there are any members in the collection.
 		'''
 
-		return len(self.collection)
+		return len(self.offsets)-1
+
+	def getLineLengths(self):
+		'''
+		Returns an array holding the number of vertices in each member polyline
+		'''
+
+		return np.diff(self.offsets)
 
 	def getExtents(self):
 		'''
 		Returns its x and y extents as [[minX, maxX],[minY, maxY]] (maps to RA and Dec effectively)
 		'''
 
-		childExtents = [child.getExtents() for child in self.collection]
+		boxes = self.getMemberBoxes()
+
+		# Empty members have inverted boxes, which never set a minimum or a maximum
+
+		return [[boxes[:,0].min().item(), boxes[:,1].max().item()],[boxes[:,2].min().item(), boxes[:,3].max().item()]]
+
+	def getMemberBoxes(self):
+		'''
+		Returns the extents of each member polyline as rows of [minRA, maxRA, minDec, maxDec].
+
+		Empty members get an inverted box [inf, -inf, inf, -inf], which lies outside every boundary
+		and adds nothing to any box put around it (see boxTree).
 
-		# Each extent looks like: [[min(RAs), max(RAs)], [min(Decs), max(Decs)]]
+		The boxes are worked out once, all together, and kept until the coords change.
+		'''
+
+		if self.memberBoxes is None:
+			lengths = self.getLineLengths()
+			starts = self.offsets[:-1][lengths>0]
+			boxes = np.tile([np.inf, -np.inf, np.inf, -np.inf], (len(lengths), 1))
+			if len(starts):
+				boxes[lengths>0] = np.column_stack((np.minimum.reduceat(self.coords[:,0], starts), np.maximum.reduceat(self.coords[:,0], starts),
+					np.minimum.reduceat(self.coords[:,1], starts), np.maximum.reduceat(self.coords[:,1], starts)))
+			self.memberBoxes = boxes
+
+		return self.memberBoxes
 
-		minRA= min([extent[0][0] for extent in childExtents])
-		maxRA= max([extent[0][1] for extent in childExtents])
+	def getMemberTree(self):
+		'''
+		Returns a boxTree over the member boxes, built on first use and kept until the coords change.
+		'''
 
-		minDec= min([extent[1][0] for extent in childExtents])
-		maxDec= max([extent[1][1] for extent in childExtents])
+		if self.memberTree is None:
+			self.memberTree = boxTree(self.getMemberBoxes())
 
-		return [[minRA, maxRA],[minDec, maxDec]]
+		return self.memberTree
+
+	def getContainment(self, boundary):
+		'''
+		Returns a boolean array with an entry per vertex, true where it falls within the boundary.
+
+		Members whose boxes lie wholly inside or outside the boundary are settled all at once through the member boxTree,
+		and only the vertices of members crossing it are tested one by one.
+		'''
+
+		[inside, crossing] = self.getMemberTree().query(boundary)
+
+		memberOfVertex = np.repeat(np.arange(len(inside)), self.getLineLengths())
+		containment = inside[memberOfVertex]
+
+		toTest = np.flatnonzero(crossing[memberOfVertex])
+		containment[toTest] = boundary.containsPoints(self.coords[toTest,0], self.coords[toTest,1])
+
+		return containment
 
 	def getCentre(self):
 		'''
@@ -339,8 +1110,34 @@ class multiPolyline():
 
 		return position((minRA+(maxRA-minRA)/2),(minDec+(maxDec-minDec)/2))
 
+	def getCoordsAsArrays(self):
+		'''
+		Returns the coordinates of every vertex of every polyline in the collection, in order, as a pair of arrays [RAs, decs]
+		'''
+
+		return [self.coords[:,0], self.coords[:,1]]
+
+	def getContainmentByLine(self, boundary):
+		'''
+		Tests every vertex of every polyline in the collection against the boundary in a single batch.
+
+		Returns a list holding one boolean array per polyline, true where that vertex falls within the boundary.
+		'''
+
+		return np.split(self.getContainment(boundary), self.offsets[1:-1])
+
 	# Self-modification functions
 
+	def setBuffer(self, coords, offsets):
+		'''
+		Replaces the whole collection with a new coordinate buffer and offsets array.
+		'''
+
+		self.coords = np.asarray(coords, dtype=float).reshape(-1,2)
+		self.offsets = np.asarray(offsets, dtype=int)
+
+		return None
+
 	def scaleAndCentre(self, scalefunc, centre):
 		'''
 		Scales and centres the coordinates of its vertices, given a scale function 'scalefunc' and the old centroid 'centre'.
@@ -350,9 +1147,7 @@ class multiPolyline():
 		centre is a position object.
 		'''
 
-		for line in self.collection:
-
-			line.scaleAndCentre(scalefunc, centre)
+		self.coords = scalefunc(self.coords - [centre.RA, centre.dec])
 
 		return None
 
@@ -365,9 +1160,27 @@ class multiPolyline():
 		Keeps start and end nodes of each line as they are so corners remain in the same place.
 		'''
 
-		for line in self.collection:
+		self.setBuffer(*interpolateRagged(self.coords, self.offsets, nodesPerUnit))
 
-			line.interpolate(nodesPerUnit)
+		return None
+
+	def refine(self, project, tolerance, greatCircle=True):
+		'''
+		Adaptively adds vertices to every polyline only where it would visibly kink once projected (see refineRagged).
+
+		project maps arrays of RAs and decs to output units, and tolerance is the largest allowed chord deviation in those units.
+		'''
+
+		self.setBuffer(*refineRagged(self.coords, self.offsets, project, tolerance, greatCircle))
+
+		return None
+
+	def simplify(self, tolerance):
+		'''
+		Removes vertices from every polyline which lie within tolerance of the line without them (see simplifyRagged).
+		'''
+
+		self.setBuffer(*simplifyRagged(self.coords, self.offsets, tolerance))
 
 		return None
 
@@ -376,9 +1189,18 @@ class multiPolyline():
 		Stereo transforms from a RA Dec coordinate to a cartesian coordinate following a projection. 
 		'''
 
-		for line in self.collection:
+		[projectedXs, projectedYs] = stereographic(*self.getCoordsAsArrays(), lonLatCentroid, R)
+
+		self.setCoordsFromArrays(projectedXs, projectedYs)
 
-			line.stereoProject(lonLatCentroid, R)
+		return None
+
+	def setCoordsFromArrays(self, RAs, decs):
+		'''
+		Sets the coordinates of every vertex in the collection from a pair of arrays, in the order given by getCoordsAsArrays
+		'''
+
+		self.coords = np.column_stack((RAs, decs)).astype(float, copy=False)
 
 		return None
 
@@ -388,12 +1210,14 @@ class multiPolyline():
 		Removes the polyline completely if it is unpopulated after filtering (no part of it falls within the boundary)
 		'''
 
-		newCollection = []
-		for line in self.collection:
-			line.filter(boundary)
-			if line.isPopulated():
-				newCollection.append(line)
-		self.collection=newCollection
+		inside = self.getContainment(boundary)
+
+		# Count the surviving vertices of each polyline, and drop the polylines left with none
+
+		kept = np.concatenate(([0], np.cumsum(inside)))
+		counts = kept[self.offsets[1:]] - kept[self.offsets[:-1]]
+
+		self.setBuffer(self.coords[inside], np.concatenate(([0], np.cumsum(counts[counts>0]))))
 
 		return None
 
@@ -401,13 +1225,75 @@ class multiPolyline():
 		'''
 		Prunes polylines in its collection, and splits them into sublines if necessary
 		'''
-		newCollection = []
-		for line in self.collection:
-			lineList=line.getFilterCutComponents(boundary)
-			for subline in lineList:
-				newCollection.append(subline)
-		self.collection=newCollection
+
+		self.setBuffer(*cutRagged(self.coords, self.offsets, self.getContainment(boundary)))
+
+		return None
+
+	def dropDistantMembers(self, boundary):
+		'''
+		Drops the polylines in its collection whose great circle arcs all stay clear of the spherical cap around the boundary (see getCap),
+		so they can't reach it along any path they are refined to. Tested on the arcs rather than on boxes, since an arc can bow out
+		well beyond the box around its ends.
+		'''
+
+		outline = boundary.getCopy()
+		outline.interpolate(1.0)
+		[centre, radius] = getCap(outline.coords)
+
+		distances = getArcDistances(self.coords, self.offsets, centre)
+
+		# Find each member's nearest arc, members of a single vertex being as far as that vertex
+
+		lineOfVertex = np.repeat(np.arange(len(self.offsets)-1), np.diff(self.offsets))
+		isSegmentStart = np.ones(len(self.coords), dtype=bool)
+		isSegmentStart[self.offsets[1:]-1] = False
+
+		nearest = np.full(len(self.offsets)-1, np.inf)
+		np.minimum.at(nearest, lineOfVertex[isSegmentStart], distances)
+		np.minimum.at(nearest, lineOfVertex, np.arccos(np.clip(toUnitVectors(self.coords)@centre, -1, 1)))
+		kept = nearest <= radius
+
+		starts = self.offsets[:-1][kept]
+		stops = self.offsets[1:][kept]
+		self.setBuffer(self.coords[gatherRanges(np.arange(len(self.coords)), starts, stops)], np.concatenate(([0], np.cumsum(stops-starts))))
+
+		return None
+
+	def clip(self, boundary):
+		'''
+		Clips polylines in its collection exactly against the boundary, splitting them into sublines where they leave and re-enter it.
+		The sublines end precisely on the boundary, so no densifying is needed to make them reach it.
+		'''
+
+		# Members wholly outside can be dropped before clipping
+
+		[inside, crossing] = self.getMemberTree().query(boundary)
+		kept = inside | crossing
+
+		starts = self.offsets[:-1][kept]
+		stops = self.offsets[1:][kept]
+		coords = self.coords[gatherRanges(np.arange(len(self.coords)), starts, stops)]
+
+		self.setBuffer(*clipRagged(coords, np.concatenate(([0], np.cumsum(stops-starts))), boundary))
 
 		return None
 
+	def clipPolygons(self, boundary):
+		'''
+		Clips the members of its collection as filled polygons against the boundary (see clipPolygonsRagged), rather than as lines,
+		so each keeps the part of its area inside the boundary, edged by the boundary where it was cut.
+		'''
+
+		# Members wholly outside can be dropped before clipping
+
+		[inside, crossing] = self.getMemberTree().query(boundary)
+		kept = inside | crossing
 
+		starts = self.offsets[:-1][kept]
+		stops = self.offsets[1:][kept]
+		coords = self.coords[gatherRanges(np.arange(len(self.coords)), starts, stops)]
+
+		self.setBuffer(*clipPolygonsRagged(coords, np.concatenate(([0], np.cumsum(stops-starts))), boundary))
+
+		return None
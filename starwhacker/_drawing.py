@@ -8,6 +8,7 @@ from starwhacker._tools import makeInterpolator, clamp, getStarSize
 
 import math
 import json
+import numpy as np
 import os 
 from PIL import Image, ImageDraw, ImageFont
 import datetime
@@ -46,18 +47,18 @@ class drawing():
 
 		# Draw in the board bounded by boundary, in black.
 
-		self.drawPolygon(draw, scaleX, scaleY, self.sky.objects['boundary'].vertices, (10,10,20))
+		self.drawPolygon(draw, scaleX, scaleY, self.sky.objects['boundary'].coords, (10,10,20))
 
 		# Draw in the galactic background (which is copper covered in mask, so underneath all other elements)
 
 		for blob in self.sky.objects['galaxy'].collection:
-			if len(blob.vertices)>2:
-				self.drawPolygon(draw, scaleX, scaleY, blob.vertices, (30,30,10))
+			if len(blob.coords)>2:
+				self.drawPolygon(draw, scaleX, scaleY, blob.coords, (30,30,10))
 
 		# Draw in the radec grid crosses in white (silkscreen) (do it first because silkscreen is subtracted from mask)
 
 		for pl in self.sky.objects['grid'].collection:
-			self.drawLine(draw, scaleX, scaleY, pl.vertices, 'white', 4)
+			self.drawLine(draw, scaleX, scaleY, pl.coords, 'white', 4)
 
 		# Draw constellations in gold, like the stars 
 
@@ -68,7 +69,7 @@ class drawing():
 					w=1
 					fntsize=36
 				for line in con.collection:
-					self.drawLine(draw, scaleX, scaleY, line.vertices, 'GoldenRod', math.ceil(w*self.pixelsPerMm))
+					self.drawLine(draw, scaleX, scaleY, line.coords, 'GoldenRod', math.ceil(w*self.pixelsPerMm))
 				fnt = ImageFont.truetype("arial.ttf", fntsize)
 				# Get the centre of the visible constellation, and type the name there.
 				cen=con.getCentre()
@@ -89,12 +90,12 @@ class drawing():
 
 	def drawPolygon(self, draw, scaleX, scaleY, _object, fill):
 		'''
-		Draws a filled polygon in the final image, using the elements of _object as vertices.
+		Draws a filled polygon in the final image, using the rows of _object (an Nx2 array) as vertices.
 		'''
 
 		xy=[]
-		for index, point in enumerate(_object):
-				xy.append((round(scaleX(point.RA)*self.pixelsPerMm), round(scaleY(point.dec)*self.pixelsPerMm)))
+		for index, [RA, dec] in enumerate(_object.tolist()):
+				xy.append((round(scaleX(RA)*self.pixelsPerMm), round(scaleY(dec)*self.pixelsPerMm)))
 
 		draw.polygon(xy, fill=fill)
 
@@ -106,15 +107,17 @@ class drawing():
 		Draws a line in the final image for every element of the list. _object
 		'''
 
-		# We will always be passed a list of positions
+		# We will always be passed an Nx2 array of [x, y] rows
 
-		for index, point in enumerate(_object):
+		_object = _object.tolist()
+
+		for index, [RA, dec] in enumerate(_object):
 			if index < len(_object)-1:
-				x1 = round(scaleX(point.RA)*self.pixelsPerMm)
-				y1 = round(scaleY(point.dec)*self.pixelsPerMm)
-				end = _object[index+1]
-				x2 = round(scaleX(end.RA)*self.pixelsPerMm)
-				y2 = round(scaleY(end.dec)*self.pixelsPerMm)
+				x1 = round(scaleX(RA)*self.pixelsPerMm)
+				y1 = round(scaleY(dec)*self.pixelsPerMm)
+				[endRA, endDec] = _object[index+1]
+				x2 = round(scaleX(endRA)*self.pixelsPerMm)
+				y2 = round(scaleY(endDec)*self.pixelsPerMm)
 
 				colour=col
 				if dashed:
@@ -129,20 +132,22 @@ class drawing():
 		Draws a star in the final image as an anular ring or circle.
 		'''
 
-		# Get the range of properties for the stars.
+		# Get the range of properties for the stars. _object is a starTable, so these are whole columns.
 
-		mags = [body.mag for body in _object]
-		# BVs = [body.BV for body in _object]
+		mags = _object.mag
+		# BVs = _object.BV
 
 		# Magnitude maps to size (and shape) (BV maps to colour (in images only), not used)
 		ringmin=.8 # diameter in mm
 		ringmax=4
-		starScale = makeInterpolator([max(mags),min(mags)], [ringmin, ringmax])
+		starScale = makeInterpolator([mags.max(),mags.min()], [ringmin, ringmax])
+
+		# Scale every star position in one go, and round to the nearest pixel
 
-		for body in _object:
+		starPosxs = np.round(scaleX(_object.RA)*self.pixelsPerMm)
+		starPosys = np.round(scaleY(_object.dec)*self.pixelsPerMm)
 
-			starPosx = round(scaleX(body.RA)*self.pixelsPerMm)
-			starPosy = round(scaleY(body.dec)*self.pixelsPerMm)
+		for body, starPosx, starPosy in zip(_object, starPosxs, starPosys):
 
 			[padSize, holeSize] = getStarSize(body, starScale)
 			padSize=padSize*self.pixelsPerMm
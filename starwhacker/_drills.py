@@ -0,0 +1,170 @@
+# _drills.py
+
+# Plans the order holes are drilled in: grouped by tool, each group toured by nearest neighbour and then improved by 2-opt,
+# so the spindle moves from hole to nearby hole rather than back and forth across the board.
+
+# imports
+
+import math
+import numpy as np
+
+from starwhacker._spatial import pointGrid
+
+def getTravel(xs, ys, order, start=(0.0, 0.0)):
+	'''
+	Returns the distance travelled from start through the points (xs, ys) in order.
+	'''
+
+	pathXs = np.concatenate(([start[0]], np.asarray(xs, dtype=float)[order]))
+	pathYs = np.concatenate(([start[1]], np.asarray(ys, dtype=float)[order]))
+
+	return float(np.hypot(np.diff(pathXs), np.diff(pathYs)).sum())
+
+def makeGrid(xs, ys, pointsPerCell=2):
+	'''
+	Returns a pointGrid over the points (xs, ys), with cells sized to hold about pointsPerCell points each.
+
+	Cells are never narrower than the points' longer extent shared between them, so points in a line (or all in one place)
+	still get about len(xs)/pointsPerCell cells, rather than a grid sized for an area that isn't there.
+	'''
+
+	[width, height] = [float(np.ptp(xs)), float(np.ptp(ys))]
+	share = pointsPerCell/len(xs)
+
+	return pointGrid(xs, ys, max(math.sqrt(width*height*share), max(width, height)*share) or 1.0)
+
+def makeNearestNeighbourTour(xs, ys, grid, start):
+	'''
+	Returns an order for the points (xs, ys) which goes from start to the nearest point, then the nearest point not yet visited, and so on.
+
+	Each search looks at the grid's cells within some reach, doubling it until the nearest point found is within reach,
+	so nothing further out could be nearer.
+	'''
+
+	count = len(xs)
+	remaining = np.ones(count, dtype=bool)
+	order = np.zeros(count, dtype=int)
+	farthest = math.hypot(grid.columns, grid.rows)*grid.cellSize
+
+	[x, y] = start
+
+	for step in range(count):
+
+		reach = grid.cellSize
+		while True:
+			candidates = grid.getNearby(x, y, reach)
+			candidates = candidates[remaining[candidates]]
+			if len(candidates):
+				distances = np.hypot(xs[candidates]-x, ys[candidates]-y)
+				nearest = int(np.argmin(distances))
+				if distances[nearest] <= reach:
+					break
+			if reach > farthest + math.hypot(x-grid.minX, y-grid.minY):
+				break
+			reach *= 2
+
+		point = int(candidates[nearest])
+		order[step] = point
+		remaining[point] = False
+		[x, y] = [xs[point], ys[point]]
+
+	return order
+
+def getNeighbours(xs, ys, grid, count=8):
+	'''
+	Returns, for every point (xs, ys), a list of up to count of the points nearest it, from those within two of the grid's cells of it.
+	'''
+
+	[firsts, seconds, distances] = grid.getPairs(2*grid.cellSize)
+
+	# Every pair counts for both of its points; rank each point's partners by distance and keep the nearest
+
+	[points, partners, distances] = [np.concatenate((firsts, seconds)), np.concatenate((seconds, firsts)), np.concatenate((distances, distances))]
+	order = np.lexsort((distances, points))
+	[points, partners] = [points[order], partners[order]]
+
+	counts = np.bincount(points, minlength=len(xs))
+	ranks = np.arange(len(points)) - np.repeat(np.cumsum(counts)-counts, counts)
+	nearest = ranks < count
+
+	return [group.tolist() for group in np.split(partners[nearest], np.cumsum(np.minimum(counts, count))[:-1])]
+
+def improveTour(xs, ys, order, neighbours, passes=8):
+	'''
+	Improves an open tour (order, of the points (xs, ys)) by 2-opt: reversing a stretch of it wherever that shortens it.
+
+	Only moves joining a point to one of its neighbours (see getNeighbours) are tried, and passes are made until none help.
+	'''
+
+	order = np.array(order)
+	count = len(order)
+	positions = np.empty(count, dtype=int)
+	positions[order] = np.arange(count)
+
+	[xs, ys] = [xs.tolist(), ys.tolist()]
+	hypot = math.hypot
+
+	for _ in range(passes):
+
+		improved = False
+
+		for i in range(count-1):
+			a = int(order[i])
+			for c in neighbours[a]:
+
+				# Reverse order[i+1:j+1], so a is followed by c, and the old successor of a by the old successor of c
+
+				j = int(positions[c])
+				if j <= i+1:
+					continue
+
+				b = int(order[i+1])
+				gain = hypot(xs[a]-xs[b], ys[a]-ys[b]) - hypot(xs[a]-xs[c], ys[a]-ys[c])
+				if j+1 < count:
+					e = int(order[j+1])
+					gain += hypot(xs[c]-xs[e], ys[c]-ys[e]) - hypot(xs[b]-xs[e], ys[b]-ys[e])
+
+				if gain > 1e-9:
+					order[i+1:j+1] = order[i+1:j+1][::-1].copy()
+					positions[order[i+1:j+1]] = np.arange(i+1, j+1)
+					improved = True
+
+		if not improved:
+			break
+
+	return order
+
+def planDrills(xs, ys, tools, start=(0.0, 0.0)):
+	'''
+	Returns [order, before, after]: an order to drill the holes at (xs, ys) in, and the travel (see getTravel) in the order given and in the new one.
+
+	Holes are grouped by tools (one value per hole, e.g. its drill size), smallest first, and each group is toured from wherever the last one ended,
+	starting at start.
+	'''
+
+	xs = np.asarray(xs, dtype=float)
+	ys = np.asarray(ys, dtype=float)
+	tools = np.asarray(tools)
+
+	order = []
+	position = start
+
+	for tool in np.unique(tools):
+
+		holes = np.flatnonzero(tools==tool)
+		[toolXs, toolYs] = [xs[holes], ys[holes]]
+
+		grid = makeGrid(toolXs, toolYs)
+		tour = makeNearestNeighbourTour(toolXs, toolYs, grid, position)
+		tour = improveTour(toolXs, toolYs, tour, getNeighbours(toolXs, toolYs, grid))
+
+		order.append(holes[tour])
+		position = (toolXs[tour[-1]], toolYs[tour[-1]])
+
+	order = np.concatenate(order) if order else np.zeros(0, dtype=int)
+
+	# Before planning, the holes are still drilled a tool at a time, but in the order given
+
+	given = np.argsort(tools, kind='stable')
+
+	return [order, getTravel(xs, ys, given, start), getTravel(xs, ys, order, start)]
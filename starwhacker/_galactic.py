@@ -3,78 +3,331 @@
 # imports
 
 from starwhacker._coordinates import position, polyline, multiPolyline
-from starwhacker._tools import makeInterpolator, clamp
+from starwhacker._tools import makeInterpolator, clamp, writeAtomically
+from starwhacker._coordinates import simplifyRagged
+from starwhacker._contours import makeBandPolygons, makeEvenOddPolygons
+from starwhacker._geojson import iterFeatures
+from starwhacker._catalog import cacheRoot, getSourceSignature
+from starwhacker._skyimage import skyImage
 import math
-import random
-import os 
+import json
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import os
 from PIL import Image, ImageDraw, ImageFont
 import datetime
 
+# How far each blob's centre, vertex angles (degrees) and radius (as a fraction of its weight) are randomly disturbed
+
+blobPosRand = 0.3
+blobAngleRand = 5
+blobRadRand = 0.2
+
+# Every blob has a vertex each 45 degrees around its centre, the last closing back onto the first
+
+blobAngles = np.arange(0, 361, 45)
+
+# The furthest any part of a blob can reach from the sample it was made at, in degrees (its weight is at most 1)
+
+blobReach = blobPosRand + 1 + blobRadRand
+
+# Populations are made in fixed bands of declination (degrees), each from its own seed, so they never depend on how many workers share the bands
+
+populationBandHeight = 10
+
+def closeAroundPole(ring):
+	'''
+	Returns a closed [RA, dec] ring (Nx2 array) made continuous in RA, so it can be filled on a flat RA/dec plane.
+
+	A ring which runs right round the sky (like an edge of the Milky Way) is started where it crosses RA +-180,
+	and closed over the north celestial pole, so that rings running round the sky are always closed over the same side.
+	'''
+
+	seams = np.flatnonzero(np.abs(np.diff(ring[:,0])) > 180)
+
+	if not len(seams):
+		return ring
+
+	# Start just after a seam, and undo the jumps at any others
+
+	ring = np.concatenate((ring[seams[0]+1:-1], ring[:seams[0]+1]))
+	jumps = np.concatenate(([0], np.round(np.diff(ring[:,0])/360)))
+	ring = np.column_stack((ring[:,0] - 360*np.cumsum(jumps), ring[:,1]))
+
+	if abs(ring[-1,0]-ring[0,0]) < 180:
+		# It only straddles the seam, so just keep as much of it as possible within +-180
+		ring = ring - [360*np.round(ring[:,0].mean()/360), 0]
+		return np.concatenate((ring, ring[:1]))
+
+	return np.concatenate((ring, [[ring[-1,0], 90], [ring[0,0], 90], ring[0]]))
+
+def makeBlobs(centres, weights, rng):
+	'''
+	Builds a blob around each of centres (an Nx2 array of [RA, dec] rows), sized by its weight, as a ragged buffer (see multiPolyline).
+
+	All of the randomness for every blob (centre, angle and radius jitter) comes from a single draw from rng, a numpy Generator.
+
+	Returns [coords, offsets, jitteredCentres].
+	'''
+
+	count = len(weights)
+	vertices = len(blobAngles)
+	weights = np.asarray(weights, dtype=float)
+
+	jitter = rng.uniform(-1, 1, (count, 2+2*vertices))
+	[centreJitter, angleJitter, radiusJitter] = np.split(jitter, [2, 2+vertices], axis=1)
+
+	# Randomise the centre position by plus or minus a certain amount maximum
+
+	centres = np.asarray(centres, dtype=float).reshape(-1,2) + centreJitter*blobPosRand # Todo change this to a normal distribution?
+
+	# Surround each centre with vertices, radius proportional to weight, and then disturb them in or out. First and last must be identical.
+
+	thetas = np.radians(blobAngles + angleJitter*blobAngleRand)
+	thetas[:,-1] = thetas[:,0]
+
+	radii = weights[:,None] * (1 + radiusJitter*blobRadRand)
+	radii[:,-1] = radii[:,0]
+
+	coords = np.stack((centres[:,0,None] + radii*np.sin(thetas), centres[:,1,None] + radii*np.cos(thetas)), axis=2).reshape(-1,2)
+
+	return [coords, np.arange(count+1)*vertices, centres]
+
+def populateBand(sourcePath, minWidth, minHeight, iDegs, jDegs, seed):
+	'''
+	Makes the blobs for one band of samples (iDegs, jDegs) of the image at sourcePath, returned as [coords, offsets, centres] (see makeBlobs).
+
+	The image is read as skyImage(sourcePath, minWidth, minHeight), and seed is a numpy SeedSequence for the band's random draw.
+	This is run by galaxy.makePopulation, possibly in another process.
+	'''
+
+	image = skyImage(sourcePath, minWidth, minHeight)
+
+	# Find the pixelwise position of every sample
+
+	iPixs = np.clip(image.degToPixScaleX(iDegs).astype(int), 1, image.width-1)
+	jPixs = np.clip(image.degToPixScaleY(jDegs).astype(int), 1, image.height-1)
+
+	# At each position we find the 'weight' by sampling the brightness, and keep only the bright enough ones
+
+	weights = image.getPixels(iPixs, jPixs).sum(axis=1)/(3*255)
+	bright = weights>0.1
+
+	return makeBlobs(np.column_stack((iDegs[bright], jDegs[bright])), weights[bright], np.random.default_rng(seed))
+
 class galacticBlob(polyline):
 	'''A class defining a blob centred on a position in the galaxy, sized and shaped according to the galactic density'''
 
-	def __init__(self, pos, weight):
+	__slots__ = ('weight', 'centre', 'posRand', 'angleRand', 'radRand')
+
+	def __init__(self, pos, weight, rng=None):
 
 		self.weight=weight
 		self.centre=pos
 
-		# Randomise the centre position by plus or minus a certain amount maximum
-		self.posRand = 0.3
-		self.centre.RA+=((random.random()-0.5)*2*self.posRand)
-		self.centre.dec+=((random.random()-0.5)*2*self.posRand) # Todo change this to a normal distribution?
-
-		# Create a list of positions that surround the centre, radius proportional to weight, and then disturb them in or out.
-
-		self.angleRand=5
-		self.radRand=0.2*self.weight
-		angles = [(theta + (random.random()-0.5)*2*self.angleRand)*2*math.pi/360 for theta in range(0,361,45)]
-		
-		# First and last must be identical
-		fl=((random.random()-0.5)*2*self.angleRand)*2*math.pi/360
-		angles[0]=fl
-		angles[-1]=fl
-
-		tempPolyline=[]
-		for theta in angles:
-			r=(random.random()-0.5)*2*self.radRand
-			tempPolyline.append(position(self.centre.RA + (self.weight+r)*math.sin(theta), self.centre.dec + (self.weight+r)*math.cos(theta)))
-		
-		super().__init__(tempPolyline)
+		self.posRand = blobPosRand
+		self.angleRand = blobAngleRand
+		self.radRand = blobRadRand*self.weight
+
+		[coords, offsets, centres] = makeBlobs([[pos.RA, pos.dec]], [weight], rng if rng is not None else np.random.default_rng())
+
+		[self.centre.RA, self.centre.dec] = centres[0].tolist()
+
+		super().__init__(coords)
 
 class galaxy(multiPolyline):
-	'''A class holding many galacticBlobs, extending multiPolyline'''
+	'''
+	A class holding the galactic background, extending multiPolyline. Its mode is either:
+	- 'blobs': many galacticBlobs, one wherever the source image is bright enough, or
+	- 'contours': a handful of polygons tracing alternate brightness bands between levels (see makeBandPolygons), or
+	- 'outlines': vector outlines read straight from a GeoJSON file of (Multi)Polygons such as mw.json, see makeOutlines.
+
+	Blobs are placed at random. Given a seed they come out the same every time, and are cached on disk (see loadPopulation).
 
-	def __init__(self, sourceImage, samplesPerUnit):
+	Source images are only decoded at the resolution the sampling needs, and only within extents [[minRA, maxRA],[minDec, maxDec]]
+	if given (see skyImage). A seeded population always covers the whole sky though, so that every region drawn from it matches.
 
-		self.source=Image.open('./data/'+sourceImage)
+	Blobs can be made by several worker processes at once, with identical results whatever the number of workers (see makePopulation).
+	'''
+
+	def __init__(self, sourceImage, samplesPerUnit, mode='blobs', levels=(0.1, 0.2, 0.3), minArea=4.0, seed=None, cache=True, extents=None, workers=None):
+
+		self.mode=mode
 		self.samplesPerUnit=samplesPerUnit
-		self.degToPixScaleX=makeInterpolator([-180, 180],[0, self.source.width-1])
-		self.degToPixScaleY=makeInterpolator([-90, 90],[self.source.height-1, 0]) # Image pixels are upside down, naturally
+		self.seed=seed
+		self.extents=extents
+		self.workers=workers
+
+		if mode == 'outlines':
+			self.setBuffer(*self.makeOutlines(sourceImage))
+			return
 
-		super().__init__(self.makePopulation())
+		# Decode no more of the image than the sampling needs: a pixel per sample for blobs, samplesPerUnit per degree for contours
 
-	def makePopulation(self):
+		if mode == 'blobs':
+			[iDegs, jDegs] = self.getSampleGrid()
+			[minWidth, minHeight] = [len(iDegs), len(jDegs)]
+		elif mode == 'contours':
+			[minWidth, minHeight] = [360*samplesPerUnit+1, 180*samplesPerUnit+1]
+		else:
+			raise ValueError('Unknown galaxy mode {}, expected blobs, contours or outlines'.format(mode))
+
+		self.sourcePath=os.path.join('./data', sourceImage)
+		self.minWidth=minWidth
+		self.minHeight=minHeight
+		self.image=skyImage(self.sourcePath, minWidth, minHeight)
+		self.degToPixScaleX=self.image.degToPixScaleX
+		self.degToPixScaleY=self.image.degToPixScaleY
+
+		if mode == 'blobs':
+			if seed is not None and cache:
+				self.setBuffer(*self.loadPopulation())
+			else:
+				self.setBuffer(*self.makePopulation(seed, extents if seed is None else None)[:2])
+		else:
+			self.setBuffer(*self.makeContours(levels, minArea))
+
+	def getSampleGrid(self):
 		'''
-		Populate the galaxy with a set galacticBlobs
+		Returns [iDegs, jDegs], the RAs and decs of the columns and rows of the grid the source image is sampled on for blobs.
 		'''
 
-		# We will take the source image and scan over it in a grid pattern using samplesPerUnit
-
 		totalSteps=self.samplesPerUnit*360
-		tempCollection=[]
-		for i in range(int(-totalSteps/2), int(totalSteps/2) + 1, self.samplesPerUnit):
-			for j in range(int(-totalSteps/4), int(totalSteps/4) + 1, self.samplesPerUnit): # Only +- 90 degrees in declination
-
-				# Find the pixelwise and radec position
-				iDeg = i/self.samplesPerUnit
-				jDeg = j/self.samplesPerUnit
-				iPix = clamp(int(self.degToPixScaleX(iDeg)),1,self.source.width)
-				jPix = clamp(int(self.degToPixScaleY(jDeg)),1,self.source.height)
-				# At each position we find the 'weight' by sampling the brightness
-
-				(r,g,b,a)=self.source.getpixel((iPix,jPix))
-				w=1*(r+g+b)/(3*255)
-				if w>0.1:
-					tempCollection.append(galacticBlob(position(iDeg, jDeg), w))
-
-		return tempCollection
\ No newline at end of file
+		iDegs = np.arange(int(-totalSteps/2), int(totalSteps/2) + 1, self.samplesPerUnit)/self.samplesPerUnit
+		jDegs = np.arange(int(-totalSteps/4), int(totalSteps/4) + 1, self.samplesPerUnit)/self.samplesPerUnit # Only +- 90 degrees in declination
+
+		return [iDegs, jDegs]
+
+	def makePopulation(self, seed=None, extents=None):
+		'''
+		Populate the galaxy with galacticBlobs, returned as [coords, offsets, centres] (see makeBlobs)
+
+		If extents [[minRA, maxRA],[minDec, maxDec]] are given, only samples whose blobs could reach into them are made.
+
+		The samples are split into fixed bands of declination, each drawing from its own seed spawned from seed, and made in order
+		or shared among self.workers processes. The bands are put back together in order, so the result only depends on seed.
+		'''
+
+		# We will take the source image and sample it in a grid pattern using samplesPerUnit, all at once
+
+		[iDegs, jDegs] = [grid.ravel() for grid in np.meshgrid(*self.getSampleGrid(), indexing='ij')]
+
+		if extents is not None:
+			[[minRA, maxRA], [minDec, maxDec]] = extents
+			near = (minRA-blobReach<=iDegs) & (iDegs<=maxRA+blobReach) & (minDec-blobReach<=jDegs) & (jDegs<=maxDec+blobReach)
+			[iDegs, jDegs] = [iDegs[near], jDegs[near]]
+
+		# Split the samples into bands of declination, keeping their order within each band
+
+		bands = np.clip(((jDegs+90)//populationBandHeight).astype(int), 0, None)
+		bandCount = 180//populationBandHeight + 1
+		seeds = np.random.SeedSequence(seed).spawn(bandCount)
+
+		jobs = []
+		for band in range(bandCount):
+			inBand = bands==band
+			jobs.append((self.sourcePath, self.minWidth, self.minHeight, iDegs[inBand], jDegs[inBand], seeds[band]))
+
+		if self.workers and self.workers > 1:
+			# Make sure the image is decoded into the tile cache first, so the workers read it rather than each decoding it again
+			self.image.prepare()
+			with ProcessPoolExecutor(max_workers=self.workers) as pool:
+				results = list(pool.map(populateBand, *zip(*jobs)))
+		else:
+			results = [populateBand(*job) for job in jobs]
+
+		# Put the bands back together in order
+
+		lengths = np.concatenate([np.diff(offsets) for [coords, offsets, centres] in results])
+
+		return [np.concatenate([coords for [coords, offsets, centres] in results]), np.concatenate(([0], np.cumsum(lengths, dtype=int))),
+			np.concatenate([centres for [coords, offsets, centres] in results])]
+
+	def getPopulationKey(self):
+		'''
+		Returns the name of the cached population for this galaxy: a hash of everything that decides where its blobs go.
+		'''
+
+		key = {
+			'source':getSourceSignature(self.sourcePath, withHash=True)['sha1'],
+			'samplesPerUnit':self.samplesPerUnit,
+			'jitter':[blobPosRand, blobAngleRand, blobRadRand],
+			'bands':populationBandHeight,
+			'seed':self.seed}
+
+		return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf8')).hexdigest()
+
+	def loadPopulation(self):
+		'''
+		Returns the population for this galaxy's seed as [coords, offsets], from data/_cache/galaxy/ if it has been made before,
+		otherwise making it with makePopulation and saving it there for next time.
+
+		The cache holds the whole sky, before any filtering, so every region drawn from the same seed shares the same blobs.
+		'''
+
+		cachePath = os.path.join(cacheRoot, 'galaxy', self.getPopulationKey()+'.npz')
+
+		try:
+			with np.load(cachePath) as cached:
+				return [cached['coords'], cached['offsets']]
+		except (OSError, ValueError, KeyError):
+			pass
+
+		[coords, offsets, centres] = self.makePopulation(self.seed)
+
+		writeAtomically(cachePath, lambda tempPath: np.savez(tempPath, coords=coords, offsets=offsets), suffix='.npz')
+
+		return [coords, offsets]
+
+	def makeContours(self, levels, minArea):
+		'''
+		Trace the brightness of the source image into band polygons, returned as [coords, offsets] (see makeBandPolygons).
+
+		The image (or just the part covering the galaxy's extents, if it has them) is averaged down to samplesPerUnit samples per degree first.
+		Rings enclosing less than minArea square degrees are dropped.
+		'''
+
+		[[left, top, right, bottom], [[minRA, maxRA], [minDec, maxDec]]] = self.image.getPixelBox(self.extents or [[-180, 180], [-90, 90]], margin=1.0)
+
+		columns = int(round((maxRA-minRA)*self.samplesPerUnit))+1
+		rows = int(round((maxDec-minDec)*self.samplesPerUnit))+1
+
+		# Box filtering averages every source pixel into the sample it falls in, and rows are flipped so dec ascends
+
+		region = Image.fromarray(self.image.getRegion(left, top, right, bottom))
+		averaged = np.asarray(region.resize((columns, rows), Image.BOX))[::-1]
+		brightness = averaged.sum(axis=2)/(3*255)
+
+		return makeBandPolygons(np.linspace(minRA, maxRA, columns), np.linspace(minDec, maxDec, rows), brightness, levels, minArea)
+
+	def makeOutlines(self, jsonFile):
+		'''
+		Read the (Multi)Polygon outlines of a GeoJSON file as filled polygons, returned as [coords, offsets] (see makeEvenOddPolygons).
+
+		The outlines of every feature are filled even-odd together, so nested brightness levels (like mw.json's ol1 to ol5) come out as alternate bands.
+
+		If samplesPerUnit is set, outlines are decimated to about that many vertices per degree (see simplifyRagged), otherwise kept at full detail.
+		'''
+
+		rings = []
+
+		for body in iterFeatures(os.path.join('./data', jsonFile)):
+
+			polygons = body['geometry']['coordinates']
+			if body['geometry']['type'] == 'Polygon':
+				polygons = [polygons]
+
+			for polygon in polygons:
+				for ring in polygon:
+					ring = np.array(ring, dtype=float)*[-1, 1] # Because the coords in this file are backwards lol
+					rings.append(closeAroundPole(ring))
+
+		lengths = [len(ring) for ring in rings]
+		coords = np.concatenate(rings) if rings else np.zeros((0,2))
+		offsets = np.concatenate(([0], np.cumsum(lengths, dtype=int)))
+
+		if self.samplesPerUnit:
+			[coords, offsets] = simplifyRagged(coords, offsets, 0.5/self.samplesPerUnit)
+
+		return makeEvenOddPolygons(coords, offsets)
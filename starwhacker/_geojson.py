@@ -0,0 +1,95 @@
+# _geojson.py
+
+# Streams the features of a GeoJSON FeatureCollection one at a time, so that large files never have to be held in memory as a whole parsed tree.
+
+# imports
+
+import re
+import json
+
+# Matches the start of the features array, e.g. '"features":['
+
+featuresStart = re.compile(r'"features"\s*:\s*\[')
+
+def iterFeatures(path, predicate=None, chunkSize=1<<16):
+	'''
+	Yields the features of the GeoJSON FeatureCollection at path as dictionaries, one at a time.
+
+	Only about one chunk (chunkSize characters) plus the current feature is held in memory at once.
+
+	predicate is an optional function taking a feature and returning False if it should be rejected.
+	Rejected features are dropped as soon as they are decoded, so nothing is ever built from them.
+	'''
+
+	decoder = json.JSONDecoder()
+
+	# encoding ensures there are no invalid characters - some star names are not provided in unicode.
+	with open(path, encoding='utf8') as source:
+
+		buffer = ''
+		exhausted = False
+
+		def readMore(size=chunkSize):
+			chunk = source.read(size)
+			return chunk, not chunk
+
+		# Read forward until we find the opening of the features array
+
+		while True:
+			match = featuresStart.search(buffer)
+			if match:
+				pos = match.end()
+				break
+			if exhausted:
+				raise ValueError('{} has no "features" array'.format(path))
+			# Keep a short tail in case the key is split across two chunks
+			chunk, exhausted = readMore()
+			buffer = buffer[-16:] + chunk
+
+		# Now decode features one after the other
+
+		while True:
+
+			# Skip whitespace and separating commas, reading more if we run off the end of the buffer
+
+			while True:
+				while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+					pos += 1
+				if pos < len(buffer) or exhausted:
+					break
+				chunk, exhausted = readMore()
+				buffer = buffer[pos:] + chunk
+				pos = 0
+
+			if pos >= len(buffer):
+				raise ValueError('{} ended inside the "features" array'.format(path))
+
+			if buffer[pos] == ']':
+				return
+
+			# Decode the next feature, topping up the buffer until it holds the whole thing.
+			# Each top-up doubles in size, so a very large feature is only re-decoded a handful of times.
+
+			topUp = chunkSize
+			while True:
+				try:
+					feature, end = decoder.raw_decode(buffer, pos)
+					break
+				except json.JSONDecodeError:
+					if exhausted:
+						raise
+					chunk, exhausted = readMore(topUp)
+					buffer = buffer[pos:] + chunk
+					pos = 0
+					topUp *= 2
+
+			pos = end
+
+			# Drop what we have already consumed once it gets large
+
+			if pos > chunkSize:
+				buffer = buffer[pos:]
+				pos = 0
+
+			if predicate is None or predicate(feature):
+				yield feature
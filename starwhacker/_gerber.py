@@ -0,0 +1,336 @@
+# _gerber.py
+
+# Defines the fabrication class, which writes a sky straight to the files a fab needs: RS-274X Gerbers for each layer and an Excellon drill file,
+# from the same normalised geometry the board uses, without opening a board in pcbnew to plot them.
+
+# imports
+
+import os
+import datetime
+import numpy as np
+
+from starwhacker._tools import makeInterpolator, toNanometres, formatNanometres
+from starwhacker._drills import planDrills
+from starwhacker._starlayout import getStarLayout
+
+# The size of the buffer each file is written through, in bytes
+
+writeBufferSize = 1 << 20
+
+# Line widths and solder mask margins, in millimetres, as the board has them (see _kicadtemplates)
+
+edgeWidth = 0.15
+silkWidth = 0.15
+silkCircleWidth = 0.2
+throughHoleMaskMargin = 0.05
+surfaceMaskMargin = 0.02
+
+class apertureTable():
+	'''A class which hands out one Gerber aperture (D code) per distinct circle diameter, given in integer nanometres.'''
+
+	def __init__(self):
+
+		self.codes = {}
+
+	def getCode(self, diameter):
+		'''
+		Returns the D code of the circle aperture of this diameter, adding one if there isn't one yet. Codes start at 10, as Gerber requires.
+		'''
+
+		diameter = int(diameter)
+		if diameter not in self.codes:
+			self.codes[diameter] = 10 + len(self.codes)
+
+		return self.codes[diameter]
+
+	def getCodes(self, diameters):
+		'''
+		Returns the D codes for an array of diameters, as an array, looking each distinct diameter up only once.
+		'''
+
+		[distinct, inverse] = np.unique(np.asarray(diameters, dtype=np.int64), return_inverse=True)
+
+		return np.array([self.getCode(diameter) for diameter in distinct.tolist()], dtype=int)[inverse.ravel()]
+
+	def iterDefinitions(self):
+		'''
+		Yields the aperture definitions, which must all come before the apertures are used.
+		'''
+
+		for [diameter, code] in zip(formatNanometres(list(self.codes)), self.codes.values()):
+			yield '%ADD{}C,{}*%\n'.format(code, diameter)
+
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+class fabrication():
+	'''
+	A class which writes a sky as fabrication files to output/_gerbers/<sky>/<time>/:
+	copper, solder mask and silkscreen Gerbers for the front and back, the board outline, and an Excellon drill file.
+
+	Every coordinate is put onto whole nanometres (see toNanometres) and every file is streamed through a large buffer.
+	Pads get one aperture per distinct size (see getStarLayout). Star names aren't written, since Gerbers carry no fonts.
+
+	With planDrills, holes are drilled a tool at a time in a short tour of each (see planDrills), rather than in catalogue order.
+
+	With a clearance (in mm), star pads which overlap or come closer than it are resolved by clearancePolicy before they're written, as on the board.
+	'''
+
+	def __init__(self, fromSky, majorDim, targetConstellation='XXX', planDrills=False, clearance=None, clearancePolicy='drop'):
+
+		self.sky = fromSky
+		self.majorDim = majorDim
+		self.targetConstellation=targetConstellation
+		self.planDrills=planDrills
+		self.clearance=clearance
+		self.clearancePolicy=clearancePolicy
+		self.diagOffset=20
+
+		# Laid out as on the board, but with y upwards, as Gerbers and drill files have it
+
+		self.scaleX = makeInterpolator([-1,1],[0+self.diagOffset,self.majorDim+self.diagOffset])
+		self.scaleY = makeInterpolator([-1,1],[0+self.diagOffset,self.majorDim+self.diagOffset])
+
+		self.storagePath=os.path.join(os.path.dirname(__file__),'../output/_gerbers/',self.sky.name)
+
+	def render(self):
+		'''
+		Writes every Gerber layer and the drill file into a new folder, named for the time.
+		'''
+
+		folder = os.path.join(self.storagePath, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+		os.makedirs(folder, exist_ok=True)
+
+		self.stars = self.getStars()
+
+		layers = [
+			['F_Cu', 'Copper,L1,Top', self.makeFrontCopper],
+			['B_Cu', 'Copper,L2,Bot', self.makeBackCopper],
+			['F_Mask', 'Soldermask,Top', self.makeFrontMask],
+			['B_Mask', 'Soldermask,Bot', self.makeBackMask],
+			['F_SilkS', 'Legend,Top', self.makeFrontSilk],
+			['B_SilkS', 'Legend,Bot', self.makeBackSilk],
+			['Edge_Cuts', 'Profile,NP', self.makeEdgeCuts],
+		]
+
+		for [suffix, fileFunction, makeLayer] in layers:
+			self.writeGerber(os.path.join(folder, '{}-{}.gbr'.format(self.sky.name, suffix)), fileFunction, *makeLayer())
+
+		self.writeDrills(os.path.join(folder, '{}.drl'.format(self.sky.name)))
+
+		return None
+
+	# Simple utility functions
+
+	def scaleCoords(self, coords):
+		'''
+		Returns normalised coords (an Nx2 array) scaled to the board as [xs, ys] in integer nanometres.
+		'''
+
+		return [toNanometres(self.scaleX(coords[:,0])), toNanometres(self.scaleY(coords[:,1]))]
+
+	def getStars(self):
+		'''
+		Returns the stars' pads as [xs, ys, sizes, drills, names]: arrays of integer nanometres, with a drill of 0 for surface pads,
+		laid out as on the board (see getStarLayout), and the names of the stars left.
+		'''
+
+		[xs, ys, sizes, drills, names] = getStarLayout(self.sky.objects['stars'], self.scaleX, self.scaleY, self.clearance, self.clearancePolicy)
+
+		return [toNanometres(xs), toNanometres(ys), sizes*100000, drills*100000, names]
+
+	def getConstellationWidth(self, con):
+		'''
+		Returns the width of a constellation's lines in mm, wider for the target constellation.
+		'''
+
+		return 1 if con.name.lower()==self.targetConstellation.lower() else 0.5
+
+	# Layers, each returned as [apertures, body] with every aperture the body uses already in the table
+
+	def makeFrontCopper(self):
+
+		apertures = apertureTable()
+		[xs, ys, sizes, drills, names] = self.stars
+		padCodes = apertures.getCodes(sizes)
+		constellations = self.sky.objects['constellations']
+		lineCodes = [apertures.getCode(toNanometres(self.getConstellationWidth(con))) for con in constellations]
+
+		def body():
+			galaxy = self.sky.objects['galaxy']
+			yield from self.iterRegions(galaxy.coords, galaxy.offsets)
+			for con, code in zip(constellations, lineCodes):
+				yield from self.iterStrokes(con.coords, con.offsets, code)
+			yield from self.iterFlashes(xs, ys, padCodes)
+
+		return [apertures, body()]
+
+	def makeBackCopper(self):
+
+		apertures = apertureTable()
+		[xs, ys, sizes, drills, names] = self.stars
+		throughHole = drills!=0
+		padCodes = apertures.getCodes(sizes[throughHole])
+
+		return [apertures, self.iterFlashes(xs[throughHole], ys[throughHole], padCodes)]
+
+	def makeFrontMask(self):
+
+		apertures = apertureTable()
+		[xs, ys, sizes, drills, names] = self.stars
+		margins = np.where(drills!=0, toNanometres(throughHoleMaskMargin), toNanometres(surfaceMaskMargin))
+		padCodes = apertures.getCodes(sizes + 2*margins)
+		constellations = self.sky.objects['constellations']
+		lineCodes = [apertures.getCode(toNanometres(self.getConstellationWidth(con))) for con in constellations]
+
+		def body():
+			for con, code in zip(constellations, lineCodes):
+				yield from self.iterStrokes(con.coords, con.offsets, code)
+			yield from self.iterFlashes(xs, ys, padCodes)
+
+		return [apertures, body()]
+
+	def makeBackMask(self):
+
+		apertures = apertureTable()
+		[xs, ys, sizes, drills, names] = self.stars
+		throughHole = drills!=0
+		padCodes = apertures.getCodes(sizes[throughHole] + 2*toNanometres(throughHoleMaskMargin))
+
+		return [apertures, self.iterFlashes(xs[throughHole], ys[throughHole], padCodes)]
+
+	def makeFrontSilk(self):
+
+		apertures = apertureTable()
+		grid = self.sky.objects['grid']
+
+		return [apertures, self.iterStrokes(grid.coords, grid.offsets, apertures.getCode(toNanometres(silkWidth)))]
+
+	def makeBackSilk(self):
+
+		# A ring around every named star, as the board has
+
+		apertures = apertureTable()
+		[xs, ys, sizes, drills, names] = self.stars
+		named = np.char.str_len(names) > 0
+
+		return [apertures, self.iterCircles(xs[named], ys[named], sizes[named]//2 + toNanometres(0.5), apertures.getCode(toNanometres(silkCircleWidth)))]
+
+	def makeEdgeCuts(self):
+
+		apertures = apertureTable()
+		boundary = self.sky.objects['boundary'].coords
+
+		return [apertures, self.iterStrokes(boundary, np.array([0, len(boundary)]), apertures.getCode(toNanometres(edgeWidth)))]
+
+	# Bodies of Gerber files, as generators of strings
+
+	def iterStrokes(self, coords, offsets, code):
+		'''
+		Yields every member of a ragged buffer of normalised coords (see multiPolyline) drawn as one stroke with aperture code.
+		'''
+
+		[xs, ys] = self.scaleCoords(coords)
+		xs = xs.tolist()
+		ys = ys.tolist()
+
+		yield 'D{}*\n'.format(code)
+
+		for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+			if stop-start < 2:
+				continue
+			yield 'X{}Y{}D02*\n'.format(xs[start], ys[start])
+			yield ''.join(map('X{}Y{}D01*\n'.format, xs[start+1:stop], ys[start+1:stop]))
+
+	def iterRegions(self, coords, offsets):
+		'''
+		Yields every member of a ragged buffer of normalised coords (see multiPolyline) as a filled region.
+		'''
+
+		[xs, ys] = self.scaleCoords(coords)
+		xs = xs.tolist()
+		ys = ys.tolist()
+
+		for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+			if stop-start < 3:
+				continue
+			yield 'G36*\nX{}Y{}D02*\n'.format(xs[start], ys[start])
+			yield ''.join(map('X{}Y{}D01*\n'.format, xs[start+1:stop], ys[start+1:stop]))
+			# Regions must end where they start
+			if xs[start]!=xs[stop-1] or ys[start]!=ys[stop-1]:
+				yield 'X{}Y{}D01*\n'.format(xs[start], ys[start])
+			yield 'G37*\n'
+
+	def iterFlashes(self, xs, ys, codes):
+		'''
+		Yields a flash of aperture codes[n] at every (xs[n], ys[n]) in nanometres, grouped by aperture so each is selected once.
+		'''
+
+		order = np.argsort(codes, kind='stable')
+		[xs, ys, codes] = [xs[order].tolist(), ys[order].tolist(), codes[order].tolist()]
+
+		current = None
+		for x, y, code in zip(xs, ys, codes):
+			if code != current:
+				yield 'D{}*\n'.format(code)
+				current = code
+			yield 'X{}Y{}D03*\n'.format(x, y)
+
+	def iterCircles(self, xs, ys, radii, code):
+		'''
+		Yields a circle of radius radii[n] around every (xs[n], ys[n]) in nanometres, drawn with aperture code.
+		'''
+
+		yield 'D{}*\nG75*\n'.format(code)
+
+		for x, y, radius in zip(xs.tolist(), ys.tolist(), radii.tolist()):
+			yield 'X{}Y{}D02*\nG03X{}Y{}I{}J0D01*\nG01*\n'.format(x+radius, y, x+radius, y, -radius)
+
+	# Writing
+
+	def writeGerber(self, path, fileFunction, apertures, body):
+		'''
+		Writes one Gerber layer: the header, then the apertures, then body (an iterable of strings).
+		'''
+
+		with open(path, 'w', buffering=writeBufferSize) as file:
+			file.write('%TF.GenerationSoftware,starwhacker*%\n%TF.FileFunction,{}*%\n%FSLAX46Y46*%\n%MOMM*%\n%LPD*%\nG01*\n'.format(fileFunction))
+			file.writelines(apertures.iterDefinitions())
+			file.writelines(body)
+			file.write('M02*\n')
+
+		return None
+
+	def writeDrills(self, path):
+		'''
+		Writes the Excellon drill file for the through hole stars, one tool per drill size.
+		'''
+
+		[xs, ys, sizes, drills, names] = self.stars
+		throughHole = drills!=0
+		[xs, ys, drills] = [xs[throughHole], ys[throughHole], drills[throughHole]]
+
+		if self.planDrills:
+			[order, before, after] = planDrills(xs/1000000, ys/1000000, drills)
+			[xs, ys, drills] = [xs[order], ys[order], drills[order]]
+
+			print('Drill travel: {:.0f}mm in catalogue order, {:.0f}mm planned'.format(before, after))
+
+		[sizes, tools] = np.unique(drills, return_inverse=True)
+		tools = tools.ravel()
+
+		with open(path, 'w', buffering=writeBufferSize) as file:
+
+			file.write('M48\n; DRILL file {} by starwhacker\nFMAT,2\nMETRIC\n'.format(self.sky.name))
+			file.writelines('T{}C{}\n'.format(tool+1, size) for tool, size in enumerate(formatNanometres(sizes)))
+			file.write('%\nG90\nG05\n')
+
+			for tool in range(len(sizes)):
+				inTool = tools==tool
+				file.write('T{}\n'.format(tool+1))
+				file.writelines(map('X{}Y{}\n'.format, formatNanometres(xs[inTool]), formatNanometres(ys[inTool])))
+
+			file.write('M30\n')
+
+		return None
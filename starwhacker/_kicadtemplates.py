@@ -8,6 +8,10 @@ templates = {
 '''
 (gr_line (start {} {}) (end {} {}) (angle 90) (layer Edge.Cuts) (width 0.15))''',
 
+'edge_arc':
+'''
+(gr_arc (start {} {}) (end {} {}) (angle {}) (layer Edge.Cuts) (width 0.15))''',
+
 'openModule':
 '''
 (module {} (layer {}) (tedit {}) (tstamp {})
@@ -39,10 +43,19 @@ templates = {
 (gr_line (start {0} {1}) (end {2} {3}) (angle 90) (layer F.Mask) (width {4}))
 ''',
 
+'constellation_arc':
+'''(gr_arc (start {0} {1}) (end {2} {3}) (angle {4}) (layer F.Cu) (width {5}))
+(gr_arc (start {0} {1}) (end {2} {3}) (angle {4}) (layer F.Mask) (width {5}))
+''',
+
 'silk_line':
 '''(fp_line (start {} {}) (end {} {}) (layer F.SilkS) (width 0.15))
 ''',
 
+'silk_arc':
+'''(fp_arc (start {} {}) (end {} {}) (angle {}) (layer F.SilkS) (width 0.15))
+''',
+
 'silk_circle_back':
 '''(fp_circle (center {0} {1}) (end {0} {2}) (layer B.SilkS) (width 0.2))
 ''',
@@ -71,6 +84,9 @@ templates = {
 )
 ''',
 
+'xy':
+'''(xy {} {})''',
+
 'polygon':
 '''
 (fp_poly (pts {}) (layer F.Cu) (width 0.01))
@@ -190,4 +206,8 @@ templates = {
 'ender':
 ''')
 '''
-}
\ No newline at end of file
+}
+
+# The templates' format methods, looked up once so emitting thousands of primitives doesn't repeat the lookup
+
+formatters = {name: template.format for name, template in templates.items()}
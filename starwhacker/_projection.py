@@ -0,0 +1,156 @@
+# _projection.py
+
+# Vectorised map projections, which transform whole arrays of RA/dec coordinates in one pass.
+
+# imports
+
+import numpy as np
+from types import SimpleNamespace
+
+# The registry of projections available to sky.project, by name.
+# Each entry is a function f(RAs, decs, lonLatCentroid, R, **params) returning [xs, ys].
+
+projections = {}
+
+def registerProjection(name):
+	'''
+	Decorator which adds a projection function to the registry under name.
+	'''
+
+	def register(function):
+		projections[name] = function
+		return function
+
+	return register
+
+def getProjection(name):
+	'''
+	Returns the projection function registered under name.
+	'''
+
+	try:
+		return projections[name]
+	except KeyError:
+		raise ValueError('Unknown projection {}, expected one of: {}'.format(name, ', '.join(sorted(projections))))
+
+def azimuthal(RAs, decs, lonLatCentroid, R, scale):
+	'''
+	Shared body of the azimuthal projections. Works out, for every point, the cosine of its angular distance c from the centroid,
+	and the direction of the point as seen from the centroid, then lets scale(cosC, R) decide how far out along that direction it lands.
+
+	The centroid's trigonometry is worked out once for the whole batch.
+	'''
+
+	lon = np.radians(np.asarray(RAs, dtype=float))
+	lat = np.radians(np.asarray(decs, dtype=float))
+	lonC = np.radians(lonLatCentroid.RA)
+	latC = np.radians(lonLatCentroid.dec)
+
+	sinLatC = np.sin(latC)
+	cosLatC = np.cos(latC)
+
+	sinLat = np.sin(lat)
+	cosLat = np.cos(lat)
+	dLon = lon-lonC
+	cosDLon = np.cos(dLon)
+
+	cosC = sinLatC*sinLat + cosLatC*cosLat*cosDLon
+
+	k = scale(cosC, R)
+
+	projectedXs = k * cosLat * np.sin(dLon)
+	projectedYs = k * (cosLatC * sinLat - sinLatC * cosLat * cosDLon)
+
+	return [projectedXs, projectedYs]
+
+@registerProjection('stereographic')
+def stereographic(RAs, decs, lonLatCentroid, R):
+	'''
+	Stereo transforms arrays of RA and Dec (degrees) to cartesian [xs, ys], projecting about lonLatCentroid (a position) with radius R.
+
+	Conformal: circles on the sky stay circles.
+	'''
+
+	# TODO this is known to throw a /0 error for projecting the point opposite the centroid
+
+	return azimuthal(RAs, decs, lonLatCentroid, R, lambda cosC, R: 2*R / (1 + cosC))
+
+@registerProjection('gnomonic')
+def gnomonic(RAs, decs, lonLatCentroid, R):
+	'''
+	Gnomonic projection: every great circle becomes a straight line. Only the hemisphere facing the centroid can be shown.
+	'''
+
+	with np.errstate(divide='ignore'):
+		return azimuthal(RAs, decs, lonLatCentroid, R, lambda cosC, R: R / cosC)
+
+@registerProjection('orthographic')
+def orthographic(RAs, decs, lonLatCentroid, R):
+	'''
+	Orthographic projection: the sky as seen from far outside the sphere. Points on the far hemisphere overlay the near one.
+	'''
+
+	return azimuthal(RAs, decs, lonLatCentroid, R, lambda cosC, R: np.full_like(cosC, R))
+
+@registerProjection('lambert')
+def lambert(RAs, decs, lonLatCentroid, R):
+	'''
+	Lambert azimuthal equal-area projection: areas on the sky keep their proportions.
+	'''
+
+	return azimuthal(RAs, decs, lonLatCentroid, R, lambda cosC, R: R * np.sqrt(2 / (1 + cosC)))
+
+@registerProjection('equidistant')
+def equidistant(RAs, decs, lonLatCentroid, R):
+	'''
+	Azimuthal equidistant projection: distances from the centroid are true to scale.
+	'''
+
+	def scale(cosC, R):
+		c = np.arccos(np.clip(cosC, -1, 1))
+		sinC = np.sin(c)
+		# c/sin(c) tends to 1 at the centroid itself
+		return R * np.divide(c, sinC, out=np.ones_like(c), where=sinC>1e-12)
+
+	return azimuthal(RAs, decs, lonLatCentroid, R, scale)
+
+def makeTransverse(projection):
+	'''
+	Returns the transverse (equatorial) aspect of an azimuthal projection: centred on the equator at the centroid's RA,
+	which suits the zodiac constellations that lie along it.
+	'''
+
+	def transverse(RAs, decs, lonLatCentroid, R, **params):
+		return projection(RAs, decs, SimpleNamespace(RA=lonLatCentroid.RA, dec=0.0), R, **params)
+
+	transverse.__doc__ = 'Transverse aspect of the {} projection, centred on the equator at the centroid\'s RA.'.format(projection.__name__)
+
+	return transverse
+
+for azimuthalName in ('stereographic', 'gnomonic', 'orthographic', 'lambert', 'equidistant'):
+	projections['transverse'+azimuthalName.capitalize()] = makeTransverse(projections[azimuthalName])
+
+def gatherCoords(items):
+	'''
+	Collects the coordinates of every item (anything offering getCoordsAsArrays) into one pair of buffers.
+
+	Returns [RAs, decs, splits], where splits marks where each item's coordinates end, for scatterCoords.
+	'''
+
+	buffers = [item.getCoordsAsArrays() for item in items]
+
+	RAs = np.concatenate([buffer[0] for buffer in buffers]) if buffers else np.zeros(0)
+	decs = np.concatenate([buffer[1] for buffer in buffers]) if buffers else np.zeros(0)
+	splits = np.cumsum([len(buffer[0]) for buffer in buffers])[:-1]
+
+	return [RAs, decs, splits]
+
+def scatterCoords(items, xs, ys, splits):
+	'''
+	Hands each item (anything offering setCoordsFromArrays) back its own slice of the buffers, in the order they were gathered.
+	'''
+
+	for item, itemXs, itemYs in zip(items, np.split(xs, splits), np.split(ys, splits)):
+		item.setCoordsFromArrays(itemXs, itemYs)
+
+	return None
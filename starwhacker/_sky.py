@@ -5,13 +5,17 @@
 import os
 import json
 import configparser
+import numpy as np
 
-from starwhacker._stars import star
+from starwhacker._stars import star, starTable
+from starwhacker._catalog import loadStarColumns
+from starwhacker._geojson import iterFeatures
 from starwhacker._galactic import galaxy
 from starwhacker._radec import radec
 from starwhacker._constellation import constellation
 from starwhacker._coordinates import position, polyline, multiPolyline
 from starwhacker._tools import makeInterpolator
+from starwhacker._projection import getProjection, gatherCoords, scatterCoords
 
 # Defines the sky class which holds data on stars and other celestial objects of interest. 
 # A sky can be cropped and projected and filtered to leave only objects of interest.
@@ -26,7 +30,7 @@ class sky():
 
 		if objectDict==None:
 			self.objects = {
-			'stars':[],
+			'stars':starTable(),
 			'constellations':[],
 			'DSOs':[],
 			'grid':None,
@@ -35,81 +39,48 @@ class sky():
 		else:
 			self.objects=objectDict
 
+		# The name of the last projection applied, and the unprojected coordinates it started from (see project)
+
+		self.projection=None
+		self.unprojected=None
+
 	# Functions for adding objects to the sky
 
-	def addStarsFromJson(self, jsonFile):
+	def addStarsFromJson(self, jsonFile, cache=True, predicate=None):
 		'''
 		Adds stars defined in a supplied json file to the objects dictionary.
+
+		With cache=True (the default) the catalogue is compiled to a binary copy in data/_cache the first time it is read,
+		and memory-mapped from there on later runs (see _catalog.loadStarColumns).
+
+		predicate is an optional early-reject function for the streamed features, e.g. _catalog.makeStarPredicate(mags=[-3,6.5]).
 		'''
 
-		stardict=None
-		# encoding ensures there are no invalid characters - some star names are not provided in unicode.
-		with open(os.path.join(os.path.dirname(__file__),'../data',jsonFile), encoding='utf8') as starfile: 
-			stardict = json.load(starfile) # Load the file into a temporary dictionary
-		
-		
-		for body in stardict['features']:
-
-			try: 
-				thisID = str(body['id'])
-			except:
-				thisID = getRandomString(6)
-
-			try: 
-				thisRA = -float(body['geometry']['coordinates'][0]) # Because the coords in this file are backwards lol
-				thisDec = float(body['geometry']['coordinates'][1])
-			except:
-				continue # Abandon if there's nothing here - it's really useless
-
-			try:
-				thisMag = float(body['properties']['mag'])
-			except:
-				thisMag = 0.0
-
-			try:
-				thisBV = float(body['properties']['bv'])
-			except:
-				thisBV = 0.0
-
-			try: 
-				thisName = str(body['properties']['name'])
-			except:
-				thisName = ''
-
-			try: 
-				thisDesig = str(body['properties']['desig'])
-			except:
-				thisDesig = ''
-
-			try: 
-				thisCon = str(body['properties']['con'])
-			except:
-				thisCon = 'NONE'	
-
-			newStar = star(thisID,
-				thisName, 
-				thisRA, 
-				thisDec, 
-				thisMag, 
-				thisBV, 
-				thisDesig, 
-				thisCon)
-
-			self.objects['stars'].append(newStar)
+		columns = loadStarColumns(os.path.join(os.path.dirname(__file__),'../data',jsonFile), cache=cache, predicate=predicate)
+
+		self.objects['stars'] = starTable(columns['ID'],
+			columns['name'],
+			columns['RA'],
+			columns['dec'],
+			columns['mag'],
+			columns['BV'],
+			columns['desig'],
+			columns['con'])
+
+		# Index the catalogue once, so region filtering only has to look at stars near the boundary
+
+		self.objects['stars'].buildIndex()
 
 		return self
 
-	def addConstellationsFromJSON(self, jsonFile):
+	def addConstellationsFromJSON(self, jsonFile, predicate=None):
 		'''
 		Adds constellations defined in a supplied json file to the objects dictionary.
-		'''
 
-		# encoding ensures there are no invalid characters - some star names are not provided in unicode.
-		constdict=None
-		with open(os.path.join(os.path.dirname(__file__),'../data',jsonFile), encoding='utf8') as constfile:  			
-			constdict = json.load(constfile)
+		The file is streamed one feature at a time. predicate is an optional function which rejects a feature by returning False.
+		'''
 
-		for body in constdict['features']:
+		for body in iterFeatures(os.path.join(os.path.dirname(__file__),'../data',jsonFile), predicate):
 
 			thisID = body['id']
 			thisMultiCoord = body['geometry']['coordinates'] 
@@ -135,12 +106,27 @@ class sky():
 
 		return self
 
-	def makeGalaxy(self, source, samplesPerDegree):
+	def makeGalaxy(self, source, samplesPerDegree, mode='blobs', levels=(0.1, 0.2, 0.3), minArea=4.0, seed=None, extents=None, workers=None):
 		'''
-		Create and assign the galactic background shapes based on the source image
+		Create and assign the galactic background shapes based on the source image.
+
+		mode 'blobs' scatters galacticBlobs over it, mode 'contours' traces its brightness at levels into a few banded polygons (see galaxy).
+		mode 'outlines' reads vector outlines from a GeoJSON source such as mw.json instead, decimated to about samplesPerDegree vertices
+		per degree, or kept whole if samplesPerDegree is None.
+
+		Blobs are random, unless a seed is given: then they are the same every run, and cached on disk after the first.
+
+		Only the part of the source covering extents [[minRA, maxRA],[minDec, maxDec]] is used, or the boundary's extents if the sky already has one.
+
+		workers sets how many processes make blobs at once. The blobs come out the same for any number of workers.
+		Where processes are spawned rather than forked (Windows, macOS, and by default from Python 3.14) each worker imports the calling script,
+		so scripts using workers must run under an if __name__ == '__main__': guard, as _whck.py does.
 		'''
 
-		self.objects['galaxy']=galaxy(source, samplesPerDegree)
+		if extents is None and self.objects.get('boundary') is not None:
+			extents = self.objects['boundary'].getExtents()
+
+		self.objects['galaxy']=galaxy(source, samplesPerDegree, mode, levels, minArea, seed, extents=extents, workers=workers)
 
 		return self
 
@@ -154,14 +140,11 @@ class sky():
 		print('\nThis sky contains:\n')
 
 		print('STARS ({0})'.format(len(self.objects['stars'])))
-		RAs = [body.RA for body in self.objects['stars']]
-		print('RA\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} \tdegrees'.format(min(RAs), max(RAs)))
-		decs = [body.dec for body in self.objects['stars']]
-		print('Dec\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} \tdegrees'.format(min(decs), max(decs)))
-		mags = [body.mag for body in self.objects['stars']]
-		print('Mag\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} '.format(min(mags), max(mags)))
-		BVs = [body.BV for body in self.objects['stars']]
-		print('BV\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} '.format(min(BVs), max(BVs)))
+		stars = self.objects['stars']
+		print('RA\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} \tdegrees'.format(stars.RA.min(), stars.RA.max()))
+		print('Dec\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} \tdegrees'.format(stars.dec.min(), stars.dec.max()))
+		print('Mag\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} '.format(stars.mag.min(), stars.mag.max()))
+		print('BV\tMin: ~{0:0.2f} \tMax: ~{1:0.2f} '.format(stars.BV.min(), stars.BV.max()))
 
 		print('\nCONSTELLATIONS ({0})\n'.format(len(self.objects['constellations'])))
 		members=[con.isPopulated() for con in self.objects['constellations']]
@@ -174,17 +157,27 @@ class sky():
 
 	# Self-modification functions
 
-	def filterAndInterpolate(self,configurationName, nodesPerUnit):
+	def filterAndInterpolate(self,configurationName, nodesPerUnit=None, tolerance=None, majorDim=200, projection='stereographic'):
 		'''
 		Filter the objects of the sky to include only those matching a set of conditions.
 
 		Conditions are defined in a named block (configurationName) in the _bounds.ini file.
 
-		Line items are then interpolated and filtered separately so they draw up to the boundary neatly.
+		Constellation lines are clipped exactly at the boundary so they draw up to it neatly, and interpolated, either:
+		- at a fixed nodesPerUnit nodes per degree, after clipping, or
+		- adaptively, if a tolerance (in mm) is given instead. Vertices are then only added where a line would otherwise deviate from its
+		  true projected path by more than tolerance, on a board of majorDim mm laid out with the named projection (see sky.project).
+		  Constellation lines follow great circles, and are refined before clipping, so they are cut where those paths meet the boundary.
+		  The boundary follows lines of constant RA/dec like the region it encloses.
+
+		Exactly one of nodesPerUnit and tolerance must be given.
 
 		Later we may overload this function to allow for inline condition setting too.
 		'''
 
+		if (nodesPerUnit is None) == (tolerance is None):
+			raise ValueError('filterAndInterpolate needs exactly one of nodesPerUnit or tolerance, got nodesPerUnit={} and tolerance={}'.format(nodesPerUnit, tolerance))
+
 		# First we read data from the relevant block in the configuration file
 
 		config=configparser.ConfigParser()
@@ -192,6 +185,11 @@ class sky():
 
 		self.name=config[configurationName]['name']
 
+		# Filtering changes the objects, so any buffer kept from an earlier projection (and its name) no longer applies
+
+		self.projection=None
+		self.unprojected=None
+
 		centroidList=json.loads(config[configurationName]['centroid'])
 		self.centroid=position(centroidList[0], centroidList[1])
 
@@ -201,49 +199,81 @@ class sky():
 
 		# Then we filter stars based on this data
 
-		self.objects['stars'] = list(filter(lambda x: x.matches(self.objects['boundary'], mags, BVs),self.objects['stars']))
+		self.objects['stars'].select(self.objects['stars'].matches(self.objects['boundary'], mags, BVs))
 
 		# Now lets filter the radec grid on this data
 		# Don't bother interpolating the RADEC grid because it is already small.
 
 		self.objects['grid'].filter(self.objects['boundary'])
 
-		# Now let's interpolate the constellation lines
+		# Now let's clip the constellation lines exactly against the boundary, so they draw up to it neatly, and interpolate them so
+		# they curve properly once projected. Refined lines are refined first along their whole great circles, as far as they could
+		# reach the boundary, so they are cut where their true paths cross it and never bow back out of it
 
-		if self.objects['constellations']:
-			for con in self.objects['constellations']:
-				con.interpolate(nodesPerUnit)
-
-		# And then filter them
+		if tolerance is not None:
+			project = self.makeOutputProjector(majorDim, projection)
 
 		newConstellationList=[]
 		for con in self.objects['constellations']:
-			con.filterAndCut(self.objects['boundary'])
+			if tolerance is None:
+				con.clip(self.objects['boundary'])
+				con.interpolate(nodesPerUnit)
+			else:
+				con.dropDistantMembers(self.objects['boundary'])
+				con.refine(project, tolerance)
+				con.clip(self.objects['boundary'])
 			if con.isPopulated():
 				newConstellationList.append(con)
 		self.objects['constellations']=newConstellationList
 
 		# Now we filter the galaxy, jealously cutting blobs so they fit on the drawing
+		# Contour and outline polygons cover whole regions, so they are clipped as polygons instead, keeping their area (and holes) inside the boundary
 		# No need to interpolate since these are dense already
-		self.objects['galaxy'].filter(self.objects['boundary'])
+		if self.objects['galaxy'].mode in ('contours', 'outlines'):
+			self.objects['galaxy'].clipPolygons(self.objects['boundary'])
+		else:
+			self.objects['galaxy'].filter(self.objects['boundary'])
 
 		# Now finally we can interpolate the boundary
 
 		if self.objects['boundary']:
-			self.objects['boundary'].interpolate(nodesPerUnit)
+			if tolerance is None:
+				self.objects['boundary'].interpolate(nodesPerUnit)
+			else:
+				self.objects['boundary'].refine(project, tolerance, greatCircle=False)
 
 		# Later we will filter other object types here too
 
 		return self
 
-	def stereoProject(self):
+	def makeOutputProjector(self, majorDim, projection='stereographic', R=100):
 		'''
-		Projects all objects in the sky stereographically, about a centroid, with an R value.
+		Returns a function mapping arrays of RAs and decs to [xs, ys] in millimetres on a board of majorDim mm, for the named projection.
+
+		The scale comes from the projected boundary, the same way normalise and the board will scale it.
 		'''
 
-		# All objects in self.objects need to be projected.
+		projector = getProjection(projection)
+
+		# Project a lightly interpolated copy of the boundary to find its greatest extent
 
-		R=100
+		outline = self.objects['boundary'].getCopy()
+		outline.interpolate(1.0)
+		[xs, ys] = projector(*outline.getCoordsAsArrays(), self.centroid, R)
+		mmPerUnit = majorDim / max(xs.max()-xs.min(), ys.max()-ys.min())
+
+		def project(RAs, decs):
+			[projectedXs, projectedYs] = projector(RAs, decs, self.centroid, R)
+			return [projectedXs*mmPerUnit, projectedYs*mmPerUnit]
+
+		return project
+
+	def getGeometry(self):
+		'''
+		Returns a flat list of every populated item in the objects dictionary (lists are expanded into their members).
+		'''
+
+		items=[]
 
 		for key in self.objects.keys():
 
@@ -251,17 +281,76 @@ class sky():
 			if type(self.objects[key]) is type(None):
 				continue
 
-			# If it's a list, then each entry in the list will offer a projection method.
+			# If it's a list, then each entry in the list is an item.
 			elif type(self.objects[key]) is list:
-				for item in self.objects[key]:
-					item.stereoProject(self.centroid,R)
+				items.extend(self.objects[key])
 
-			# If it's a single item (e.g. the boundary or RADEC grid), then do the stereo projection on it.
+			# Otherwise it's a single item (e.g. the boundary, RADEC grid or star table)
 			else:
-				self.objects[key].stereoProject(self.centroid,R)
+				items.append(self.objects[key])
+
+		return items
+
+	def project(self, name, R=100, centroid=None, **params):
+		'''
+		Projects all objects in the sky with the named projection (see _projection.projections), about a centroid, with an R value.
+
+		Every coordinate in the sky is gathered into one buffer, projected in a single vectorised pass, and handed back to its owner.
+
+		The unprojected RA/dec buffer is kept, so project can be called again (even after normalise) to try another layout of the same region.
+		Once the objects' vertices change (e.g. through simplify) that buffer no longer fits them, and projecting again raises a ValueError.
+		Any further params are passed on to the projection function.
+		'''
+
+		projection = getProjection(name)
+
+		if centroid is None:
+			centroid = self.centroid
+
+		items = self.getGeometry()
+
+		# Reuse the RA/dec buffer from an earlier projection of exactly these objects, each still with as many vertices, otherwise gather a fresh one
+
+		if self.isUnprojectedCurrent(items):
+			[items, RAs, decs, splits] = self.unprojected
+		elif self.projection is not None:
+			# Its coords are already projected, and the RA/dec they came from no longer fit it
+			raise ValueError('The sky has changed (e.g. been simplified) since its {} projection, so it can no longer be reprojected. Build it again to project it another way'.format(self.projection))
+		else:
+			[RAs, decs, splits] = gatherCoords(items)
+			self.unprojected = [items, RAs, decs, splits]
+
+		[xs, ys] = projection(RAs, decs, centroid, R, **params)
+		scatterCoords(items, xs, ys, splits)
+
+		self.projection = name
 
 		return self
 
+	def isUnprojectedCurrent(self, items):
+		'''
+		Checks whether the RA/dec buffer kept by project still belongs to items: the same objects, in order, each with as many vertices as then.
+		'''
+
+		if self.unprojected is None:
+			return False
+
+		[keptItems, RAs, decs, splits] = self.unprojected
+
+		if len(keptItems)!=len(items) or not all(a is b for a, b in zip(keptItems, items)):
+			return False
+
+		lengths = np.diff(np.concatenate(([0], splits, [len(RAs)])))
+
+		return all(len(item.getCoordsAsArrays()[0])==length for item, length in zip(items, lengths.tolist()))
+
+	def stereoProject(self):
+		'''
+		Projects all objects in the sky stereographically, about a centroid, with an R value.
+		'''
+
+		return self.project('stereographic', R=100)
+
 	def normalise(self):
 		'''
 		Centre everything about 0,0 and squash/stretch it so the greatest extents are -1->+1
@@ -307,8 +396,40 @@ class sky():
 				for item in self.objects[key]:
 					item.scaleAndCentre(scalefunc,c)
 
-			# If it's a single item (e.g. the boundary or RADEC grid), then do the stereo projection on it.
+			# If it's a single item (e.g. the boundary, RADEC grid or star table), then scale and centre it.
 			else:
 				self.objects[key].scaleAndCentre(scalefunc,c)		
 
-		return self
\ No newline at end of file
+		return self
+
+	def simplify(self, tolerance, majorDim=200):
+		'''
+		Removes vertices from the boundary, grid, constellations and galaxy that would not visibly change them on the output,
+		to keep boards and drawings small. Call it after normalise.
+
+		tolerance is the furthest (in mm) a removed vertex may lie from the simplified line, on an output majorDim mm across.
+		'''
+
+		# normalise maps the greatest extent to -1 -> +1, which the output then stretches across majorDim
+
+		unitsTolerance = 2*tolerance/majorDim
+
+		items = []
+		for value in self.objects.values():
+			if type(value) is list:
+				items.extend(value)
+			elif isinstance(value, (polyline, multiPolyline)):
+				items.append(value)
+
+		before = sum(len(item.coords) for item in items)
+		for item in items:
+			item.simplify(unitsTolerance)
+		after = sum(len(item.coords) for item in items)
+
+		# The kept RA/dec buffer no longer matches the simplified objects
+
+		self.unprojected=None
+
+		print('Simplified to {0}mm: removed {1} of {2} vertices'.format(tolerance, before-after, before))
+
+		return self
@@ -0,0 +1,226 @@
+# _skyimage.py
+
+# Reads whole-sky images (RA -180 to 180 left to right, dec 90 to -90 top to bottom) decoded no larger than the sampling needs,
+# and in tiles, so that repeated reads of any part of the sky come straight from a cache.
+
+# imports
+
+import os
+import math
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from starwhacker._tools import makeInterpolator, writeAtomically
+from starwhacker._catalog import cacheRoot, getSourceSignature
+
+# Decoded tiles live in data/_cache/images/<image>/, one .npy file per tile, and the most recently used stay in memory, shared by every skyImage
+
+imageCacheRoot = os.path.join(cacheRoot, 'images')
+
+# The most tile data kept in memory at once, in bytes
+
+maxLoadedTileBytes = 1 << 28
+
+class tileCache():
+	'''A class which keeps tiles in memory by key, dropping the least recently used once they take more than maxBytes.'''
+
+	def __init__(self, maxBytes):
+
+		self.maxBytes = maxBytes
+		self.tiles = OrderedDict()
+		self.bytes = 0
+
+	def get(self, key):
+		'''
+		Returns the tile kept under key, or None if there isn't one, and marks it as the most recently used.
+		'''
+
+		tile = self.tiles.get(key)
+		if tile is not None:
+			self.tiles.move_to_end(key)
+
+		return tile
+
+	def keep(self, key, tile):
+		'''
+		Keeps tile under key as the most recently used, dropping the least recently used tiles until they all fit.
+		'''
+
+		if key in self.tiles:
+			self.bytes -= self.tiles.pop(key).nbytes
+
+		self.tiles[key] = tile
+		self.bytes += tile.nbytes
+
+		while self.bytes > self.maxBytes and len(self.tiles) > 1:
+			self.bytes -= self.tiles.popitem(last=False)[1].nbytes
+
+		return None
+
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+loadedTiles = tileCache(maxLoadedTileBytes)
+
+class skyImage():
+	'''A class which reads the RGB pixels of a whole-sky image in tiles, decoded at the coarsest scale that still gives the resolution asked for.'''
+
+	def __init__(self, path, minWidth=1, minHeight=1, tileSize=256):
+
+		self.path = path
+		self.tileSize = tileSize
+
+		# Opening only reads the header, so this is cheap
+
+		with Image.open(path) as source:
+			[fullWidth, fullHeight] = source.size
+
+		# Halve the scale (down to 1/8, which JPEG can decode directly) while the image stays at least minWidth x minHeight
+
+		self.reduction = 1
+		while self.reduction < 8 and fullWidth//(2*self.reduction) >= minWidth and fullHeight//(2*self.reduction) >= minHeight:
+			self.reduction *= 2
+
+		self.width = -(-fullWidth//self.reduction)
+		self.height = -(-fullHeight//self.reduction)
+		self.rowsOfTiles = -(-self.height//tileSize)
+		self.columnsOfTiles = -(-self.width//tileSize)
+
+		self.degToPixScaleX = makeInterpolator([-180, 180], [0, self.width-1])
+		self.degToPixScaleY = makeInterpolator([-90, 90], [self.height-1, 0]) # Image pixels are upside down, naturally
+
+		# Tiles are kept per source file version and scale
+
+		signature = getSourceSignature(path)
+		self.key = '{}_{}_{}_{}'.format(os.path.splitext(os.path.basename(path))[0], signature['size'], signature['mtime'], self.reduction)
+		self.tilePath = os.path.join(imageCacheRoot, self.key)
+
+	# Simple utility functions
+
+	def getTile(self, row, column):
+		'''
+		Returns the tile at row, column as an array of RGB pixels, from memory, the disk cache, or failing those by decoding the image.
+		'''
+
+		key = (self.key, row, column)
+		tile = loadedTiles.get(key)
+
+		if tile is None:
+			try:
+				tile = np.load(os.path.join(self.tilePath, '{}_{}.npy'.format(row, column)))
+			except (OSError, ValueError):
+				tile = self.getTileOf(self.decode(), row, column)
+			loadedTiles.keep(key, tile)
+
+		return tile
+
+	def getTileOf(self, pixels, row, column):
+		'''
+		Returns the tile at row, column of the whole image's pixels, as a copy.
+		'''
+
+		return pixels[row*self.tileSize:(row+1)*self.tileSize, column*self.tileSize:(column+1)*self.tileSize].copy()
+
+	def getPixels(self, xs, ys):
+		'''
+		Returns the RGB values of the pixels at (xs[n], ys[n]) as an Nx3 array, reading only the tiles they fall in.
+		'''
+
+		xs = np.asarray(xs, dtype=int)
+		ys = np.asarray(ys, dtype=int)
+		pixels = np.zeros((len(xs), 3), dtype=np.uint8)
+
+		[rows, columns] = [ys//self.tileSize, xs//self.tileSize]
+		tiles = rows*self.columnsOfTiles + columns
+
+		for tile in np.unique(tiles):
+			[row, column] = divmod(int(tile), self.columnsOfTiles)
+			inTile = tiles==tile
+			pixels[inTile] = self.getTile(row, column)[ys[inTile]-row*self.tileSize, xs[inTile]-column*self.tileSize]
+
+		return pixels
+
+	def getRegion(self, left, top, right, bottom):
+		'''
+		Returns the pixels in columns left:right and rows top:bottom as a height x width x RGB array, put together from the tiles it covers.
+		'''
+
+		region = np.zeros((bottom-top, right-left, 3), dtype=np.uint8)
+
+		for row in range(top//self.tileSize, -(-bottom//self.tileSize)):
+			for column in range(left//self.tileSize, -(-right//self.tileSize)):
+
+				# The part of this tile inside the region, in image pixels
+
+				tileTop = row*self.tileSize
+				tileLeft = column*self.tileSize
+				[y0, y1] = [max(top, tileTop), min(bottom, tileTop+self.tileSize)]
+				[x0, x1] = [max(left, tileLeft), min(right, tileLeft+self.tileSize)]
+
+				region[y0-top:y1-top, x0-left:x1-left] = self.getTile(row, column)[y0-tileTop:y1-tileTop, x0-tileLeft:x1-tileLeft]
+
+		return region
+
+	def getPixelBox(self, extents, margin=0.0):
+		'''
+		Returns [left, top, right, bottom], the pixels covering extents [[minRA, maxRA],[minDec, maxDec]] grown by margin degrees,
+		and the [[minRA, maxRA],[minDec, maxDec]] those pixels actually span, both limited to the sky.
+		'''
+
+		[[minRA, maxRA], [minDec, maxDec]] = extents
+		[minRA, maxRA] = [max(-180, minRA-margin), min(180, maxRA+margin)]
+		[minDec, maxDec] = [max(-90, minDec-margin), min(90, maxDec+margin)]
+
+		left = max(0, int(math.floor(self.degToPixScaleX(minRA))))
+		right = min(self.width, int(math.ceil(self.degToPixScaleX(maxRA)))+1)
+		top = max(0, int(math.floor(self.degToPixScaleY(maxDec))))
+		bottom = min(self.height, int(math.ceil(self.degToPixScaleY(minDec)))+1)
+
+		pixToDegX = makeInterpolator([0, self.width-1], [-180, 180])
+		pixToDegY = makeInterpolator([self.height-1, 0], [-90, 90])
+
+		return [[left, top, right, bottom], [[pixToDegX(left), pixToDegX(right-1)], [pixToDegY(bottom-1), pixToDegY(top)]]]
+
+	# Self-modification functions
+
+	def prepare(self):
+		'''
+		Decodes the image into the tile cache, unless it is already there.
+		'''
+
+		if not os.path.isdir(self.tilePath):
+			self.decode()
+
+		return None
+
+	def decode(self):
+		'''
+		Decodes the whole image at the reduced scale, keeps its tiles in memory (as many as fit) and in the disk cache, and returns its pixels.
+
+		JPEGs are decoded straight at the reduced scale (see Image.draft), anything else is decoded in full and then scaled down.
+		'''
+
+		with Image.open(self.path) as source:
+			source.draft('RGB', (self.width, self.height))
+			image = source.convert('RGB')
+
+		if image.size != (self.width, self.height):
+			image = image.resize((self.width, self.height), Image.BOX)
+
+		pixels = np.asarray(image)
+
+		for row in range(self.rowsOfTiles):
+			for column in range(self.columnsOfTiles):
+				loadedTiles.keep((self.key, row, column), self.getTileOf(pixels, row, column))
+
+		def write(tempPath):
+			for row in range(self.rowsOfTiles):
+				for column in range(self.columnsOfTiles):
+					np.save(os.path.join(tempPath, '{}_{}.npy'.format(row, column)), self.getTileOf(pixels, row, column))
+
+		writeAtomically(self.tilePath, write, directory=True)
+
+		return pixels
@@ -0,0 +1,300 @@
+# _spatial.py
+
+# Spatial indexes which let region queries skip the parts of the sky that cannot be inside a boundary.
+
+# imports
+
+import math
+import numpy as np
+
+def gatherRanges(order, starts, stops):
+	'''
+	Returns order[starts[0]:stops[0]] + order[starts[1]:stops[1]] + ... as one array, without a Python loop over the ranges.
+	'''
+
+	lengths = stops - starts
+	total = int(lengths.sum())
+	if not total:
+		return np.zeros(0, dtype=order.dtype)
+
+	# Position of each output element within its own range, added onto that range's start
+
+	rangeOfEach = np.repeat(np.arange(len(starts)), lengths)
+	firstOfEach = np.cumsum(lengths) - lengths
+	return order[starts[rangeOfEach] + np.arange(total) - firstOfEach[rangeOfEach]]
+
+
+def spreadBits(values):
+	'''
+	Returns values (16 bit integers, as uint64) with a zero bit inserted after each of their bits, for building Morton codes.
+	'''
+
+	values = values & np.uint64(0xFFFF)
+	for (shift, mask) in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+		values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+
+	return values
+
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+# Defines the skyIndex class, which buckets points into equal-area RA/dec cells so that region queries only look at nearby cells.
+
+class skyIndex():
+	'''A class which sorts a set of RA/dec points into equal-area cells (equal steps in RA and in sin(dec)), and answers boundary queries with it.'''
+
+	def __init__(self, RAs, decs, pointsPerCell=32):
+
+		self.RAs = np.asarray(RAs, dtype=float)
+		self.decs = np.asarray(decs, dtype=float)
+
+		# Aim for roughly pointsPerCell points in each cell, with twice as many cells in RA as in dec, like the sky itself
+
+		cellCount = max(1, len(self.RAs)//pointsPerCell)
+		self.decBands = max(1, int(round(math.sqrt(cellCount/2))))
+		self.RACells = 2*self.decBands
+
+		self.minRA = float(self.RAs.min()) if len(self.RAs) else 0.0
+		maxRA = float(self.RAs.max()) if len(self.RAs) else 0.0
+		self.RAStep = (maxRA-self.minRA)/self.RACells or 1.0
+
+		# Equal steps in sin(dec) give bands of equal area
+
+		self.decEdges = np.degrees(np.arcsin(np.linspace(-1, 1, self.decBands+1)))
+
+		# Sort the points by cell, and record where each cell's run starts in the sorted order
+
+		cells = self.getBand(self.decs)*self.RACells + self.getColumn(self.RAs)
+		self.order = np.argsort(cells, kind='stable')
+		self.offsets = np.searchsorted(cells[self.order], np.arange(self.decBands*self.RACells+1))
+
+	# Simple utility functions
+
+	def getColumn(self, RAs):
+		'''
+		Returns the RA column of each RA, clamped to the grid.
+		'''
+
+		return np.clip(np.floor((np.asarray(RAs, dtype=float)-self.minRA)/self.RAStep).astype(int), 0, self.RACells-1)
+
+	def getBand(self, decs):
+		'''
+		Returns the dec band of each dec, clamped to the grid.
+		'''
+
+		return np.clip(np.searchsorted(self.decEdges, decs, side='right')-1, 0, self.decBands-1)
+
+	def getCellBoxes(self, cells):
+		'''
+		Returns the extents of each cell as rows of [minRA, maxRA, minDec, maxDec]
+		'''
+
+		bands, columns = np.divmod(cells, self.RACells)
+		minRAs = self.minRA + columns*self.RAStep
+
+		return np.stack([minRAs, minRAs+self.RAStep, self.decEdges[bands], self.decEdges[bands+1]], axis=1)
+
+	def query(self, boundary):
+		'''
+		Returns the sorted indices of the points which fall within the boundary (a polyline).
+
+		Only cells overlapping the boundary's extents are considered. Cells wholly inside the boundary are taken whole,
+		and only the points in cells crossing the boundary are tested one by one.
+		'''
+
+		if not len(self.RAs) or not boundary.isClosed():
+			return np.zeros(0, dtype=int)
+
+		[[minRA, maxRA], [minDec, maxDec]] = boundary.getExtents()
+
+		# Gather the non-empty cells that overlap the boundary's extents
+
+		columns = np.arange(self.getColumn(minRA), self.getColumn(maxRA)+1)
+		bands = np.arange(self.getBand(minDec), self.getBand(maxDec)+1)
+		cells = (bands[:,None]*self.RACells + columns[None,:]).ravel()
+		cells = cells[self.offsets[cells+1] > self.offsets[cells]]
+
+		# Accept whole cells which lie wholly inside, test the rest point by point
+
+		whole = boundary.containsBoxes(self.getCellBoxes(cells))
+
+		accepted = gatherRanges(self.order, self.offsets[cells[whole]], self.offsets[cells[whole]+1])
+		candidates = gatherRanges(self.order, self.offsets[cells[~whole]], self.offsets[cells[~whole]+1])
+		candidates = candidates[boundary.containsPoints(self.RAs[candidates], self.decs[candidates])]
+
+		return np.sort(np.concatenate((accepted, candidates)))
+
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+# Defines the boxTree class, a bounding volume hierarchy which lets region queries settle whole groups of members at once.
+
+class boxTree():
+	'''A class which arranges a set of boxes ([minRA, maxRA, minDec, maxDec] rows) into a balanced hierarchy of bounding boxes, and answers boundary queries with it.'''
+
+	def __init__(self, boxes, leafSize=16):
+
+		self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+		self.leafSize = leafSize
+
+		# Put boxes near each other next to each other, by interleaving the bits of their quantised centres (Morton order)
+
+		# Inverted boxes (see multiPolyline.getMemberBoxes) have no centre, and go at the origin
+
+		with np.errstate(invalid='ignore'):
+			centres = np.nan_to_num(np.column_stack(((self.boxes[:,0]+self.boxes[:,1])/2, (self.boxes[:,2]+self.boxes[:,3])/2)))
+		if len(centres):
+			span = np.ptp(centres, axis=0)
+			cells = ((centres-centres.min(axis=0)) / np.where(span>0, span, 1) * 65535).astype(np.uint64)
+		else:
+			cells = np.zeros((0,2), dtype=np.uint64)
+
+		self.order = np.argsort(spreadBits(cells[:,0]) | (spreadBits(cells[:,1]) << np.uint64(1)), kind='stable')
+
+		# Each level groups runs of the ordered boxes, twice as long as the level below, from single leaves up to the whole set.
+		# A node is the box around its run, so node n's children on the level below are nodes 2n and 2n+1.
+
+		ordered = self.boxes[self.order]
+		self.levels = []
+		runLength = leafSize
+		while True:
+			starts = np.arange(0, len(ordered), runLength)
+			self.levels.append((runLength, np.column_stack((np.minimum.reduceat(ordered[:,0], starts), np.maximum.reduceat(ordered[:,1], starts),
+				np.minimum.reduceat(ordered[:,2], starts), np.maximum.reduceat(ordered[:,3], starts))) if len(starts) else np.zeros((0,4))))
+			if runLength >= len(ordered):
+				break
+			runLength *= 2
+
+		self.levels.reverse()
+
+	def query(self, boundary):
+		'''
+		Returns [inside, crossing], two boolean arrays with an entry per box: true where the box lies wholly within the boundary (a polyline),
+		and true where it may cross it (it shares a leaf with a box crossing the boundary). Boxes which are neither lie wholly outside.
+
+		Nodes are tested from the top down, so whole groups lying inside or outside the boundary are settled without looking at their members.
+		'''
+
+		count = len(self.boxes)
+		inside = np.zeros(count, dtype=bool)
+		crossing = np.zeros(count, dtype=bool)
+
+		if not count:
+			return [inside, crossing]
+
+		nodes = np.zeros(1, dtype=int)
+
+		for (runLength, nodeBoxes) in self.levels:
+
+			# Settle the nodes which lie wholly inside or outside, and carry on into the children of the rest
+
+			[within, clear] = boundary.classifyBoxes(nodeBoxes[nodes])
+			settled = within | clear
+
+			starts = nodes[within]*runLength
+			inside[gatherRanges(self.order, starts, np.minimum(starts+runLength, count))] = True
+
+			nodes = nodes[~settled]
+			if runLength > self.leafSize:
+				nodes = np.concatenate((2*nodes, 2*nodes+1))
+				nodes = nodes[nodes*runLength//2 < count]
+
+		# What is left are leaves crossing the boundary, whose members are all left to be tested point by point
+
+		starts = nodes*self.leafSize
+		crossing[gatherRanges(self.order, starts, np.minimum(starts+self.leafSize, count))] = True
+
+		return [inside, crossing]
+
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+# Defines the pointGrid class, which buckets points on the board into square cells so that searches near a point only look at the cells around it.
+
+class pointGrid():
+	'''A class which sorts a set of planar points into a uniform grid of square cells, cellSize across, and finds the points near a position with it.'''
+
+	def __init__(self, xs, ys, cellSize):
+
+		self.xs = np.asarray(xs, dtype=float)
+		self.ys = np.asarray(ys, dtype=float)
+		self.cellSize = float(cellSize)
+
+		self.minX = float(self.xs.min()) if len(self.xs) else 0.0
+		self.minY = float(self.ys.min()) if len(self.ys) else 0.0
+		self.columns = int((float(self.xs.max())-self.minX)//self.cellSize)+1 if len(self.xs) else 1
+		self.rows = int((float(self.ys.max())-self.minY)//self.cellSize)+1 if len(self.ys) else 1
+
+		# Sort the points by cell, row by row, and record where each cell's run starts in the sorted order
+
+		[columns, rows] = self.getColumnsAndRows(self.xs, self.ys)
+		cells = rows*self.columns + columns
+		self.order = np.argsort(cells, kind='stable')
+		self.offsets = np.searchsorted(cells[self.order], np.arange(self.rows*self.columns+1))
+
+	# Simple utility functions
+
+	def getColumnsAndRows(self, xs, ys):
+		'''
+		Returns [columns, rows], the cell of each position, clamped to the grid.
+		'''
+
+		columns = np.clip(np.floor((np.asarray(xs, dtype=float)-self.minX)/self.cellSize).astype(int), 0, self.columns-1)
+		rows = np.clip(np.floor((np.asarray(ys, dtype=float)-self.minY)/self.cellSize).astype(int), 0, self.rows-1)
+
+		return [columns, rows]
+
+	def getNearby(self, x, y, reach):
+		'''
+		Returns the indices of the points in every cell touching the square within reach of (x, y), which includes every point within reach of it.
+		'''
+
+		# Worked out on plain numbers, since this is called once per step of a search
+
+		firstColumn = min(max(int((x-reach-self.minX)//self.cellSize), 0), self.columns-1)
+		lastColumn = min(max(int((x+reach-self.minX)//self.cellSize), 0), self.columns-1)
+		firstRow = min(max(int((y-reach-self.minY)//self.cellSize), 0), self.rows-1)
+		lastRow = min(max(int((y+reach-self.minY)//self.cellSize), 0), self.rows-1)
+
+		# Each row's cells are consecutive in the sorted order, so every row is one range of it
+
+		rows = np.arange(firstRow, lastRow+1)
+
+		return gatherRanges(self.order, self.offsets[rows*self.columns + firstColumn], self.offsets[rows*self.columns + lastColumn + 1])
+
+	def getPairs(self, distance):
+		'''
+		Returns [firsts, seconds, distances]: every pair of points no further than distance apart, once each (firsts < seconds), and how far apart they are.
+
+		Each point is only paired with the points in the cells within distance of its own, a cell offset at a time.
+		'''
+
+		reach = int(math.ceil(distance/self.cellSize))
+		[columns, rows] = self.getColumnsAndRows(self.xs, self.ys)
+
+		[allFirsts, allSeconds, allDistances] = [[np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)], [np.zeros(0)]]
+
+		for rowStep in range(-reach, reach+1):
+			for columnStep in range(-reach, reach+1):
+
+				# The cell at this offset from every point's own, where there is one
+
+				[otherColumns, otherRows] = [columns+columnStep, rows+rowStep]
+				points = np.flatnonzero((0<=otherColumns) & (otherColumns<self.columns) & (0<=otherRows) & (otherRows<self.rows))
+				cells = otherRows[points]*self.columns + otherColumns[points]
+
+				[starts, stops] = [self.offsets[cells], self.offsets[cells+1]]
+				seconds = gatherRanges(self.order, starts, stops)
+				firsts = np.repeat(points, stops-starts)
+
+				distances = np.hypot(self.xs[seconds]-self.xs[firsts], self.ys[seconds]-self.ys[firsts])
+				keep = (firsts < seconds) & (distances <= distance)
+
+				allFirsts.append(firsts[keep])
+				allSeconds.append(seconds[keep])
+				allDistances.append(distances[keep])
+
+		return [np.concatenate(allFirsts), np.concatenate(allSeconds), np.concatenate(allDistances)]
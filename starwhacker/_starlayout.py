@@ -0,0 +1,46 @@
+# _starlayout.py
+
+# Lays a sky's stars out as pads, once for every output: where each goes, how large it is, its drill, and which stars survive the clearance.
+
+# imports
+
+import numpy as np
+
+from starwhacker._tools import makeInterpolator, getStarSizeTenths, getDrillTenths
+from starwhacker._clearance import resolveClearance
+
+# Pad diameters of the faintest and brightest stars, in mm
+
+ringMin = 0.8
+ringMax = 4
+
+def getStarLayout(stars, scaleX, scaleY, clearance=None, clearancePolicy='drop'):
+	'''
+	Returns [xs, ys, sizes, drills, names] for the pads of a table of stars: centres in mm (placed by scaleX and scaleY),
+	and ring and drill diameters in integer tenths of a mm (see getStarSizeTenths), with a drill of 0 for surface pads.
+
+	With a clearance (in mm), pads which overlap or come closer than it are resolved by clearancePolicy first (see resolveClearance),
+	and only the stars left are returned, with drills to suit any new sizes.
+	'''
+
+	starScale = makeInterpolator([stars.mag.max(),stars.mag.min()], [ringMin, ringMax])
+
+	# Scale the star table's coordinate columns once, rather than star by star
+
+	xs = scaleX(stars.RA)
+	ys = scaleY(stars.dec)
+	[sizes, drills] = getStarSizeTenths(stars.mag, starScale)
+	names = stars.name
+
+	if clearance is None:
+		return [xs, ys, sizes, drills, names]
+
+	[rows, xs, ys, newSizes, report] = resolveClearance(xs, ys, sizes/10, stars.mag, clearance, clearancePolicy,
+		sizeOf=lambda mags: np.round(starScale(mags), 1), minSize=ringMin)
+
+	print('Pad clearance of {}mm: {} conflicts, {} stars dropped, {} merged away, {} shrunk'.format(clearance, report['conflicts'],
+		report['dropped'], report['merged'], report['shrunk']))
+
+	sizes = np.rint(newSizes*10).astype(np.int64)
+
+	return [xs, ys, sizes, getDrillTenths(sizes), names[rows]]
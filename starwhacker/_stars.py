@@ -1,16 +1,26 @@
 # _stars.py
 
 from starwhacker._coordinates import position
+from starwhacker._spatial import skyIndex
+from starwhacker._projection import stereographic
+
+import numpy as np
 
 # Defines the star class which inherits from the position class
 
 class star(position):
 	'''A class which defines a star, including technical information, and several utility functions'''
 
+	__slots__ = ('ID', 'name', 'mag', 'BV', 'desig', 'con')
+
 	def __init__(self, ID, name, rightAscension, declination, magnitude, blueVioletIndex, designation, constellation):
 
 		super().__init__(rightAscension, declination)
 
+		# The catalogue ID
+
+		self.ID=ID
+
 		# The name
 
 		self.name=name
@@ -38,14 +48,14 @@ class star(position):
 		Returns a copy of itself.
 		'''
 
-		return star(self.ID, self.RA, self.dec, self.mag, self.BV, self.desig, self.constellation)
+		return star(self.ID, self.name, self.RA, self.dec, self.mag, self.BV, self.desig, self.con)
 
 	def matches(self, boundary, mags, BVs):
 		'''
 		Returns true if it matches the specified conditions:
 		boundary is a polyline which it must fall within.
 		mags is a list [minMag, maxMag] which its mag value must be in range
-		ditto BVs 
+		ditto BVs
 		'''
 
 		if (self.isInsidePolyline(boundary) and mags[0]<=self.mag<=mags[1] and BVs[0]<=self.BV<=BVs[1]):
@@ -53,3 +63,192 @@ class star(position):
 		else:
 			return False
 
+
+##--------------------------------------------------------------------------------------------------------------------------------##
+
+
+# Defines the starTable class, which holds a whole catalogue of stars as contiguous columns rather than one object per star.
+
+class starTable():
+	'''A class which holds many stars as parallel arrays (RA, dec, mag, BV, ID, name, desig, con), and several functions to filter and modify them all at once.'''
+
+	def __init__(self, IDs=(), names=(), rightAscensions=(), declinations=(), magnitudes=(), blueVioletIndices=(), designations=(), constellations=()):
+
+		self.ID = np.asarray(IDs, dtype=str)
+		self.name = np.asarray(names, dtype=str)
+		self.RA = np.asarray(rightAscensions, dtype=float)
+		self.dec = np.asarray(declinations, dtype=float)
+		self.mag = np.asarray(magnitudes, dtype=float)
+		self.BV = np.asarray(blueVioletIndices, dtype=float)
+		self.desig = np.asarray(designations, dtype=str)
+		self.con = np.asarray(constellations, dtype=str)
+
+		# An optional skyIndex over the RA/dec columns, see buildIndex
+
+		self.index = None
+
+	# Simple utility functions
+
+	def __len__(self):
+
+		return len(self.RA)
+
+	def __iter__(self):
+
+		for index in range(len(self)):
+			yield starView(self, index)
+
+	def __getitem__(self, index):
+
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError('starTable index out of range')
+
+		return starView(self, index)
+
+	def isPopulated(self):
+		'''
+		Check whether there are any stars in the table.
+		'''
+
+		return len(self)
+
+	def getExtents(self):
+		'''
+		Returns its x and y extents as [[minX, maxX],[minY, maxY]] (maps to RA and Dec effectively)
+		'''
+
+		return [[self.RA.min(), self.RA.max()], [self.dec.min(), self.dec.max()]]
+
+	def getCoordsAsArrays(self):
+		'''
+		Returns the coordinate columns [RAs, decs]
+		'''
+
+		return [self.RA, self.dec]
+
+	def matches(self, boundary, mags, BVs):
+		'''
+		Returns a boolean array, true for each star which matches the specified conditions (see star.matches).
+
+		If the table has an index (see buildIndex), only the stars in cells near the boundary are tested against it.
+		'''
+
+		inRange = (mags[0]<=self.mag) & (self.mag<=mags[1]) & (BVs[0]<=self.BV) & (self.BV<=BVs[1])
+
+		if self.index is None:
+			return inRange & boundary.containsPoints(self.RA, self.dec)
+
+		inside = np.zeros(len(self), dtype=bool)
+		inside[self.index.query(boundary)] = True
+
+		return inRange & inside
+
+	# Self-modification functions
+
+	def buildIndex(self, starsPerCell=32):
+		'''
+		Builds a skyIndex over the current RA/dec columns, which later calls to matches use for region queries.
+
+		The index is dropped whenever the stars or their coordinates change.
+		'''
+
+		self.index = skyIndex(self.RA, self.dec, starsPerCell)
+
+		return None
+
+	def select(self, selection):
+		'''
+		Keeps only the stars picked out by selection (a boolean mask or an array of indices), in that order.
+		'''
+
+		for column in ('ID', 'name', 'RA', 'dec', 'mag', 'BV', 'desig', 'con'):
+			setattr(self, column, getattr(self, column)[selection])
+
+		self.index = None
+
+		return None
+
+	def scaleAndCentre(self, scalefunc, centre):
+		'''
+		Scales and centres the coordinates of every star, given a scale function 'scalefunc' and the old centroid 'centre'.
+
+		scalefunc is a linear interpolator function made with makeInterpolator.
+
+		centre is a position object.
+		'''
+
+		self.RA = scalefunc(self.RA-centre.RA)
+		self.dec = scalefunc(self.dec-centre.dec)
+		self.index = None
+
+		return None
+
+	def stereoProject(self, lonLatCentroid, R):
+		'''
+		Stereo transforms every star from a RA Dec coordinate to a cartesian coordinate following a projection.
+		'''
+
+		self.setCoordsFromArrays(*stereographic(self.RA, self.dec, lonLatCentroid, R))
+
+		return None
+
+	def setCoordsFromArrays(self, RAs, decs):
+		'''
+		Replaces the coordinate columns, e.g. after a batched projection
+		'''
+
+		self.RA = np.asarray(RAs, dtype=float)
+		self.dec = np.asarray(decs, dtype=float)
+		self.index = None
+
+		return None
+
+
+# Defines the starView class, a light stand-in for a star object which reads and writes one row of a starTable
+
+class starView():
+	'''A class which gives attribute access (RA, dec, mag, BV, ID, name, desig, con) to a single row of a starTable'''
+
+	__slots__ = ('table', 'index')
+
+	def __init__(self, table, index):
+
+		self.table=table
+		self.index=index
+
+	def _column(name):
+
+		def getter(self):
+			return getattr(self.table, name)[self.index].item()
+
+		def setter(self, value):
+			getattr(self.table, name)[self.index] = value
+
+		return property(getter, setter)
+
+	ID = _column('ID')
+	name = _column('name')
+	RA = _column('RA')
+	dec = _column('dec')
+	mag = _column('mag')
+	BV = _column('BV')
+	desig = _column('desig')
+	con = _column('con')
+
+	del _column
+
+	def getCopy(self):
+		'''
+		Returns a standalone star object with the same values.
+		'''
+
+		return star(self.ID, self.name, self.RA, self.dec, self.mag, self.BV, self.desig, self.con)
+
+	def getCoordsAsList(self):
+		'''
+		Returns the coordinates of the star as a list [RA, Dec]
+		'''
+
+		return [self.RA, self.dec]
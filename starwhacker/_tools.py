@@ -9,6 +9,10 @@ import random
 import string
 import math
 import os
+import shutil
+import tempfile
+
+import numpy as np
 
 def makeInterpolator(inputRange,outputRange):
 	'''
@@ -56,18 +60,107 @@ def clamp(val, minimum, maximum):
 
 def getStarSize(star, starScale):
 	'''
-	Returns [ringsize, drillsize] for the hole/pad associated with this star based on a provided scale factor
+	Returns [ringsize, drillsize] in mm for the hole/pad associated with this star based on a provided scale factor (see getStarSizeTenths)
+	'''
+
+	[ringsizes, drillsizes] = getStarSizeTenths([star.mag], starScale)
+
+	return [ringsizes[0].item()/10, drillsizes[0].item()/10]
+
+def getDrillSize(ringsize):
+	'''
+	Returns the drillsize in mm for the hole in a ring of ringsize mm, or 0 if the ring is too small to have one (see getDrillTenths)
+	'''
+
+	return getDrillTenths(np.rint([ringsize*10]).astype(np.int64))[0].item()/10
+
+def getStarSizeTenths(mags, starScale):
+	'''
+	Returns [ringsizes, drillsizes] for an array of star magnitudes, as integer tenths of a millimetre.
+	Rings are mapped from magnitude by starScale and rounded to 0.1mm, and drills are chosen for them by getDrillTenths.
+
+	This is the one sizing rule for every output (boards, drawings and fabrication files). It is worked out in integers,
+	so sizes never land a float rounding error away from the drill they should get.
+	'''
+
+	ringsizes = np.rint(starScale(np.asarray(mags, dtype=float))*10).astype(np.int64)
+
+	return [ringsizes, getDrillTenths(ringsizes)]
+
+def getDrillTenths(ringsizes):
+	'''
+	Returns the drillsizes for an array of ringsizes, both in integer tenths of a millimetre, with 0 for rings too small to drill.
 	'''
-	
-	ringsize=round(starScale(star.mag),1) # map the size and round to 1 decimal place
 
-	# Next we need to define the drill hole size (if there is one, otherwise return 0)
+	# Drills are 0.8mm smaller than their ring, rounded down to a step of 0.2mm, from 0.6 to 1.2, and only rings of 1.4 or more get one
+
+	drillsizes = np.clip((ringsizes-8) - (ringsizes-8)%2, 6, 12)
+	drillsizes[ringsizes<14] = 0
+
+	return drillsizes
+
+def toNanometres(millimetres):
+	'''
+	Returns an array of millimetres as integer nanometres, the way KiCad holds coordinates itself.
+	'''
 
-	drills=[0.6, 0.8, 1.0, 1.2]
+	return np.rint(np.asarray(millimetres, dtype=float)*1000000).astype(np.int64)
 
-	if ringsize>=1.4:
-		drillsize=clamp(round(ringsize-0.8,1)-((ringsize-0.8)%0.2),0.6,1.2)
-	else:
-		drillsize=0
+def formatNanometres(nanometres):
+	'''
+	Returns an array of integer nanometres as a list of strings of millimetres with six decimal places, formatted from the integers alone.
+	'''
+
+	nanometres = np.asarray(nanometres, dtype=np.int64)
+	[wholes, parts] = np.divmod(np.abs(nanometres), 1000000)
+	signs = np.where(nanometres<0, '-', '')
+
+	return list(map('{}{}.{:06d}'.format, signs.tolist(), wholes.tolist(), parts.tolist()))
+
+def writeAtomically(path, write, directory=False, suffix=''):
+	'''
+	Builds a file (or with directory, a directory) at path by calling write(tempPath) on a temporary one beside it, then moving that into place,
+	replacing any copy already there, so concurrent runs never see half of it. suffix is given to the temporary file, e.g. for np.savez.
+
+	A directory can't be renamed over one that isn't empty, so an old directory is first renamed aside and only removed once the new one
+	is in place: for that moment there is no copy at path, which readers see as a cache miss, but never one half old and half new.
+
+	Meant for caches, which can always be made again: if anything fails (e.g. a read-only disk) the temporary copy is removed
+	and False is returned, otherwise True.
+	'''
 
-	return [ringsize, drillsize]
\ No newline at end of file
+	parent = os.path.dirname(path)
+	tempPath = None
+	asidePath = None
+
+	try:
+		os.makedirs(parent, exist_ok=True)
+
+		if directory:
+			tempPath = tempfile.mkdtemp(prefix='.tmp_', suffix=suffix, dir=parent)
+		else:
+			[handle, tempPath] = tempfile.mkstemp(prefix='.tmp_', suffix=suffix, dir=parent)
+			os.close(handle)
+
+		write(tempPath)
+
+		if directory and os.path.isdir(path):
+			asidePath = tempPath + '_old'
+			os.replace(path, asidePath)
+		os.replace(tempPath, path)
+
+	except OSError:
+		# Another process may have just put its own copy in place (or moved the old one aside first), or there may be nowhere to write one
+		if tempPath is not None:
+			if directory:
+				shutil.rmtree(tempPath, ignore_errors=True)
+			elif os.path.exists(tempPath):
+				os.remove(tempPath)
+		if asidePath is not None:
+			shutil.rmtree(asidePath, ignore_errors=True)
+		return False
+
+	if asidePath is not None:
+		shutil.rmtree(asidePath, ignore_errors=True)
+
+	return True
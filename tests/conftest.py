@@ -0,0 +1,8 @@
+# conftest.py
+
+# Lets the tests import starwhacker from the checkout they live in, however pytest is run.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
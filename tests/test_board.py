@@ -0,0 +1,205 @@
+# test_board.py
+
+import os
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from starwhacker._board import board, getDistinctRuns
+from starwhacker._stars import starTable
+from starwhacker._constellation import constellation
+from starwhacker._coordinates import polyline, multiPolyline
+
+def makeSky():
+	'''
+	Returns a small normalised sky: a few stars, a grid of a circular arc, an S bend, a straight line and a zigzag, a constellation and a galaxy.
+	'''
+
+	angles = np.linspace(0.2, 2.2, 40)
+	bend = np.linspace(0, np.pi, 30)
+	grid = multiPolyline([
+		polyline(np.column_stack((0.5*np.cos(angles), 0.5*np.sin(angles)))),
+		polyline(np.column_stack((np.linspace(-0.8, 0.8, 60), 0.1*np.sin(np.linspace(0, 2*np.pi, 60))))),
+		polyline(np.column_stack((np.linspace(-0.9, 0.9, 25), np.full(25, -0.6)))),
+		polyline([[-0.9, 0.8], [-0.8, 0.9], [-0.7, 0.8], [-0.6, 0.9], [-0.5, 0.8]]),
+		polyline(np.column_stack((0.3 + 0.2*np.cos(bend), -0.3 + 0.2*np.sin(bend)))),
+	])
+
+	stars = starTable(['a', 'b', 'c'], ['Alpha', '', 'Gamma'], [-0.5, 0.0, 0.5], [-0.5, 0.25, 0.5], [1.0, 3.0, 5.0], [0, 0, 0], ['', '', ''], ['Tst']*3)
+
+	return SimpleNamespace(name='Test', objects={
+		'boundary':polyline([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]]),
+		'galaxy':multiPolyline([polyline([[0, 0], [0.1, 0], [0.1, 0.1], [0, 0]])]),
+		'stars':stars,
+		'grid':grid,
+		'constellations':[constellation('Tst', [polyline([[-0.7, -0.2], [-0.2, 0.3], [0.4, 0.2]])])],
+	})
+
+def makeBoard(tmp_path, monkeypatch, sky=None, **options):
+	'''
+	Returns a board of 200mm over sky (or makeSky()) writing into tmp_path rather than output/.
+	'''
+
+	monkeypatch.setattr(os, 'mkdir', lambda path: None)
+	b = board(sky or makeSky(), 200, targetConstellation='Tst', **options)
+	b.storagePath = str(tmp_path)
+
+	return b
+
+def render(b):
+	'''
+	Renders the board and returns the text of the file it wrote.
+	'''
+
+	b.render()
+	[name] = os.listdir(b.storagePath)
+
+	with open(os.path.join(b.storagePath, name)) as file:
+		return file.read()
+
+number = r'(-?\d+(?:\.\d+)?(?:e-?\d+)?)'
+
+def getArcs(text):
+	'''
+	Returns the [centreX, centreY, startX, startY, angle] of every gr_arc and fp_arc in text.
+	'''
+
+	pattern = r'\((?:gr|fp)_arc \(start {0} {0}\) \(end {0} {0}\) \(angle {0}\)'.format(number)
+
+	return np.array(re.findall(pattern, text), dtype=float).reshape(-1, 5)
+
+def getLines(text):
+	'''
+	Returns the [x1, y1, x2, y2] of every gr_line, fp_line and segment in text.
+	'''
+
+	pattern = r'\((?:gr_line|fp_line|segment) \(start {0} {0}\) \(end {0} {0}\)'.format(number)
+
+	return np.array(re.findall(pattern, text), dtype=float).reshape(-1, 4)
+
+def getArcEnds(arcs):
+	'''
+	Returns the [x, y] ends of arcs, their starts swept by their angles about their centres, as KiCad draws them.
+	'''
+
+	[centreXs, centreYs, startXs, startYs, angles] = arcs.T
+	turns = np.radians(angles)
+	[dxs, dys] = [startXs-centreXs, startYs-centreYs]
+
+	return np.column_stack((centreXs + dxs*np.cos(turns) - dys*np.sin(turns), centreYs + dxs*np.sin(turns) + dys*np.cos(turns)))
+
+def findVertex(vertices, point):
+	'''
+	Returns the index of the vertex at point, or None if there isn't one.
+
+	Allows for a tenth of a micron, as a fixedPoint arc's angle (to a millionth of a degree) sweeps the end of a long flat arc that far.
+	'''
+
+	distances = np.hypot(*(vertices-point).T)
+	index = int(np.argmin(distances))
+
+	return index if distances[index] < 1e-4 else None
+
+@pytest.mark.parametrize('fixedPoint', [False, True])
+def test_board_arcs_follow_their_lines_within_tolerance(tmp_path, monkeypatch, fixedPoint):
+
+	sky = makeSky()
+	b = makeBoard(tmp_path, monkeypatch, sky, arcs=True, arcTolerance=0.01, fixedPoint=fixedPoint)
+	text = render(b)
+
+	arcs = getArcs(text)
+	lines = getLines(text)
+	ends = getArcEnds(arcs)
+
+	assert len(arcs)
+
+	grid = sky.objects['grid']
+	for start, stop in zip(grid.offsets[:-1], grid.offsets[1:]):
+
+		vertices = np.column_stack((b.scaleX(grid.coords[start:stop,0]), b.scaleY(grid.coords[start:stop,1])))
+		covered = np.zeros(len(vertices), dtype=bool)
+
+		# Every arc starting on this line ends on a later vertex of it, sweeping the way the line goes, through vertices all within tolerance
+
+		for arc, end in zip(arcs, ends):
+
+			[first, last] = [findVertex(vertices, arc[2:4]), findVertex(vertices, end)]
+			if first is None:
+				continue
+
+			assert last is not None and last > first
+
+			run = vertices[first:last+1]
+			radius = np.hypot(arc[2]-arc[0], arc[3]-arc[1])
+			assert np.abs(np.hypot(run[:,0]-arc[0], run[:,1]-arc[1]) - radius).max() <= 0.01 + 1e-6
+
+			turns = np.diff(np.unwrap(np.arctan2(run[:,1]-arc[1], run[:,0]-arc[0])))
+			assert (np.sign(turns) == np.sign(arc[4])).all()
+			assert np.isclose(np.degrees(turns.sum()), arc[4], atol=1e-4)
+
+			covered[first:last+1] = True
+
+		# And every line starting on it ends on a later vertex of it, with the vertices between within tolerance of it
+
+		for line in lines:
+
+			[first, last] = [findVertex(vertices, line[0:2]), findVertex(vertices, line[2:4])]
+			if first is None or last is None:
+				continue
+
+			assert last > first
+
+			run = vertices[first:last+1]
+			[dx, dy] = line[2:4] - line[0:2]
+			across = ((run[:,0]-line[0])*dy - (run[:,1]-line[1])*dx)/np.hypot(dx, dy)
+			assert np.abs(across).max() <= 0.01 + 1e-6
+
+			covered[first:last+1] = True
+
+		assert covered.all()
+
+def test_getDistinctRuns_drops_repeats_either_way_round_and_points():
+
+	[x1s, y1s, x2s, y2s] = [np.array(values) for values in ([0, 5, 0, 3, 0], [0, 5, 0, 3, 0], [5, 0, 5, 3, 5], [5, 0, 5, 3, 5])]
+
+	assert getDistinctRuns(x1s, y1s, x2s, y2s).tolist() == [True, False, False, False, False]
+
+	# Arcs between the same ends are only the same if they share their centre too
+
+	assert getDistinctRuns(x1s[:2], y1s[:2], x2s[:2], y2s[:2], np.array([1, 1]), np.array([2, 3])).tolist() == [True, True]
+
+def test_fixedPoint_board_leaves_out_degenerate_lines_and_polygons(tmp_path, monkeypatch):
+
+	sky = makeSky()
+
+	# A grid line doubling back over itself, with a repeated vertex, and a line of one repeated point.
+	# Galaxy polygons straddling x=0 on the board, one of which collapses to a line within a nanometre
+
+	sky.objects['grid'] = multiPolyline([polyline([[0, 0], [0.5, 0], [0.5, 0], [0, 0], [0.25, 0.25]]), polyline([[0.1, 0.1], [0.1, 0.1]])])
+	sky.objects['galaxy'] = multiPolyline([polyline([[-1.205, 0], [-1.1, 0], [-1.1, 0.1], [-1.205, 0]]),
+		polyline([[0.3, 0.3], [0.3, 0.3], [0.3+1e-9, 0.3], [0.3, 0.3]])])
+
+	text = render(makeBoard(tmp_path, monkeypatch, sky, fixedPoint=True))
+
+	# Every coordinate drawn is written to exactly six decimals, negative ones included
+
+	assert '(xy -0.500000 ' in text
+	for record in re.findall(r'\((?:start|end|xy) ([^)]*)\)', text) + re.findall(r'\(pad [^(]*\(at ([^)]*)\)', text):
+		for value in record.split()[:2]:
+			assert re.fullmatch(r'-?\d+\.\d{6}', value), record
+
+	# The grid keeps one line each way, and nothing of zero length
+
+	lines = np.array(re.findall(r'\(fp_line \(start (\S+) (\S+)\) \(end (\S+) (\S+)\)', text), dtype=float)
+	assert len(lines) == 2
+	assert ((lines[:,0]!=lines[:,2]) | (lines[:,1]!=lines[:,3])).all()
+
+	# Only the polygon with an area is written, without repeated vertices
+
+	polygons = re.findall(r'\(fp_poly \(pts (.*?)\) \(layer', text)
+	assert len(polygons) == 1
+	points = np.array(re.findall(r'\(xy (\S+) ([^)\s]+)\)', polygons[0]), dtype=float)
+	assert len(points) == 4 and (np.abs(np.diff(points, axis=0)).sum(axis=1) > 0).all()
+
@@ -0,0 +1,65 @@
+# test_clearance.py
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from starwhacker._clearance import findConflicts, resolveClearance, policies
+from starwhacker._starlayout import getStarLayout
+
+def getBruteConflicts(xs, ys, sizes, clearance):
+
+	distances = np.hypot(xs[:,None]-xs[None,:], ys[:,None]-ys[None,:])
+	close = distances < (sizes[:,None]+sizes[None,:])/2 + clearance - 1e-9
+	[firsts, seconds] = np.nonzero(np.triu(close, 1))
+
+	return set(zip(firsts.tolist(), seconds.tolist()))
+
+def makeStars(count, seed):
+
+	random = np.random.default_rng(seed)
+	mags = random.uniform(-1, 6, count)
+
+	return [random.uniform(0, 60, count), random.uniform(0, 60, count), np.round(4 - (mags+1)*3.2/7, 1), mags]
+
+def test_findConflicts_finds_the_same_pairs_as_brute_force():
+
+	[xs, ys, sizes, mags] = makeStars(400, 5)
+
+	for clearance in [0.0, 0.2, 1.5]:
+		[firsts, seconds] = findConflicts(xs, ys, sizes, clearance)
+		assert set(zip(firsts.tolist(), seconds.tolist())) == getBruteConflicts(xs, ys, sizes, clearance)
+
+@pytest.mark.parametrize('policy', policies)
+def test_no_conflicts_are_left_under_any_policy(policy):
+
+	[xs, ys, sizes, mags] = makeStars(400, 6)
+	sizeOf = lambda mags: np.round(4 - (mags+1)*3.2/7, 1)
+
+	[rows, newXs, newYs, newSizes, report] = resolveClearance(xs, ys, sizes, mags, 0.2, policy, sizeOf=sizeOf)
+
+	assert report['conflicts'] == len(getBruteConflicts(xs, ys, sizes, 0.2)) > 0
+	assert not getBruteConflicts(newXs, newYs, newSizes, 0.2)
+
+	# The stars kept are distinct and in the order given, and are only ever shrunk, never grown past the largest pad
+
+	assert (np.diff(rows) > 0).all()
+	assert (newSizes >= 0.8 - 1e-9).all() and (newSizes <= sizes.max() + 1e-9).all()
+	if policy != 'merge':
+		assert (newSizes <= sizes[rows] + 1e-9).all()
+	assert report['dropped'] + report['merged'] == len(xs) - len(rows)
+
+def test_getStarLayout_leaves_no_conflicts_and_keeps_names_with_their_stars():
+
+	[xs, ys, sizes, mags] = makeStars(300, 7)
+	names = np.array(['star{}'.format(row) for row in range(300)])
+	stars = SimpleNamespace(RA=xs, dec=ys, mag=mags, name=names)
+
+	[layXs, layYs, laySizes, layDrills, layNames] = getStarLayout(stars, lambda RAs: RAs, lambda decs: decs, 0.2, 'shrink')
+
+	assert laySizes.dtype.kind == layDrills.dtype.kind == 'i'
+	assert not getBruteConflicts(layXs, layYs, laySizes/10, 0.2)
+
+	rows = np.array([int(name[4:]) for name in layNames])
+	assert (layXs == xs[rows]).all() and (layYs == ys[rows]).all()
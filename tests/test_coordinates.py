@@ -0,0 +1,171 @@
+# test_coordinates.py
+
+import numpy as np
+
+from starwhacker._coordinates import polyline, multiPolyline, clipPolygonsRagged, simplifyRagged
+from starwhacker._arcs import fitArcs
+
+def getArea(ring):
+	'''
+	Returns the signed area of a closed ring (an Nx2 array), anticlockwise positive.
+	'''
+
+	return np.sum(ring[:-1,0]*ring[1:,1] - ring[1:,0]*ring[:-1,1])/2
+
+def getCoverage(coords, offsets, points):
+	'''
+	Returns which of points lie inside an odd number of the rings of a ragged buffer.
+	'''
+
+	covered = np.zeros(len(points), dtype=bool)
+	for start, stop in zip(offsets[:-1], offsets[1:]):
+		covered ^= polyline(coords[start:stop]).containsPoints(points[:,0], points[:,1])
+
+	return covered
+
+square = polyline([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+
+def test_clipped_polygon_keeps_its_area_inside_the_boundary():
+
+	# A square half over the boundary's right edge, running clockwise to check the winding doesn't matter
+
+	coords = np.array([[5, 2], [5, 8], [15, 8], [15, 2], [5, 2]], dtype=float)
+	[clipped, offsets] = clipPolygonsRagged(coords, np.array([0, 5]), square)
+
+	assert len(offsets) == 2
+	assert np.all(clipped[offsets[0]] == clipped[offsets[1]-1])
+	assert abs(abs(getArea(clipped)) - 30) < 1e-9
+	assert clipped[:,0].max() <= 10
+
+def test_polygons_wholly_inside_are_kept_and_wholly_outside_dropped():
+
+	coords = np.array([[1, 1], [2, 1], [2, 2], [1, 1], [20, 20], [21, 20], [21, 21], [20, 20]], dtype=float)
+	[clipped, offsets] = clipPolygonsRagged(coords, np.array([0, 4, 8]), square)
+
+	assert np.array_equal(offsets, [0, 4])
+	assert np.array_equal(clipped, coords[:4])
+
+def test_clipping_against_a_concave_boundary_matches_point_tests():
+
+	# An L shaped boundary, and a polygon which leaves through the notch and comes back
+
+	boundary = polyline([[0, 0], [10, 0], [10, 4], [4, 4], [4, 10], [0, 10], [0, 0]])
+	coords = np.array([[1, 1], [9, 1], [9, 9], [2, 9], [2, 7], [7, 7], [7, 3], [1, 3], [1, 1]], dtype=float)
+
+	[clipped, offsets] = clipPolygonsRagged(coords, np.array([0, len(coords)]), boundary)
+
+	rng = np.random.default_rng(1)
+	points = rng.uniform(0, 10, (5000, 2))
+	expected = getCoverage(coords, [0, len(coords)], points) & boundary.containsPoints(points[:,0], points[:,1])
+
+	assert np.array_equal(getCoverage(clipped, offsets, points), expected)
+
+def test_multiPolyline_clipPolygons_matches_point_tests():
+
+	rng = np.random.default_rng(2)
+	rings = []
+	for centre in rng.uniform(-5, 15, (40, 2)):
+		angles = np.sort(rng.uniform(0, 2*np.pi, 7))
+		ring = centre + np.column_stack((np.cos(angles), np.sin(angles)))*rng.uniform(1, 4, (7, 1))
+		rings.append(polyline(np.concatenate((ring, ring[:1]))))
+
+	polygons = multiPolyline(rings)
+	before = polygons.getCopy()
+	polygons.clipPolygons(square)
+
+	points = rng.uniform(0, 10, (5000, 2))
+	for start, stop in zip(polygons.offsets[:-1], polygons.offsets[1:]):
+		assert np.all(polygons.coords[start] == polygons.coords[stop-1])
+
+	# Together the clipped rings cover each point as many times as the originals did, inside the square
+
+	assert polygons.coords[:,0].min() >= 0 and polygons.coords[:,0].max() <= 10
+
+	def getCounts(rings):
+		return np.sum([getCoverage(rings.coords, rings.offsets[[n, n+1]], points) for n in range(len(rings.offsets)-1)], axis=0)
+
+	assert np.array_equal(getCounts(polygons), getCounts(before))
+
+def test_bridged_holes_survive_clipping():
+
+	from starwhacker._contours import makeEvenOddPolygons
+
+	# A square outline with a square hole, filled even-odd into one polygon with the hole bridged in, then cut through the hole.
+	# Holes may run either way round, so check what is covered rather than the signed area
+
+	outer = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+	boundary = polyline([[5, -5], [15, -5], [15, 15], [5, 15], [5, -5]])
+
+	rng = np.random.default_rng(3)
+	points = rng.uniform(0, 10, (5000, 2))
+	expected = (points[:,0] >= 5) & ~((3 < points[:,0]) & (points[:,0] < 7) & (3 < points[:,1]) & (points[:,1] < 7))
+
+	for hole in ([[3, 3], [7, 3], [7, 7], [3, 7], [3, 3]], [[3, 3], [3, 7], [7, 7], [7, 3], [3, 3]]):
+
+		[coords, offsets] = makeEvenOddPolygons(np.array(outer + hole, dtype=float), np.array([0, 5, 10]))
+		assert len(offsets) == 2
+
+		[clipped, offsets] = clipPolygonsRagged(coords, offsets, boundary)
+
+		assert len(offsets) == 2
+		assert np.array_equal(getCoverage(clipped, offsets, points), expected)
+
+def getDistancesToSegments(points, starts, ends):
+	'''
+	Returns how far each point lies from the nearest of the segments from starts to ends.
+	'''
+
+	along = ends - starts
+	lengths = np.maximum(np.sum(along**2, axis=1), 1e-300)
+	fractions = np.clip(np.sum((points[:,None,:]-starts[None,:,:])*along[None,:,:], axis=2)/lengths[None,:], 0, 1)
+	nearest = starts[None,:,:] + fractions[:,:,None]*along[None,:,:]
+
+	return np.min(np.hypot(*(points[:,None,:]-nearest).transpose(2, 0, 1)), axis=1)
+
+def test_simplified_lines_stay_within_tolerance_of_every_vertex():
+
+	random = np.random.default_rng(8)
+	lines = [np.cumsum(random.normal(0, 1, (length, 2)), axis=0) for length in [2, 3, 40, 200]]
+	offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines])))
+	coords = np.concatenate(lines)
+
+	[newCoords, newOffsets] = simplifyRagged(coords, offsets, 0.5)
+
+	assert newOffsets[-1] < offsets[-1]
+
+	for line, start, stop in zip(lines, newOffsets[:-1], newOffsets[1:]):
+		kept = newCoords[start:stop]
+		assert (kept[0] == line[0]).all() and (kept[-1] == line[-1]).all()
+		assert (getDistancesToSegments(line, kept[:-1], kept[1:]) <= 0.5 + 1e-9).all()
+
+def test_fitted_arcs_cover_every_member_within_tolerance():
+
+	# A half circle of radius 10 about (3, 4), a zigzag (whose every three vertices lie on some circle) and a two point line
+
+	angles = np.linspace(0, np.pi, 50)
+	lines = [np.column_stack((3 + 10*np.cos(angles), 4 + 10*np.sin(angles))), np.array([[0, 0], [1, 1], [2, 0], [3, 1], [4, 0]]), np.array([[0, 0], [5, 5]])]
+	offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines])))
+	coords = np.concatenate(lines).astype(float)
+
+	[starts, ends, centreXs, centreYs, angles] = fitArcs(coords[:,0], coords[:,1], offsets, 0.001)
+
+	# The half circle is one arc about its centre, the two point line one line
+
+	assert [starts[0], ends[0]] == [0, 49] and np.allclose([centreXs[0], centreYs[0]], [3, 4])
+	assert [starts[-1], ends[-1]] == [55, 56] and np.isnan(centreXs[-1])
+
+	# Within each member, the runs follow on from each other from its first vertex to its last
+
+	for first, last in zip(offsets[:-1], offsets[1:]-1):
+		inMember = (starts >= first) & (ends <= last)
+		assert starts[inMember][0] == first and ends[inMember][-1] == last
+		assert (starts[inMember][1:] == ends[inMember][:-1]).all()
+	assert len(starts) == len(np.unique(starts))
+
+	for start, end, centreX, centreY in zip(starts, ends, centreXs, centreYs):
+		points = coords[start:end+1]
+		if np.isnan(centreX):
+			assert (getDistancesToSegments(points, coords[start:start+1], coords[end:end+1]) <= 0.001).all()
+		else:
+			radii = np.hypot(points[:,0]-centreX, points[:,1]-centreY)
+			assert np.ptp(radii) <= 0.002
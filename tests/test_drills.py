@@ -0,0 +1,44 @@
+# test_drills.py
+
+import numpy as np
+
+from starwhacker._drills import makeGrid, planDrills
+
+def checkPlan(xs, ys, tools):
+
+	[order, before, after] = planDrills(xs, ys, tools)
+
+	assert sorted(order.tolist()) == list(range(len(xs)))
+	assert after <= before + 1e-9
+
+	# Every tool's holes are drilled together, smallest first
+
+	tools = np.asarray(tools)[order]
+	assert (np.diff(tools) >= 0).all()
+
+def test_makeGrid_stays_small_for_holes_in_a_line():
+
+	grid = makeGrid(np.array([10.0, 110.0]), np.array([50.0, 50.0]))
+	assert grid.columns*grid.rows <= 4
+
+	xs = np.linspace(0, 100, 1000)
+	grid = makeGrid(xs, np.full(1000, 50.0))
+	assert grid.columns*grid.rows <= 1000
+
+	checkPlan([10, 110], [50, 50], [1, 1])
+	checkPlan(xs, np.full(1000, 50.0), np.arange(1000)%3)
+
+def test_makeGrid_stays_small_for_repeated_holes():
+
+	grid = makeGrid(np.full(5, 3.0), np.full(5, 4.0))
+	assert grid.columns*grid.rows == 1
+
+	checkPlan([3, 3, 3, 20, 3], [4, 4, 4, 20, 4], [1, 1, 2, 2, 1])
+
+def test_planDrills_shortens_a_random_board():
+
+	random = np.random.default_rng(0)
+	xs = random.uniform(0, 200, 500)
+	ys = random.uniform(0, 200, 500)
+
+	checkPlan(xs, ys, random.integers(6, 13, 500)//2*2)
@@ -0,0 +1,137 @@
+# test_gerber.py
+
+import os
+import re
+
+import numpy as np
+
+from starwhacker._gerber import fabrication
+from starwhacker._starlayout import getStarLayout
+from starwhacker._stars import starTable
+from starwhacker._tools import getDrillTenths
+
+from test_board import makeSky, makeBoard, render
+
+def makeFabSky():
+	'''
+	Returns the board tests' sky (see makeSky), with a spread of star magnitudes so there are several pad and drill sizes.
+	'''
+
+	sky = makeSky()
+	mags = np.linspace(1, 5, 9)
+	names = ['Star{}'.format(n) if n%3==0 else '' for n in range(9)]
+	sky.objects['stars'] = starTable(list('abcdefghi'), names, np.linspace(-0.8, 0.8, 9), np.linspace(0.7, -0.7, 9), mags, [0]*9, ['']*9, ['Tst']*9)
+
+	return sky
+
+def renderFabrication(tmp_path, sky, **options):
+	'''
+	Renders sky as fabrication files into tmp_path, and returns {suffix: text} for each file, e.g. 'F_Cu' and 'drl'.
+	'''
+
+	fab = fabrication(sky, 200, targetConstellation='Tst', **options)
+	fab.storagePath = str(tmp_path)
+	fab.render()
+
+	[folder] = os.listdir(tmp_path)
+	files = {}
+	for name in os.listdir(os.path.join(tmp_path, folder)):
+		with open(os.path.join(tmp_path, folder, name)) as file:
+			files[re.match(r'Test[-.](.*?)(?:\.gbr)?$', name).group(1)] = file.read()
+
+	return files
+
+def test_gerbers_are_well_formed(tmp_path):
+
+	files = renderFabrication(tmp_path, makeFabSky())
+	gerbers = {suffix: text for suffix, text in files.items() if suffix != 'drl'}
+
+	assert sorted(gerbers) == ['B_Cu', 'B_Mask', 'B_SilkS', 'Edge_Cuts', 'F_Cu', 'F_Mask', 'F_SilkS']
+
+	for suffix, text in gerbers.items():
+
+		lines = text.splitlines()
+		assert '%FSLAX46Y46*%' in lines[:6] and '%MOMM*%' in lines[:6], suffix
+		assert lines[-1] == 'M02*'
+
+		# Every aperture selected is defined, before it is used
+
+		defined = {}
+		for number, line in enumerate(lines):
+			definition = re.fullmatch(r'%ADD(\d+)C,(\d+\.\d{6})\*%', line)
+			if definition:
+				defined[int(definition.group(1))] = number
+			selection = re.fullmatch(r'D(\d+)\*', line)
+			if selection:
+				code = int(selection.group(1))
+				assert code >= 10 and defined.get(code, number) < number, (suffix, line)
+
+		# Every region is closed, and ended by G37 before anything else starts
+
+		regions = re.findall(r'G36\*\n(.*?)G37\*\n', text, re.S)
+		assert len(regions) == text.count('G36*') == text.count('G37*')
+
+		for region in regions:
+			assert re.fullmatch(r'(X-?\d+Y-?\d+D0[12]\*\n)+', region), (suffix, region)
+			points = re.findall(r'X(-?\d+)Y(-?\d+)D0([12])\*', region)
+			assert len(points) >= 4 and points[0][2] == '2' and all(point[2] == '1' for point in points[1:])
+			assert points[0][:2] == points[-1][:2]
+
+	assert 'G36*' in gerbers['F_Cu']
+
+def test_drill_file_matches_the_laid_out_stars(tmp_path):
+
+	sky = makeFabSky()
+	text = renderFabrication(tmp_path, sky)['drl']
+
+	fab = fabrication(sky, 200)
+	[xs, ys, sizes, drills, names] = getStarLayout(sky.objects['stars'], fab.scaleX, fab.scaleY)
+	assert (drills == getDrillTenths(sizes)).all()
+
+	lines = text.splitlines()
+	assert lines[0] == 'M48' and 'METRIC' in lines and lines[-1] == 'M30'
+
+	# One tool per drill size, and every hole drilled with the tool for its star
+
+	tools = {int(tool): float(size) for tool, size in re.findall(r'^T(\d+)C(\d+\.\d{6})$', text, re.M)}
+	assert sorted(tools.values()) == sorted(set((drills[drills!=0]/10).tolist()))
+
+	holes = []
+	tool = None
+	for line in lines[lines.index('%'):]:
+		if re.fullmatch(r'T\d+', line):
+			tool = int(line[1:])
+		hole = re.fullmatch(r'X(-?\d+\.\d{6})Y(-?\d+\.\d{6})', line)
+		if hole:
+			holes.append([float(hole.group(1)), float(hole.group(2)), tools[tool]])
+
+	holes = np.array(sorted(holes))
+	expected = np.array(sorted(zip(xs[drills!=0].tolist(), ys[drills!=0].tolist(), (drills[drills!=0]/10).tolist())))
+	assert np.allclose(holes, expected, atol=1e-6)
+
+def test_gerbers_mirror_the_board_in_y(tmp_path, monkeypatch):
+
+	sky = makeFabSky()
+	[gerbers, boards] = [tmp_path/'gerbers', tmp_path/'board']
+	gerbers.mkdir()
+	boards.mkdir()
+
+	files = renderFabrication(gerbers, sky)
+	text = render(makeBoard(boards, monkeypatch, sky, fixedPoint=True))
+
+	# The board has y downwards and the Gerbers y upwards, about the same 200mm square 20mm in
+
+	pads = re.findall(r'\(pad \d+ \w+ circle \(at (\S+) (\S+)\) \(size (\S+)', text)
+	pads = sorted((round(float(x)*1000000), round((240-float(y))*1000000)) for x, y, size in pads)
+
+	flashes = sorted((int(x), int(y)) for x, y in re.findall(r'X(-?\d+)Y(-?\d+)D03\*', files['F_Cu']))
+
+	assert len(pads) == 9 and pads == flashes
+
+	# And so do the lines: the board's Edge.Cuts run along the same edges as the Gerber outline
+
+	edges = np.array(re.findall(r'\(gr_line \(start (\S+) (\S+)\) \(end (\S+) (\S+)\) \(angle 90\) \(layer Edge.Cuts\)', text), dtype=float)
+	outline = np.array(re.findall(r'X(-?\d+)Y(-?\d+)D0[12]\*', files['Edge_Cuts']), dtype=float)/1000000
+
+	assert sorted(map(tuple, np.round(np.column_stack((edges[:,0], 240-edges[:,1])), 6).tolist())) == \
+		sorted(map(tuple, np.round(outline[:-1], 6).tolist()))
@@ -0,0 +1,97 @@
+# test_projection.py
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from starwhacker._projection import projections, getProjection
+
+# How far from the centre each azimuthal projection puts a point c radians away, and back again
+
+radii = {
+	'stereographic': [lambda c: 2*np.tan(c/2), lambda rho: 2*np.arctan(rho/2)],
+	'gnomonic': [np.tan, np.arctan],
+	'orthographic': [np.sin, lambda rho: np.arcsin(np.clip(rho, -1, 1))],
+	'lambert': [lambda c: 2*np.sin(c/2), lambda rho: 2*np.arcsin(rho/2)],
+	'equidistant': [lambda c: c, lambda rho: rho],
+}
+
+names = list(radii) + ['transverse'+name.capitalize() for name in radii]
+
+def getAzimuthal(name):
+
+	return name[len('transverse'):].lower() if name.startswith('transverse') else name
+
+def getCentre(name, centroid):
+
+	return SimpleNamespace(RA=centroid.RA, dec=0.0) if name.startswith('transverse') else centroid
+
+def unproject(xs, ys, centre, R, fromRadius):
+	'''
+	Returns [RAs, decs] for points projected about centre by an azimuthal projection, whose radius rho maps back to angular distance fromRadius(rho).
+	'''
+
+	[lonC, latC] = [np.radians(centre.RA), np.radians(centre.dec)]
+	rho = np.hypot(xs, ys)/R
+	c = fromRadius(rho)
+	[sinC, cosC] = [np.sin(c), np.cos(c)]
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		lat = np.arcsin(np.clip(cosC*np.sin(latC) + np.where(rho>0, ys/R*sinC*np.cos(latC)/rho, 0), -1, 1))
+	lon = lonC + np.arctan2(xs/R*sinC, rho*np.cos(latC)*cosC - ys/R*np.sin(latC)*sinC)
+
+	return [np.degrees(lon), np.degrees(lat)]
+
+def test_every_projection_is_tested():
+
+	assert sorted(projections) == sorted(names)
+
+@pytest.mark.parametrize('name', names)
+def test_projection_puts_known_points_where_expected(name):
+
+	centroid = SimpleNamespace(RA=105.0, dec=-30.0)
+	centre = getCentre(name, centroid)
+	toRadius = radii[getAzimuthal(name)][0]
+	projection = getProjection(name)
+
+	# The centre lands on the origin, and points due north and east of it land on the axes, as far out as the projection says
+
+	c = np.radians(20.0)
+	[xs, ys] = projection(np.array([centre.RA, centre.RA]), np.array([centre.dec, centre.dec+20.0]), centroid, 50)
+	assert np.allclose([xs[0], ys[0]], 0, atol=1e-9)
+	assert np.allclose([xs[1], ys[1]], [0, 50*toRadius(c)])
+
+	[xs, ys] = projection(np.array([centre.RA+20.0]), np.array([0.0]), SimpleNamespace(RA=centroid.RA, dec=0.0), 50)
+	assert np.allclose([xs[0], ys[0]], [50*toRadius(c), 0])
+
+@pytest.mark.parametrize('name', names)
+def test_projection_round_trips(name):
+
+	centroid = SimpleNamespace(RA=250.0, dec=-28.0)
+	centre = getCentre(name, centroid)
+	random = np.random.default_rng(9)
+
+	# Points within 60 degrees of the centre, on the hemisphere every projection can show
+
+	c = np.radians(random.uniform(0, 60, 500))
+	bearing = random.uniform(0, 2*np.pi, 500)
+	[latC, lonC] = [np.radians(centre.dec), np.radians(centre.RA)]
+	lat = np.arcsin(np.sin(latC)*np.cos(c) + np.cos(latC)*np.sin(c)*np.cos(bearing))
+	lon = lonC + np.arctan2(np.sin(bearing)*np.sin(c)*np.cos(latC), np.cos(c)-np.sin(latC)*np.sin(lat))
+	[RAs, decs] = [np.degrees(lon), np.degrees(lat)]
+
+	[xs, ys] = getProjection(name)(RAs, decs, centroid, 100)
+	[backRAs, backDecs] = unproject(xs, ys, centre, 100, radii[getAzimuthal(name)][1])
+
+	assert np.allclose(backDecs, decs, atol=1e-7)
+	assert np.allclose((backRAs - RAs + 180) % 360 - 180, 0, atol=1e-7)
+
+	# The distance from the centre is the projection's own
+
+	assert np.allclose(np.hypot(xs, ys), 100*radii[getAzimuthal(name)][0](c))
+
+def test_unknown_projections_raise():
+
+	with pytest.raises(ValueError):
+		getProjection('mercator')
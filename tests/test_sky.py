@@ -0,0 +1,100 @@
+# test_sky.py
+
+import numpy as np
+import pytest
+
+from starwhacker._sky import sky
+from starwhacker._stars import starTable
+from starwhacker._coordinates import position, polyline, multiPolyline, toUnitVectors
+from starwhacker._constellation import constellation
+
+def makeSky():
+	'''
+	Returns a small sky of a few stars, a dense grid line and a boundary, ready to project.
+	'''
+
+	decs = np.linspace(-40, -20, 50)
+	grid = multiPolyline([polyline(np.column_stack((np.full(50, 100.0), decs))), polyline([[90, -30], [110, -30]])])
+
+	s = sky({
+		'stars':starTable(['a', 'b'], ['', ''], [95, 105], [-35, -25], [1, 2], [0, 0], ['', ''], ['Sco', 'Sco']),
+		'constellations':[],
+		'grid':grid,
+		'boundary':polyline([[85, -45], [125, -45], [125, -15], [85, -15], [85, -45]])})
+	s.centroid = position(105, -30)
+
+	return s
+
+def test_project_twice_reuses_the_unprojected_buffer():
+
+	s = makeSky().project('stereographic')
+	first = s.objects['grid'].coords.copy()
+
+	s.project('equidistant').project('stereographic')
+
+	assert np.allclose(s.objects['grid'].coords, first)
+
+def test_project_after_simplify_never_scatters_stale_buffers():
+
+	s = makeSky().project('stereographic').normalise().simplify(0.05)
+	grid = s.objects['grid']
+
+	assert grid.offsets[-1] == len(grid.coords)
+
+	with pytest.raises(ValueError):
+		s.project('stereographic')
+
+	assert grid.offsets[-1] == len(grid.coords)
+
+def test_project_checks_vertex_counts_not_just_identities():
+
+	s = makeSky().project('stereographic')
+	s.objects['grid'].interpolate(10)
+
+	with pytest.raises(ValueError):
+		s.project('stereographic')
+
+def test_refiltering_forgets_the_earlier_projection():
+
+	s = makeSky()
+	s.objects['galaxy'] = multiPolyline([polyline([[100, -30], [101, -31]])])
+	s.objects['galaxy'].mode = 'blobs'
+
+	s.project('stereographic').filterAndInterpolate('scorpio', 1.0)
+
+	assert s.projection is None and s.unprojected is None
+
+def test_refined_constellation_lines_stay_inside_the_boundary():
+
+	# A line from dec -43 to dec -43, whose great circle bows south of the boundary's dec -45 edge between the RA edges,
+	# a line wholly inside, and one far away whose arc never comes near
+
+	s = makeSky()
+	s.objects['galaxy'] = multiPolyline([polyline([[100, -30], [101, -31]])])
+	s.objects['galaxy'].mode = 'blobs'
+	s.objects['constellations'] = [constellation('Sco', [polyline([[80, -43], [130, -43]]), polyline([[95, -35], [115, -20]])]),
+		constellation('UMa', [polyline([[165, 55], [200, 50]])])]
+
+	s.filterAndInterpolate('scorpio', tolerance=0.02)
+
+	assert [con.name for con in s.objects['constellations']] == ['Sco']
+
+	coords = s.objects['constellations'][0].coords
+	assert (coords[:,0] >= 85-1e-9).all() and (coords[:,0] <= 125+1e-9).all()
+	assert (coords[:,1] >= -45-1e-9).all() and (coords[:,1] <= -15+1e-9).all()
+
+	# The first line dips out of the boundary in the middle, so it is cut into two pieces where its great circle crosses the dec -45 edge,
+	# and the vertices of every piece lie on its own line's great circle (the cut ends close to it, on the chords between them)
+
+	con = s.objects['constellations'][0]
+	normals = [np.cross(*toUnitVectors(np.array(ends, dtype=float))) for ends in ([[80, -43], [130, -43]], [[95, -35], [115, -20]])]
+	normals = [normal/np.linalg.norm(normal) for normal in normals]
+
+	assert len(con.offsets) == 4
+	for start, stop in zip(con.offsets[:-1], con.offsets[1:]):
+		vectors = toUnitVectors(coords[start:stop])
+		normal = min(normals, key=lambda normal: np.abs(vectors@normal).max())
+		assert np.abs(vectors[1:-1]@normal).max() < 1e-9
+		assert np.abs(vectors[[0, -1]]@normal).max() < 1e-3
+
+	assert np.isclose(coords[:,1].min(), -45)
@@ -0,0 +1,37 @@
+# test_skyimage.py
+
+import numpy as np
+from PIL import Image
+
+from starwhacker import _skyimage
+from starwhacker._skyimage import skyImage, tileCache
+
+def test_tileCache_drops_the_least_recently_used():
+
+	cache = tileCache(1000)
+	for key in range(3):
+		cache.keep(key, np.zeros(400, dtype=np.uint8))
+
+	assert list(cache.tiles) == [1, 2]
+
+	cache.get(1)
+	cache.keep(3, np.zeros(400, dtype=np.uint8))
+
+	assert list(cache.tiles) == [1, 3]
+	assert cache.bytes == 800
+
+def test_decode_without_a_writable_cache(tmp_path, monkeypatch):
+
+	pixels = np.random.default_rng(0).integers(0, 255, (40, 80, 3), dtype=np.uint8)
+	Image.fromarray(pixels).save(tmp_path/'sky.png')
+
+	# A cache root under a file can never be made
+
+	(tmp_path/'file').write_text('')
+	monkeypatch.setattr(_skyimage, 'imageCacheRoot', str(tmp_path/'file'/'images'))
+	monkeypatch.setattr(_skyimage, 'loadedTiles', tileCache(1 << 20))
+
+	image = skyImage(str(tmp_path/'sky.png'), 80, 40, tileSize=16)
+	image.tilePath = str(tmp_path/'file'/'images'/'sky')
+
+	assert np.array_equal(image.getRegion(0, 0, 80, 40), pixels)
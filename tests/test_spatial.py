@@ -0,0 +1,83 @@
+# test_spatial.py
+
+import numpy as np
+
+from starwhacker._coordinates import polyline, multiPolyline
+from starwhacker._spatial import pointGrid, boxTree, skyIndex
+
+square = polyline([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+
+def test_empty_members_leave_their_siblings_containment_alone():
+
+	lines = multiPolyline([polyline([[5, 5], [6, 6]]), polyline(np.zeros((0, 2)))])
+
+	assert list(lines.getContainment(square)) == [True, True]
+	assert lines.getExtents() == [[5, 6], [5, 6]]
+
+# A closed boundary with concave corners, so containment has to be worked out rather than read off the extents
+
+points = [[np.cos(angle)*radius, np.sin(angle)*radius] for angle, radius in zip(np.linspace(0, 2*np.pi, 10, endpoint=False), [10, 4]*5)]
+star = polyline(points + points[:1])
+
+def getBrutePairs(xs, ys, distance):
+
+	distances = np.hypot(xs[:,None]-xs[None,:], ys[:,None]-ys[None,:])
+	[firsts, seconds] = np.nonzero(np.triu(distances <= distance, 1))
+
+	return set(zip(firsts.tolist(), seconds.tolist()))
+
+def test_pointGrid_finds_the_same_pairs_as_brute_force():
+
+	random = np.random.default_rng(1)
+	xs = random.uniform(0, 50, 400)
+	ys = random.uniform(0, 20, 400)
+
+	# Repeated points, which are no distance apart
+
+	[xs[10:13], ys[10:13]] = [xs[9], ys[9]]
+
+	for [cellSize, distance] in [[2.0, 2.0], [0.5, 3.0], [10.0, 1.0]]:
+
+		[firsts, seconds, distances] = pointGrid(xs, ys, cellSize).getPairs(distance)
+
+		assert (firsts < seconds).all()
+		assert set(zip(firsts.tolist(), seconds.tolist())) == getBrutePairs(xs, ys, distance)
+		assert np.allclose(distances, np.hypot(xs[firsts]-xs[seconds], ys[firsts]-ys[seconds]))
+
+def test_containment_matches_testing_every_vertex():
+
+	random = np.random.default_rng(2)
+	starts = random.uniform(-12, 12, (300, 2))
+	lines = multiPolyline([polyline(start + np.cumsum(random.normal(0, 0.5, (random.integers(1, 8), 2)), axis=0)) for start in starts])
+
+	expected = star.containsPoints(lines.coords[:,0], lines.coords[:,1])
+
+	assert expected.any() and not expected.all()
+	assert (lines.getContainment(star) == expected).all()
+
+def test_boxTree_settles_boxes_only_when_they_are_wholly_in_or_out():
+
+	random = np.random.default_rng(3)
+	minimums = random.uniform(-12, 12, (500, 2))
+	sizes = random.uniform(0, 3, (500, 2))
+	boxes = np.column_stack((minimums[:,0], minimums[:,0]+sizes[:,0], minimums[:,1], minimums[:,1]+sizes[:,1]))
+
+	[inside, crossing] = boxTree(boxes, leafSize=2).query(star)
+
+	# Sample each box densely: every sample of a box inside lies inside, and no sample of a box settled as outside does
+
+	[across, up] = [steps.ravel() for steps in np.meshgrid(np.linspace(0, 1, 9), np.linspace(0, 1, 9))]
+	sampleXs = boxes[:,0,None] + (boxes[:,1]-boxes[:,0])[:,None]*across
+	sampleYs = boxes[:,2,None] + (boxes[:,3]-boxes[:,2])[:,None]*up
+	within = star.containsPoints(sampleXs.ravel(), sampleYs.ravel()).reshape(len(boxes), -1)
+
+	assert inside.any() and (~inside & ~crossing).any()
+	assert within[inside].all()
+	assert not within[~inside & ~crossing].any()
+
+def test_skyIndex_finds_the_same_points_as_brute_force():
+
+	random = np.random.default_rng(4)
+	[RAs, decs] = [random.uniform(-12, 12, 3000), random.uniform(-12, 12, 3000)]
+
+	assert (skyIndex(RAs, decs, 8).query(star) == np.flatnonzero(star.containsPoints(RAs, decs))).all()
@@ -0,0 +1,93 @@
+# test_tools.py
+
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+
+from starwhacker._tools import writeAtomically, getStarSize, getStarSizeTenths, getDrillSize, toNanometres, formatNanometres
+
+def test_writeAtomically_replaces_a_directory_whole(tmp_path):
+
+	path = str(tmp_path/'cache'/'stars')
+
+	def write(contents):
+		def writer(tempPath):
+			with open(os.path.join(tempPath, 'column'), 'w') as file:
+				file.write(contents)
+		return writer
+
+	assert writeAtomically(path, write('old'), directory=True)
+	assert writeAtomically(path, write('new'), directory=True)
+
+	with open(os.path.join(path, 'column')) as file:
+		assert file.read() == 'new'
+	assert os.listdir(tmp_path/'cache') == ['stars']
+
+def test_writeAtomically_removes_an_old_directory_only_once_the_new_one_is_in_place(tmp_path, monkeypatch):
+
+	path = str(tmp_path/'stars')
+	os.mkdir(path)
+	(tmp_path/'stars'/'column').write_text('old')
+
+	def write(tempPath):
+		with open(os.path.join(tempPath, 'column'), 'w') as file:
+			file.write('new')
+
+	# Whenever a directory is removed, path holds either nothing or the whole new copy, never a part-deleted old one
+
+	removed = []
+	rmtree = shutil.rmtree
+	def checkedRmtree(target, **options):
+		assert os.path.realpath(target) != os.path.realpath(path)
+		assert (tmp_path/'stars'/'column').read_text() == 'new'
+		removed.append(target)
+		rmtree(target, **options)
+
+	monkeypatch.setattr(shutil, 'rmtree', checkedRmtree)
+
+	assert writeAtomically(path, write, directory=True)
+	assert len(removed) == 1 and os.listdir(tmp_path) == ['stars']
+
+def test_writeAtomically_leaves_nothing_behind_on_failure(tmp_path):
+
+	def fail(tempPath):
+		raise OSError('disk full')
+
+	assert not writeAtomically(str(tmp_path/'cache.npz'), fail, suffix='.npz')
+	assert os.listdir(tmp_path) == []
+
+	# Nowhere to write at all
+
+	(tmp_path/'file').write_text('')
+	assert not writeAtomically(str(tmp_path/'file'/'cache.npz'), fail)
+
+def test_star_sizes_agree_in_every_mode():
+
+	# Rings of 1.4 to 2.4mm, including the 1.8 and 2.0 which float arithmetic used to give smaller drills
+
+	mags = np.arange(14, 25)/10
+	[rings, drills] = getStarSizeTenths(mags, lambda mag: mag)
+
+	assert rings.tolist() == list(range(14, 25))
+	assert drills.tolist() == [6, 6, 8, 8, 10, 10, 12, 12, 12, 12, 12]
+
+	for mag, ring, drill in zip(mags, rings.tolist(), drills.tolist()):
+		assert getStarSize(SimpleNamespace(mag=mag), lambda mag: mag) == [ring/10, drill/10]
+		assert getDrillSize(ring/10) == drill/10
+
+	assert getDrillSize(1.3) == 0
+
+def test_nanometres_round_and_format_exactly():
+
+	assert toNanometres([-0.5, 0.1+0.2, 123.4567891, -0.0000004, 0.0000006]).tolist() == [-500000, 300000, 123456789, 0, 1]
+
+	assert formatNanometres([-500000, -1, 0, 1, 999999, 1000000, -1000000, -123456789]) == \
+		['-0.500000', '-0.000001', '0.000000', '0.000001', '0.999999', '1.000000', '-1.000000', '-123.456789']
+
+	# Formatting whole nanometres gives the same digits as formatting the millimetres they stand for
+
+	nanometres = np.random.default_rng(10).integers(-300000000, 300000000, 1000)
+	assert formatNanometres(nanometres) == ['{:.6f}'.format(value/1000000) for value in nanometres.tolist()]
+